@@ -1,6 +1,12 @@
+import os
 from flask import Flask, render_template
 from config import Config
 from extensions import db, migrate, jwt, api
+from comandos import registrar_comandos
+from utils.diario_fichajes import registrar_diario
+from utils.consultas import registrar_consultas
+from utils.claves import registrar_claves
+from utils.tareas import arrancar_tareas
 
 # 1. Imports de la API (Para la App Móvil - JSON)
 from resources.auth import blp as AuthBlueprint
@@ -38,6 +44,18 @@ def create_app():
     app.register_blueprint(empresa_bp)
     app.register_blueprint(rrhh_bp)
 
+    # --- Comandos CLI (flask <comando>) ---
+    registrar_comandos(app)
+
+    # --- Diario de fichajes (solo si DIARIO_FICHAJES_DIR está configurado) ---
+    registrar_diario(app)
+
+    # --- Medición de consultas por petición (X-Consultas; CONSULTAS_MEDIR, debug o testing) ---
+    registrar_consultas(app)
+
+    # --- Pool de contraseñas (cabecera X-Claves-Cola con la cola al hashear o verificar) ---
+    registrar_claves(app)
+
     # --- Ruta Principal (Landing Page) ---
     @app.route("/")
     def index():
@@ -48,4 +66,8 @@ def create_app():
 app = create_app()
 
 if __name__ == "__main__":
+    # Bucle de tareas en este servidor (TAREAS_EN_PROCESO); con el recargador de debug, solo en el
+    # proceso hijo que sirve las peticiones
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        arrancar_tareas(app)
     app.run(debug=True, port=5002, host="0.0.0.0")
\ No newline at end of file
@@ -0,0 +1,286 @@
+"""
+Comandos de mantenimiento (flask <comando>).
+
+Se registran en create_app() y se ejecutan con: FLASK_APP=app.py flask <comando>
+"""
+
+import multiprocessing
+import sys
+from datetime import date, datetime, timedelta
+
+import click
+from sqlalchemy import func, or_
+
+from extensions import db
+from models import Trabajador, Fichaje, Incidencia, JornadaDiaria, Turno
+from utils.jornada_diaria import verificar_jornadas
+from utils.saldos import asegurar_serie, verificar_serie
+from utils.tareas import proceso_worker, ESPERA_SEGUNDOS
+from utils.turnos import reconstruir_turnos_trabajador
+
+
+# ---------------------------------------------------------------------
+# ÍNDICES: comprobación con EXPLAIN
+# ---------------------------------------------------------------------
+
+def _consultas_calientes():
+    """
+    Consultas del camino caliente que deben resolverse por índice.
+    Se construyen igual que en los endpoints (mismos filtros), con parámetros de ejemplo.
+    """
+    from routes.rrhh_routes import query_fichajes_empresa
+    from utils.ausencias import query_ausentes
+    from utils.envios import query_envios_listos
+    from utils.listado_fichajes import query_jornadas_empresa
+
+    hoy = date.today()
+    inicio = datetime(hoy.year, hoy.month, 1)
+    fin = inicio + timedelta(days=31)
+
+    return {
+        "fichajes_trabajador_rango": Fichaje.query.filter(
+            Fichaje.id_trabajador == 1,
+            Fichaje.fecha_hora >= inicio,
+            Fichaje.fecha_hora < fin
+        ).order_by(Fichaje.fecha_hora.asc()),
+        "fichajes_list_empresa": query_fichajes_empresa(1, desde=hoy, hasta=hoy).order_by(Fichaje.fecha_hora.asc()),
+        "fichajes_list_empleado": query_fichajes_empresa(1, empleado_id=1, desde=hoy, hasta=hoy),
+        "jornadas_list_empresa": query_jornadas_empresa(1).order_by(Turno.fecha_ref.desc(), Turno.id_turno.desc()),
+        "jornadas_sin_cierre": query_jornadas_empresa(1, estado="sin_cierre"),
+        "entrada_hoy": Fichaje.query.filter(
+            Fichaje.id_trabajador == 1,
+            Fichaje.tipo == "ENTRADA",
+            Fichaje.fecha_hora >= inicio,
+            Fichaje.fecha_hora < fin
+        ),
+        "incidencias_aprobadas": Incidencia.query.filter(
+            Incidencia.id_trabajador == 1,
+            Incidencia.estado == "APROBADA",
+            Incidencia.fecha_inicio < fin.date(),
+            Incidencia.fecha_fin >= inicio.date()
+        ),
+        "trabajadores_empresa": Trabajador.query.filter_by(idEmpresa=1),
+        "jornadas_rango": JornadaDiaria.query.filter(
+            JornadaDiaria.id_trabajador == 1,
+            JornadaDiaria.fecha >= inicio.date(),
+            JornadaDiaria.fecha < fin.date()
+        ),
+        "ausentes_hoy": query_ausentes(1, hoy, [1]),
+        "envios_listos": query_envios_listos(datetime.now()),
+        "kiosko_uid": Trabajador.query.filter(
+            Trabajador.idEmpresa == 1,
+            or_(Trabajador.nfc_canonico == "A1B2C3D4", Trabajador.nfc_invertido == "A1B2C3D4")
+        ),
+    }
+
+
+def _explain(conn, query):
+    """
+    Ejecuta EXPLAIN y devuelve la lista de accesos por tabla sin índice.
+    - MySQL: filas con type == 'ALL'.
+    - SQLite: pasos 'SCAN <tabla>' que no usan índice.
+    Devuelve None si el dialecto no está soportado.
+    """
+    dialect = conn.dialect
+    # render_postcompile: los IN (...) se despliegan con un parámetro por valor
+    compiled = query.statement.compile(dialect=dialect, compile_kwargs={"render_postcompile": True})
+    params = compiled.params
+    if compiled.positional:
+        params = tuple(params[k] for k in compiled.positiontup)
+
+    if dialect.name == "mysql":
+        result = conn.exec_driver_sql("EXPLAIN " + str(compiled), params)
+        filas = [dict(r._mapping) for r in result]
+        return [f"{f.get('table')} (type=ALL)" for f in filas if (f.get("type") or "").upper() == "ALL"]
+
+    if dialect.name == "sqlite":
+        result = conn.exec_driver_sql("EXPLAIN QUERY PLAN " + str(compiled), params)
+        escaneos = []
+        for fila in result:
+            detalle = fila[-1]
+            if detalle.startswith("SCAN") and "USING" not in detalle:
+                escaneos.append(detalle)
+        return escaneos
+
+    return None
+
+
+def comprobar_indices():
+    """
+    Lanza EXPLAIN sobre las consultas calientes.
+    Devuelve dict nombre -> lista de escaneos completos (vacía si usa índices).
+    """
+    resultados = {}
+    with db.engine.connect() as conn:
+        for nombre, query in _consultas_calientes().items():
+            resultados[nombre] = _explain(conn, query)
+    return resultados
+
+
+# ---------------------------------------------------------------------
+# JORNADA DIARIA: relleno y comprobación de desviaciones
+# ---------------------------------------------------------------------
+
+def reconstruir_jornadas(desde=None, hasta=None, empresa_id=None, reparar=True):
+    """
+    Recorre trabajador a trabajador el rango [desde, hasta] comparando jornada_diaria con los fichajes.
+    - Sin fechas: desde el primer fichaje (o jornada) hasta hoy.
+    - reparar=True corrige y hace commit por trabajador.
+    Devuelve dict id_trabajador -> lista de desviaciones (fecha, guardado, esperado).
+    """
+    if desde is None:
+        primeros = [
+            db.session.query(func.min(Fichaje.fecha_hora)).scalar(),
+            db.session.query(func.min(JornadaDiaria.fecha)).scalar(),
+        ]
+        primeros = [p.date() if isinstance(p, datetime) else p for p in primeros if p]
+        desde = min(primeros) if primeros else date.today()
+    hasta = hasta or date.today()
+
+    query = db.session.query(Trabajador.id_trabajador)
+    if empresa_id:
+        query = query.filter(Trabajador.idEmpresa == empresa_id)
+
+    resultados = {}
+    for (trabajador_id,) in query.order_by(Trabajador.id_trabajador).all():
+        desviaciones = verificar_jornadas(trabajador_id, desde, hasta + timedelta(days=1), reparar=reparar)
+        if desviaciones:
+            resultados[trabajador_id] = desviaciones
+        if reparar:
+            db.session.commit()
+        db.session.expunge_all()
+    return resultados
+
+
+def reconstruir_saldos(empresa_id=None, reparar=True, hoy=None):
+    """
+    Compara la serie saldo_mensual de cada trabajador con la recalculada (jornada_diaria + horario
+    + ausencias). reparar=True la corrige, la crea o alarga hasta el mes de `hoy` y hace commit por
+    trabajador. Devuelve dict id_trabajador -> lista de meses desviados.
+    """
+    query = Trabajador.query
+    if empresa_id:
+        query = query.filter(Trabajador.idEmpresa == empresa_id)
+    mes_actual = (hoy or date.today()).replace(day=1)
+
+    resultados = {}
+    for trabajador_id in [t.id_trabajador for t in query.order_by(Trabajador.id_trabajador).all()]:
+        trabajador = Trabajador.query.get(trabajador_id)
+        desviados = verificar_serie(trabajador, reparar=reparar)
+        if desviados:
+            resultados[trabajador_id] = desviados
+        if reparar:
+            asegurar_serie(trabajador, mes_actual)
+            db.session.commit()
+        db.session.expunge_all()
+    return resultados
+
+
+def reconstruir_turnos(empresa_id=None):
+    """Rehace los turnos de cada trabajador desde sus fichajes, con commit por trabajador. Devuelve el total."""
+    query = db.session.query(Trabajador.id_trabajador)
+    if empresa_id:
+        query = query.filter(Trabajador.idEmpresa == empresa_id)
+
+    total = 0
+    for (trabajador_id,) in query.order_by(Trabajador.id_trabajador).all():
+        total += reconstruir_turnos_trabajador(trabajador_id)
+        db.session.commit()
+        db.session.expunge_all()
+    return total
+
+
+# ---------------------------------------------------------------------
+# REGISTRO
+# ---------------------------------------------------------------------
+
+def registrar_comandos(app):
+    @app.cli.command("comprobar-indices")
+    def comprobar_indices_cmd():
+        """Falla (exit 1) si alguna consulta caliente vuelve a un escaneo completo de tabla."""
+        fallos = 0
+        for nombre, escaneos in comprobar_indices().items():
+            if escaneos is None:
+                click.echo(f"[SKIP] {nombre}: dialecto {db.engine.dialect.name} no soportado")
+            elif escaneos:
+                fallos += 1
+                click.echo(f"[FALLO] {nombre}: escaneo completo -> {', '.join(escaneos)}")
+            else:
+                click.echo(f"[OK] {nombre}")
+
+        if fallos:
+            sys.exit(1)
+
+    @app.cli.command("reconstruir-jornadas")
+    @click.option("--desde", type=click.DateTime(formats=["%Y-%m-%d"]), default=None, help="Primer día (YYYY-MM-DD).")
+    @click.option("--hasta", type=click.DateTime(formats=["%Y-%m-%d"]), default=None, help="Último día (YYYY-MM-DD).")
+    @click.option("--empresa", "empresa_id", type=int, default=None, help="Solo los trabajadores de esta empresa.")
+    @click.option("--verificar", is_flag=True, help="Solo comprobar: no corrige y falla (exit 1) si hay desviaciones.")
+    def reconstruir_jornadas_cmd(desde, hasta, empresa_id, verificar):
+        """Rellena jornada_diaria desde los fichajes o comprueba que no se ha desviado."""
+        resultados = reconstruir_jornadas(
+            desde.date() if desde else None,
+            hasta.date() if hasta else None,
+            empresa_id,
+            reparar=not verificar
+        )
+
+        for trabajador_id, desviaciones in resultados.items():
+            for fecha, guardado, esperado in desviaciones:
+                click.echo(f"[{'DESVIACION' if verificar else 'CORREGIDO'}] trabajador {trabajador_id} {fecha}: {guardado} -> {esperado}")
+
+        total = sum(len(d) for d in resultados.values())
+        if verificar:
+            click.echo(f"{total} jornadas desviadas en {len(resultados)} trabajadores.")
+            if total:
+                sys.exit(1)
+        else:
+            click.echo(f"{total} jornadas corregidas en {len(resultados)} trabajadores.")
+
+    @app.cli.command("reconstruir-saldos")
+    @click.option("--empresa", "empresa_id", type=int, default=None, help="Solo los trabajadores de esta empresa.")
+    @click.option("--verificar", is_flag=True, help="Solo comprobar: no corrige y falla (exit 1) si hay desviaciones.")
+    def reconstruir_saldos_cmd(empresa_id, verificar):
+        """Comprueba (o corrige y alarga hasta el mes en curso) las sumas prefijas mensuales de saldo_mensual."""
+        resultados = reconstruir_saldos(empresa_id, reparar=not verificar)
+
+        for trabajador_id, meses in resultados.items():
+            click.echo(
+                f"[{'DESVIACION' if verificar else 'CORREGIDO'}] trabajador {trabajador_id}: "
+                + ", ".join(m.strftime("%m/%Y") for m in meses)
+            )
+
+        total = sum(len(m) for m in resultados.values())
+        if verificar:
+            click.echo(f"{total} meses desviados en {len(resultados)} trabajadores.")
+            if total:
+                sys.exit(1)
+        else:
+            click.echo(f"{total} meses corregidos en {len(resultados)} trabajadores.")
+
+    @app.cli.command("reconstruir-turnos")
+    @click.option("--empresa", "empresa_id", type=int, default=None, help="Solo los trabajadores de esta empresa.")
+    def reconstruir_turnos_cmd(empresa_id):
+        """Rellena la tabla turno (jornadas con estado) desde los fichajes."""
+        click.echo(f"{reconstruir_turnos(empresa_id)} turnos reconstruidos.")
+
+    @app.cli.command("tareas-worker")
+    @click.option("--procesos", type=int, default=2, show_default=True, help="Procesos del pool.")
+    @click.option("--espera", type=float, default=ESPERA_SEGUNDOS, show_default=True, help="Segundos entre sondeos de la cola.")
+    def tareas_worker_cmd(procesos, espera):
+        """Pool de procesos que ejecuta las tareas en segundo plano (cola en la tabla tarea)."""
+        contexto = multiprocessing.get_context("spawn")
+        pool = [
+            contexto.Process(target=proceso_worker, args=(espera,), name=f"tareas-{i + 1}", daemon=True)
+            for i in range(max(1, procesos))
+        ]
+        for proceso in pool:
+            proceso.start()
+        click.echo(f"{len(pool)} workers de tareas en marcha (Ctrl+C para parar).")
+
+        try:
+            for proceso in pool:
+                proceso.join()
+        except KeyboardInterrupt:
+            for proceso in pool:
+                proceso.terminate()
@@ -12,6 +12,30 @@ class Config:
     SQLALCHEMY_ENGINE_OPTIONS = {'pool_recycle': 280}
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Antirrebote e idempotencia de fichajes compartidos entre workers (opcional; sin él, memoria del proceso)
+    ANTIRREBOTE_REDIS_URL = os.environ.get("ANTIRREBOTE_REDIS_URL")
+
+    # Diario local de fichajes (write-behind): directorio del diario; sin él, se escribe directo en la BD.
+    # Con varios procesos web necesita ANTIRREBOTE_REDIS_URL (sin él, solo arranca en un proceso)
+    DIARIO_FICHAJES_DIR = os.environ.get("DIARIO_FICHAJES_DIR")
+    DIARIO_FICHAJES_INTERVALO = 1.0
+
+    # Tareas en segundo plano (tabla tarea): hilo en cada proceso del servidor web (python app.py o
+    # gunicorn con gunicorn.conf.py); con "0" solo las ejecuta el pool externo `flask tareas-worker`
+    TAREAS_EN_PROCESO = os.environ.get("TAREAS_EN_PROCESO", "1") != "0"
+    TAREAS_ESPERA = 2.0
+
+    # Medición de consultas SQL por petición (cabecera X-Consultas y avisos de N+1 en el log);
+    # siempre activa en debug y testing
+    CONSULTAS_MEDIR = os.environ.get("CONSULTAS_MEDIR") == "1"
+
+    # Contraseñas (utils.claves): método de werkzeug para los hashes nuevos (los antiguos se rehacen
+    # al entrar) y pool de hilos que los calcula; lleno el pool, se espera CLAVES_ESPERA s y luego 503
+    CLAVES_METODO = os.environ.get("CLAVES_METODO", "scrypt:32768:8:1")
+    CLAVES_HILOS = int(os.environ.get("CLAVES_HILOS", os.cpu_count() or 2))
+    CLAVES_COLA = int(os.environ.get("CLAVES_COLA", 64))
+    CLAVES_ESPERA = 2.0
+
     API_TITLE = "API de Control de Presencia"
     API_VERSION = "v1"
     OPENAPI_VERSION = "3.0.2"
@@ -4,8 +4,10 @@ from zoneinfo import ZoneInfo
 from sqlalchemy import func
 
 from app import create_app
-from models import Trabajador, Dia, Franja, Fichaje, Incidencia
+from models import Trabajador, Fichaje, Incidencia
+from utils.estado_trabajador import estado_actual
 from utils.firebase_sender import enviar_notificacion_push
+from utils.horarios import semanas_horarios
 
 TZ = ZoneInfo("Europe/Madrid")
 MARGEN_MINUTOS = 15
@@ -62,17 +64,6 @@ def _tiene_entrada_hoy(trabajador_id: int, inicio_dia, fin_dia):
     )
 
 
-def _ultimo_fichaje_absoluto(trabajador_id):
-    # Último fichaje histórico (para detectar “zombies” de días anteriores).
-    return (
-        Fichaje.query.filter(
-            Fichaje.id_trabajador == trabajador_id
-        )
-        .order_by(Fichaje.fecha_hora.desc())
-        .first()
-    )
-
-
 def _dentro_ventana(now_local, limite, nombre_check=""):
     # Ventana [limite, limite + VENTANA_ENVIO_MINUTOS).
     limite_fin = limite + timedelta(minutes=VENTANA_ENVIO_MINUTOS)
@@ -92,6 +83,8 @@ def _dentro_ventana(now_local, limite, nombre_check=""):
 
 def comprobar_fichajes_entrada_salida():
     app = create_app()
+    # Script de una pasada: sin bucle de tareas (lo que encole lo envía el servidor o el pool)
+    app.config["TAREAS_EN_PROCESO"] = False
     with app.app_context():
         _log("\n=============================================")
         _log("   CRON: CONTROL DE PRESENCIA (ABSOLUTO)   ")
@@ -104,12 +97,9 @@ def comprobar_fichajes_entrada_salida():
         nombre_dia = DIAS_SEMANA[hoy.weekday()]
         _log(f"Fecha sistema (Madrid): {now_local} ({nombre_dia})")
 
-        dia_db = Dia.query.filter_by(nombre=nombre_dia).first()
-        if not dia_db:
-            _log("ERROR: El día actual no existe en la tabla 'Dia' de la BD.")
-            return
-
         trabajadores = Trabajador.query.all()
+        # Horarios de toda la plantilla compilados de una vez
+        semanas = semanas_horarios({t.idHorario for t in trabajadores if t.idHorario})
         enviados = 0
 
         for t in trabajadores:
@@ -123,12 +113,12 @@ def comprobar_fichajes_entrada_salida():
                 _log("   -> Ausencia aprobada. Skip.")
                 continue
 
-            #Zombie: última acción es ENTRADA y es de antes de hoy
-            ultimo = _ultimo_fichaje_absoluto(t.id_trabajador)
-            if ultimo and (ultimo.tipo or "").strip().upper() == "ENTRADA":
-                if ultimo.fecha_hora.date() < hoy:
+            #Zombie: última acción es ENTRADA y es de antes de hoy (estado_trabajador por PK)
+            estado = estado_actual(t.id_trabajador)
+            if estado.ultimo_fecha_hora and estado.ultimo_tipo == "ENTRADA":
+                if estado.ultimo_fecha_hora.date() < hoy:
                     _log(
-                        f"   [ALERTA] Fichaje abierto de {ultimo.fecha_hora} "
+                        f"   [ALERTA] Fichaje abierto de {estado.ultimo_fecha_hora} "
                         f"(posible olvido de salida)."
                     )
                     if t.fcm_token:
@@ -137,7 +127,7 @@ def comprobar_fichajes_entrada_salida():
                                 t.fcm_token,
                                 "¡Olvido de Salida!",
                                 f"Hola {t.nombre}, detectamos una entrada del día "
-                                f"{ultimo.fecha_hora.strftime('%d/%m')} sin cerrar."
+                                f"{estado.ultimo_fecha_hora.strftime('%d/%m')} sin cerrar."
                             )
                             enviados += 1
                             _log("   [OK] Push ZOMBIE enviado")
@@ -148,18 +138,15 @@ def comprobar_fichajes_entrada_salida():
                     continue
 
             #Franjas de hoy (si no hay, libra)
-            franjas_hoy = Franja.query.filter_by(id_horario=t.idHorario, id_dia=dia_db.id).all()
-            if not franjas_hoy:
+            jornada_hoy = semanas[t.idHorario][hoy.weekday()]
+            if not jornada_hoy.franjas:
                 _log(f"   -> Sin franjas hoy ({nombre_dia}). Libra.")
                 continue
 
-            hora_entrada_min = min(f.hora_entrada for f in franjas_hoy)
-            hora_salida_max = max(f.hora_salida for f in franjas_hoy)
-
-            limite_entrada = datetime.combine(hoy, hora_entrada_min) + timedelta(minutes=MARGEN_MINUTOS)
-            limite_salida = datetime.combine(hoy, hora_salida_max) + timedelta(minutes=MARGEN_MINUTOS)
+            limite_entrada = datetime.combine(hoy, jornada_hoy.entrada) + timedelta(minutes=MARGEN_MINUTOS)
+            limite_salida = inicio_dia + jornada_hoy.salida + timedelta(minutes=MARGEN_MINUTOS)
 
-            _log(f"   Horario: {hora_entrada_min} - {hora_salida_max}")
+            _log(f"   Horario: {jornada_hoy.entrada} - {(inicio_dia + jornada_hoy.salida).time()}")
             _log(
                 f"   Ventana ENTRADA: {limite_entrada.strftime('%H:%M')} - "
                 f"{(limite_entrada + timedelta(minutes=VENTANA_ENVIO_MINUTOS)).strftime('%H:%M')}"
@@ -190,10 +177,10 @@ def comprobar_fichajes_entrada_salida():
 
             #Aviso SALIDA: persistente a partir del límite
             if now_local >= limite_salida:
-                if ultimo:
-                    estado_ultimo = (ultimo.tipo or "").strip().upper()
-                    if estado_ultimo == "ENTRADA" and ultimo.fecha_hora.date() == hoy:
-                        _log(f"   Último fichaje: ENTRADA ({ultimo.fecha_hora}). Falta SALIDA.")
+                if estado.ultimo_fecha_hora:
+                    estado_ultimo = estado.ultimo_tipo
+                    if estado_ultimo == "ENTRADA" and estado.ultimo_fecha_hora.date() == hoy:
+                        _log(f"   Último fichaje: ENTRADA ({estado.ultimo_fecha_hora}). Falta SALIDA.")
                         if t.fcm_token:
                             try:
                                 enviar_notificacion_push(
@@ -0,0 +1,13 @@
+"""
+Configuración de gunicorn (la lee solo al arrancar desde este directorio): `gunicorn app:app`.
+
+Cada worker arranca su bucle de tareas en un hilo (TAREAS_EN_PROCESO) después del fork; importar
+la app en otro sitio (scripts, cron, comandos flask) no lo arranca.
+"""
+
+
+def post_fork(server, worker):
+    from app import app
+    from utils.tareas import arrancar_tareas
+
+    arrancar_tareas(app)
@@ -0,0 +1,26 @@
+"""Dispositivo de origen en fichajes sincronizados en lote
+
+Revision ID: 75c1c1e092dc
+Revises: df682d11c685
+Create Date: 2026-10-17 11:40:17.503928
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '75c1c1e092dc'
+down_revision = 'df682d11c685'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('fichaje', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('id_dispositivo', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('fichaje', schema=None) as batch_op:
+        batch_op.drop_column('id_dispositivo')
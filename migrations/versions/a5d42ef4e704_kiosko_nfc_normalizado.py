@@ -0,0 +1,92 @@
+"""Terminales kiosko y NFC normalizado del trabajador
+
+Revision ID: a5d42ef4e704
+Revises: c760d6789d6f
+Create Date: 2026-10-17 13:18:09.774120
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a5d42ef4e704'
+down_revision = 'c760d6789d6f'
+branch_labels = None
+depends_on = None
+
+
+def _normalizar_uid(uid):
+    # Copia congelada de utils.nfc.normalizar_uid para el relleno inicial
+    if not uid:
+        return ""
+    cleaned = re.sub(r"[^0-9A-F]", "", uid.strip().upper())
+    if len(cleaned) % 2 == 1:
+        cleaned = "0" + cleaned
+    return cleaned
+
+
+def _uid_invertido(uid_hex):
+    pares = [uid_hex[i:i + 2] for i in range(0, len(uid_hex), 2)]
+    pares.reverse()
+    return "".join(pares)
+
+
+def upgrade():
+    op.create_table('terminal_kiosko',
+    sa.Column('id_terminal', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('empresa_id', sa.Integer(), nullable=False),
+    sa.Column('nombre', sa.String(length=120), nullable=False),
+    sa.Column('token_hash', sa.String(length=64), nullable=False),
+    sa.Column('latitud', sa.Float(), nullable=True),
+    sa.Column('longitud', sa.Float(), nullable=True),
+    sa.Column('activo', sa.Boolean(), nullable=False),
+    sa.Column('fecha_alta', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['empresa_id'], ['empresa.id_empresa'], ),
+    sa.PrimaryKeyConstraint('id_terminal'),
+    sa.UniqueConstraint('token_hash')
+    )
+    with op.batch_alter_table('terminal_kiosko', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_terminal_kiosko_empresa_id'), ['empresa_id'], unique=False)
+
+    with op.batch_alter_table('trabajador', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('nfc_canonico', sa.String(length=50), nullable=True))
+        batch_op.add_column(sa.Column('nfc_invertido', sa.String(length=50), nullable=True))
+        batch_op.create_index(batch_op.f('ix_trabajador_nfc_canonico'), ['nfc_canonico'], unique=False)
+        batch_op.create_index(batch_op.f('ix_trabajador_nfc_invertido'), ['nfc_invertido'], unique=False)
+
+    # Relleno de las formas normalizadas para los NFC ya asignados
+    conn = op.get_bind()
+    trabajador = sa.table(
+        'trabajador',
+        sa.column('id_trabajador', sa.Integer),
+        sa.column('codigo_nfc', sa.String),
+        sa.column('nfc_canonico', sa.String),
+        sa.column('nfc_invertido', sa.String),
+    )
+    filas = conn.execute(
+        sa.select(trabajador.c.id_trabajador, trabajador.c.codigo_nfc)
+        .where(trabajador.c.codigo_nfc.isnot(None))
+    ).fetchall()
+    for id_trabajador, codigo_nfc in filas:
+        canonico = _normalizar_uid(codigo_nfc)
+        conn.execute(
+            trabajador.update()
+            .where(trabajador.c.id_trabajador == id_trabajador)
+            .values(nfc_canonico=canonico or None, nfc_invertido=_uid_invertido(canonico) or None)
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('trabajador', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_trabajador_nfc_invertido'))
+        batch_op.drop_index(batch_op.f('ix_trabajador_nfc_canonico'))
+        batch_op.drop_column('nfc_invertido')
+        batch_op.drop_column('nfc_canonico')
+
+    with op.batch_alter_table('terminal_kiosko', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_terminal_kiosko_empresa_id'))
+
+    op.drop_table('terminal_kiosko')
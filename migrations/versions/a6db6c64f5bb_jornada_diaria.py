@@ -0,0 +1,34 @@
+"""Agregado diario de tiempo trabajado (jornada_diaria)
+
+Revision ID: a6db6c64f5bb
+Revises: a5d42ef4e704
+Create Date: 2026-10-17 15:02:37.481920
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6db6c64f5bb'
+down_revision = 'a5d42ef4e704'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('jornada_diaria',
+    sa.Column('id_trabajador', sa.Integer(), nullable=False),
+    sa.Column('fecha', sa.Date(), nullable=False),
+    sa.Column('segundos_trabajados', sa.Integer(), nullable=False),
+    sa.Column('incompleta', sa.Boolean(), nullable=False),
+    sa.Column('primera_entrada', sa.DateTime(), nullable=True),
+    sa.Column('ultima_salida', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['id_trabajador'], ['trabajador.id_trabajador'], ),
+    sa.PrimaryKeyConstraint('id_trabajador', 'fecha')
+    )
+    # Relleno desde el histórico de fichajes: flask reconstruir-jornadas
+
+
+def downgrade():
+    op.drop_table('jornada_diaria')
@@ -0,0 +1,42 @@
+"""Bandeja de salida de correos y push (envio)
+
+Revision ID: a7e9d3f6b1c5
+Revises: f6d8c2e5a0b4
+Create Date: 2026-10-17 23:02:41.518307
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7e9d3f6b1c5'
+down_revision = 'f6d8c2e5a0b4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('envio',
+    sa.Column('id_envio', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('canal', sa.String(length=10), nullable=False),
+    sa.Column('destino', sa.String(length=255), nullable=False),
+    sa.Column('contenido', sa.Text(), nullable=False),
+    sa.Column('estado', sa.String(length=20), nullable=False),
+    sa.Column('intentos', sa.Integer(), nullable=False),
+    sa.Column('siguiente_intento', sa.DateTime(), nullable=False),
+    sa.Column('lote', sa.String(length=32), nullable=True),
+    sa.Column('error', sa.String(length=255), nullable=True),
+    sa.Column('creado_en', sa.DateTime(), nullable=False),
+    sa.Column('enviado_en', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id_envio')
+    )
+    with op.batch_alter_table('envio', schema=None) as batch_op:
+        batch_op.create_index('ix_envio_estado_siguiente', ['estado', 'siguiente_intento'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('envio', schema=None) as batch_op:
+        batch_op.drop_index('ix_envio_estado_siguiente')
+
+    op.drop_table('envio')
@@ -0,0 +1,34 @@
+"""Sumas prefijas mensuales del saldo de horas (saldo_mensual)
+
+Revision ID: b2f4e8a1c9d3
+Revises: a6db6c64f5bb
+Create Date: 2026-10-17 17:24:10.118503
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b2f4e8a1c9d3'
+down_revision = 'a6db6c64f5bb'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('saldo_mensual',
+    sa.Column('id_trabajador', sa.Integer(), nullable=False),
+    sa.Column('mes', sa.Date(), nullable=False),
+    sa.Column('trabajado_seg', sa.Integer(), nullable=False),
+    sa.Column('teorico_seg', sa.Integer(), nullable=False),
+    sa.Column('acum_trabajado_seg', sa.Integer(), nullable=False),
+    sa.Column('acum_teorico_seg', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['id_trabajador'], ['trabajador.id_trabajador'], ),
+    sa.PrimaryKeyConstraint('id_trabajador', 'mes')
+    )
+    # La serie de cada trabajador se crea al consultarla por primera vez
+
+
+def downgrade():
+    op.drop_table('saldo_mensual')
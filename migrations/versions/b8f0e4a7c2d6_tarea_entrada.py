@@ -0,0 +1,26 @@
+"""Fichero de entrada de las tareas (importación de empleados)
+
+Revision ID: b8f0e4a7c2d6
+Revises: a7e9d3f6b1c5
+Create Date: 2026-10-18 00:14:52.907163
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b8f0e4a7c2d6'
+down_revision = 'a7e9d3f6b1c5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('tarea', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('entrada', sa.LargeBinary(length=4294967295), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('tarea', schema=None) as batch_op:
+        batch_op.drop_column('entrada')
@@ -0,0 +1,50 @@
+"""Cierre de mes por empresa y resúmenes congelados (cierre_mes, resumen_cerrado)
+
+Revision ID: c3a5f9b2d7e1
+Revises: b2f4e8a1c9d3
+Create Date: 2026-10-17 18:02:41.530217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a5f9b2d7e1'
+down_revision = 'b2f4e8a1c9d3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('cierre_mes',
+    sa.Column('empresa_id', sa.Integer(), nullable=False),
+    sa.Column('mes', sa.Date(), nullable=False),
+    sa.Column('cerrado_en', sa.DateTime(), nullable=False),
+    sa.Column('cerrado_por', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['cerrado_por'], ['trabajador.id_trabajador'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['empresa_id'], ['empresa.id_empresa'], ),
+    sa.PrimaryKeyConstraint('empresa_id', 'mes')
+    )
+    op.create_table('resumen_cerrado',
+    sa.Column('id_trabajador', sa.Integer(), nullable=False),
+    sa.Column('mes', sa.Date(), nullable=False),
+    sa.Column('empresa_id', sa.Integer(), nullable=False),
+    sa.Column('teoricas_seg', sa.Integer(), nullable=False),
+    sa.Column('trabajadas_seg', sa.Integer(), nullable=False),
+    sa.Column('saldo_seg', sa.Integer(), nullable=False),
+    sa.Column('dias_incompletos', sa.Text(), nullable=True),
+    sa.ForeignKeyConstraint(['empresa_id', 'mes'], ['cierre_mes.empresa_id', 'cierre_mes.mes'], ),
+    sa.ForeignKeyConstraint(['id_trabajador'], ['trabajador.id_trabajador'], ),
+    sa.PrimaryKeyConstraint('id_trabajador', 'mes')
+    )
+    with op.batch_alter_table('resumen_cerrado', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_resumen_cerrado_empresa_id'), ['empresa_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('resumen_cerrado', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_resumen_cerrado_empresa_id'))
+
+    op.drop_table('resumen_cerrado')
+    op.drop_table('cierre_mes')
@@ -0,0 +1,39 @@
+"""Sedes (geovallas) adicionales por empresa
+
+Revision ID: c760d6789d6f
+Revises: 75c1c1e092dc
+Create Date: 2026-10-17 12:31:45.207719
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c760d6789d6f'
+down_revision = '75c1c1e092dc'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('sede_empresa',
+    sa.Column('id_sede', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('empresa_id', sa.Integer(), nullable=False),
+    sa.Column('nombre', sa.String(length=120), nullable=False),
+    sa.Column('latitud', sa.Float(), nullable=False),
+    sa.Column('longitud', sa.Float(), nullable=False),
+    sa.Column('radio', sa.Integer(), nullable=False),
+    sa.Column('codigo_nfc', sa.String(length=50), nullable=True),
+    sa.ForeignKeyConstraint(['empresa_id'], ['empresa.id_empresa'], ),
+    sa.PrimaryKeyConstraint('id_sede')
+    )
+    with op.batch_alter_table('sede_empresa', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_sede_empresa_empresa_id'), ['empresa_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('sede_empresa', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_sede_empresa_empresa_id'))
+
+    op.drop_table('sede_empresa')
@@ -0,0 +1,52 @@
+"""Tareas en segundo plano (tarea)
+
+Revision ID: d4b6a0c3e8f2
+Revises: c3a5f9b2d7e1
+Create Date: 2026-10-17 19:11:05.872144
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4b6a0c3e8f2'
+down_revision = 'c3a5f9b2d7e1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('tarea',
+    sa.Column('id_tarea', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('empresa_id', sa.Integer(), nullable=False),
+    sa.Column('creada_por', sa.Integer(), nullable=True),
+    sa.Column('tipo', sa.String(length=40), nullable=False),
+    sa.Column('parametros', sa.Text(), nullable=True),
+    sa.Column('estado', sa.String(length=20), nullable=False),
+    sa.Column('progreso', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Integer(), nullable=True),
+    sa.Column('mensaje', sa.String(length=255), nullable=True),
+    sa.Column('cancelar', sa.Boolean(), nullable=False),
+    sa.Column('creada_en', sa.DateTime(), nullable=False),
+    sa.Column('iniciada_en', sa.DateTime(), nullable=True),
+    sa.Column('terminada_en', sa.DateTime(), nullable=True),
+    sa.Column('latido', sa.DateTime(), nullable=True),
+    sa.Column('resultado', sa.LargeBinary(length=4294967295), nullable=True),
+    sa.Column('resultado_nombre', sa.String(length=120), nullable=True),
+    sa.Column('resultado_tipo', sa.String(length=120), nullable=True),
+    sa.ForeignKeyConstraint(['creada_por'], ['trabajador.id_trabajador'], ondelete='SET NULL'),
+    sa.ForeignKeyConstraint(['empresa_id'], ['empresa.id_empresa'], ),
+    sa.PrimaryKeyConstraint('id_tarea')
+    )
+    with op.batch_alter_table('tarea', schema=None) as batch_op:
+        batch_op.create_index('ix_tarea_empresa_creada', ['empresa_id', 'creada_en'], unique=False)
+        batch_op.create_index('ix_tarea_estado_creada', ['estado', 'creada_en'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('tarea', schema=None) as batch_op:
+        batch_op.drop_index('ix_tarea_estado_creada')
+        batch_op.drop_index('ix_tarea_empresa_creada')
+
+    op.drop_table('tarea')
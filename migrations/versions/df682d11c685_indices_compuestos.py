@@ -0,0 +1,31 @@
+"""Índices compuestos para fichaje, incidencia y trabajador
+
+Revision ID: df682d11c685
+Revises: f7473cfbbcb6
+Create Date: 2026-10-17 10:02:51.640213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'df682d11c685'
+down_revision = 'f7473cfbbcb6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_fichaje_trabajador_fecha', 'fichaje', ['id_trabajador', 'fecha_hora'], unique=False)
+    op.create_index(
+        'ix_incidencia_trabajador_estado_fechas', 'incidencia',
+        ['id_trabajador', 'estado', 'fecha_inicio', 'fecha_fin'], unique=False
+    )
+    op.create_index('ix_trabajador_idEmpresa', 'trabajador', ['idEmpresa'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_trabajador_idEmpresa', table_name='trabajador')
+    op.drop_index('ix_incidencia_trabajador_estado_fechas', table_name='incidencia')
+    op.drop_index('ix_fichaje_trabajador_fecha', table_name='fichaje')
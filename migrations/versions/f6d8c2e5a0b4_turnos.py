@@ -0,0 +1,48 @@
+"""Turnos guardados (turno)
+
+Revision ID: f6d8c2e5a0b4
+Revises: d4b6a0c3e8f2
+Create Date: 2026-10-17 21:26:14.503318
+
+Tras migrar, rellenar la tabla con `flask reconstruir-turnos`.
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6d8c2e5a0b4'
+down_revision = 'd4b6a0c3e8f2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('turno',
+    sa.Column('id_turno', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('id_trabajador', sa.Integer(), nullable=False),
+    sa.Column('empresa_id', sa.Integer(), nullable=False),
+    sa.Column('id_entrada', sa.Integer(), nullable=True),
+    sa.Column('id_salida', sa.Integer(), nullable=True),
+    sa.Column('entrada', sa.DateTime(), nullable=True),
+    sa.Column('salida', sa.DateTime(), nullable=True),
+    sa.Column('fecha_ref', sa.DateTime(), nullable=False),
+    sa.Column('estado', sa.String(length=20), nullable=False),
+    sa.ForeignKeyConstraint(['id_trabajador'], ['trabajador.id_trabajador'], ),
+    sa.PrimaryKeyConstraint('id_turno')
+    )
+    with op.batch_alter_table('turno', schema=None) as batch_op:
+        batch_op.create_index('ix_turno_empresa_estado_fecha', ['empresa_id', 'estado', 'fecha_ref'], unique=False)
+        batch_op.create_index('ix_turno_empresa_fecha', ['empresa_id', 'fecha_ref', 'id_turno'], unique=False)
+        batch_op.create_index('ix_turno_estado_fecha', ['estado', 'fecha_ref'], unique=False)
+        batch_op.create_index('ix_turno_trabajador_fecha', ['id_trabajador', 'fecha_ref'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('turno', schema=None) as batch_op:
+        batch_op.drop_index('ix_turno_trabajador_fecha')
+        batch_op.drop_index('ix_turno_estado_fecha')
+        batch_op.drop_index('ix_turno_empresa_fecha')
+        batch_op.drop_index('ix_turno_empresa_estado_fecha')
+
+    op.drop_table('turno')
@@ -0,0 +1,44 @@
+"""Estado actual por trabajador (último fichaje)
+
+Revision ID: f7473cfbbcb6
+Revises: 0a65b3bf8059
+Create Date: 2026-10-17 09:12:04.118532
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7473cfbbcb6'
+down_revision = '0a65b3bf8059'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('estado_trabajador',
+    sa.Column('id_trabajador', sa.Integer(), nullable=False),
+    sa.Column('ultimo_tipo', sa.String(length=20), nullable=True),
+    sa.Column('ultimo_fecha_hora', sa.DateTime(), nullable=True),
+    sa.Column('id_ultimo_fichaje', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['id_trabajador'], ['trabajador.id_trabajador'], ),
+    sa.PrimaryKeyConstraint('id_trabajador')
+    )
+
+    # Relleno inicial: último fichaje de cada trabajador según el histórico.
+    op.execute("""
+        INSERT INTO estado_trabajador (id_trabajador, ultimo_tipo, ultimo_fecha_hora, id_ultimo_fichaje)
+        SELECT f.id_trabajador, UPPER(TRIM(f.tipo)), f.fecha_hora, f.id_fichaje
+        FROM fichaje f
+        WHERE f.id_fichaje = (
+            SELECT f2.id_fichaje FROM fichaje f2
+            WHERE f2.id_trabajador = f.id_trabajador
+            ORDER BY f2.fecha_hora DESC, f2.id_fichaje DESC
+            LIMIT 1
+        )
+    """)
+
+
+def downgrade():
+    op.drop_table('estado_trabajador')
@@ -1,6 +1,8 @@
 from datetime import datetime
+from sqlalchemy.orm import validates
 from extensions import db
-from werkzeug.security import generate_password_hash, check_password_hash
+from utils.claves import hashear, verificar, necesita_rehash, rehacer_hash
+from utils.nfc import normalizar_uid, uid_invertido
 
 
 class Empresa(db.Model):
@@ -20,6 +22,44 @@ class Empresa(db.Model):
 
     trabajadores = db.relationship("Trabajador", back_populates="empresa")
     horarios = db.relationship("Horario", backref="empresa", lazy=True)
+    sedes = db.relationship("SedeEmpresa", back_populates="empresa", cascade="all, delete-orphan")
+    cierres = db.relationship("CierreMes", back_populates="empresa", cascade="all, delete-orphan")
+    tareas = db.relationship("Tarea", cascade="all, delete-orphan")
+
+
+class SedeEmpresa(db.Model):
+    """SedeEmpresa: centro de trabajo adicional con geovalla propia (lat/lon/radio) y NFC opcional."""
+    __tablename__ = "sede_empresa"
+
+    id_sede = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    empresa_id = db.Column(db.Integer, db.ForeignKey("empresa.id_empresa"), nullable=False, index=True)
+    nombre = db.Column(db.String(120), nullable=False)
+
+    latitud = db.Column(db.Float, nullable=False)
+    longitud = db.Column(db.Float, nullable=False)
+    radio = db.Column(db.Integer, nullable=False, default=100)
+
+    codigo_nfc = db.Column(db.String(50), nullable=True)
+
+    empresa = db.relationship("Empresa", back_populates="sedes")
+
+
+class TerminalKiosko(db.Model):
+    """TerminalKiosko: lector NFC compartido de una empresa; se autentica con token propio (solo se guarda su hash)."""
+    __tablename__ = "terminal_kiosko"
+
+    id_terminal = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    empresa_id = db.Column(db.Integer, db.ForeignKey("empresa.id_empresa"), nullable=False, index=True)
+    nombre = db.Column(db.String(120), nullable=False)
+    token_hash = db.Column(db.String(64), nullable=False, unique=True)
+
+    latitud = db.Column(db.Float, nullable=True)
+    longitud = db.Column(db.Float, nullable=True)
+
+    activo = db.Column(db.Boolean, nullable=False, default=True)
+    fecha_alta = db.Column(db.DateTime, default=datetime.now)
+
+    empresa = db.relationship("Empresa")
 
 
 class Rol(db.Model):
@@ -81,6 +121,9 @@ class Franja(db.Model):
 class Trabajador(db.Model):
     """Trabajador: credenciales, rol, empresa, horario, NFC personal y token FCM."""
     __tablename__ = "trabajador"
+    __table_args__ = (
+        db.Index("ix_trabajador_idEmpresa", "idEmpresa"),
+    )
 
     id_trabajador = db.Column(db.Integer, primary_key=True, autoincrement=True)
     nif = db.Column(db.String(20), nullable=False)
@@ -91,6 +134,9 @@ class Trabajador(db.Model):
     telef = db.Column(db.String(30))
 
     codigo_nfc = db.Column(db.String(50), unique=True, nullable=True)
+    # Formas normalizadas de codigo_nfc (se rellenan solas al asignarlo) para resolver tarjetas en kiosko
+    nfc_canonico = db.Column(db.String(50), nullable=True, index=True)
+    nfc_invertido = db.Column(db.String(50), nullable=True, index=True)
     fcm_token = db.Column(db.String(255), nullable=True)
 
     idEmpresa = db.Column(db.Integer, db.ForeignKey("empresa.id_empresa"), nullable=False)
@@ -103,31 +149,218 @@ class Trabajador(db.Model):
 
     fichajes = db.relationship("Fichaje", back_populates="trabajador", cascade="all, delete-orphan")
     incidencias = db.relationship("Incidencia", back_populates="trabajador", cascade="all, delete-orphan")
+    estado = db.relationship(
+        "EstadoTrabajador", back_populates="trabajador", uselist=False, cascade="all, delete-orphan"
+    )
+    jornadas = db.relationship("JornadaDiaria", back_populates="trabajador", cascade="all, delete-orphan")
+    saldos = db.relationship("SaldoMensual", back_populates="trabajador", cascade="all, delete-orphan")
+    resumenes_cerrados = db.relationship("ResumenCerrado", back_populates="trabajador", cascade="all, delete-orphan")
+    turnos = db.relationship("Turno", back_populates="trabajador", cascade="all, delete-orphan")
+
+    @validates("codigo_nfc")
+    def _sincronizar_nfc(self, key, value):
+        canonico = normalizar_uid(value)
+        self.nfc_canonico = canonico or None
+        self.nfc_invertido = uid_invertido(canonico) or None
+        return value
 
     def set_password(self, password):
-        self.passw = generate_password_hash(password)
+        self.passw = hashear(password)
 
     def check_password(self, password):
-        return check_password_hash(self.passw, password)
+        # Hash y verificación van al pool de utils.claves (503 si está lleno)
+        if not verificar(self.passw, password):
+            return False
+        if necesita_rehash(self.passw):
+            rehacer_hash(Trabajador, self.id_trabajador, self.passw, password)
+        return True
 
 
 class Fichaje(db.Model):
     """Fichaje: registro ENTRADA/SALIDA con fecha y posición para control de presencia."""
     __tablename__ = "fichaje"
+    __table_args__ = (
+        db.Index("ix_fichaje_trabajador_fecha", "id_trabajador", "fecha_hora"),
+    )
 
     id_fichaje = db.Column(db.Integer, primary_key=True, autoincrement=True)
     fecha_hora = db.Column(db.DateTime, nullable=False, default=datetime.now)
     tipo = db.Column(db.String(20), nullable=False)
     latitud = db.Column(db.Float, nullable=False)
     longitud = db.Column(db.Float, nullable=False)
+    # Solo en fichajes sincronizados en lote desde la app (offline)
+    id_dispositivo = db.Column(db.String(64), nullable=True)
 
     id_trabajador = db.Column(db.Integer, db.ForeignKey("trabajador.id_trabajador"), nullable=False)
     trabajador = db.relationship("Trabajador", back_populates="fichajes")
 
 
+class EstadoTrabajador(db.Model):
+    """EstadoTrabajador: último fichaje (tipo/fecha/id) por trabajador para no recorrer el histórico."""
+    __tablename__ = "estado_trabajador"
+
+    id_trabajador = db.Column(db.Integer, db.ForeignKey("trabajador.id_trabajador"), primary_key=True)
+    ultimo_tipo = db.Column(db.String(20), nullable=True)
+    ultimo_fecha_hora = db.Column(db.DateTime, nullable=True)
+    # Sin FK: al borrar el último fichaje el estado se recalcula en la misma transacción.
+    id_ultimo_fichaje = db.Column(db.Integer, nullable=True)
+
+    trabajador = db.relationship("Trabajador", back_populates="estado")
+
+
+class JornadaDiaria(db.Model):
+    """JornadaDiaria: agregado por trabajador y día (segundos trabajados, incompleta, primera entrada y última salida)."""
+    __tablename__ = "jornada_diaria"
+
+    id_trabajador = db.Column(db.Integer, db.ForeignKey("trabajador.id_trabajador"), primary_key=True)
+    fecha = db.Column(db.Date, primary_key=True)
+    segundos_trabajados = db.Column(db.Integer, nullable=False, default=0)
+    incompleta = db.Column(db.Boolean, nullable=False, default=False)
+    primera_entrada = db.Column(db.DateTime, nullable=True)
+    ultima_salida = db.Column(db.DateTime, nullable=True)
+
+    trabajador = db.relationship("Trabajador", back_populates="jornadas")
+
+
+class Turno(db.Model):
+    """Turno: jornada ENTRADA -> SALIDA reconstruida de los fichajes, con su estado (utils.turnos)."""
+    __tablename__ = "turno"
+    __table_args__ = (
+        db.Index("ix_turno_empresa_fecha", "empresa_id", "fecha_ref", "id_turno"),
+        db.Index("ix_turno_empresa_estado_fecha", "empresa_id", "estado", "fecha_ref"),
+        db.Index("ix_turno_trabajador_fecha", "id_trabajador", "fecha_ref"),
+        db.Index("ix_turno_estado_fecha", "estado", "fecha_ref"),
+    )
+
+    id_turno = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    id_trabajador = db.Column(db.Integer, db.ForeignKey("trabajador.id_trabajador"), nullable=False)
+    empresa_id = db.Column(db.Integer, nullable=False)
+    # Sin FK: al borrar un fichaje sus turnos se rehacen en la misma transacción.
+    id_entrada = db.Column(db.Integer, nullable=True)
+    id_salida = db.Column(db.Integer, nullable=True)
+    entrada = db.Column(db.DateTime, nullable=True)
+    salida = db.Column(db.DateTime, nullable=True)
+    fecha_ref = db.Column(db.DateTime, nullable=False)  # entrada, o salida si no la hay
+    # EN_CURSO, SIN_CIERRE, SIN_SALIDA, SIN_ENTRADA, CERRADA o LARGA
+    estado = db.Column(db.String(20), nullable=False)
+
+    trabajador = db.relationship("Trabajador", back_populates="turnos")
+    fichaje_entrada = db.relationship(
+        "Fichaje", primaryjoin="foreign(Turno.id_entrada) == Fichaje.id_fichaje", viewonly=True
+    )
+    fichaje_salida = db.relationship(
+        "Fichaje", primaryjoin="foreign(Turno.id_salida) == Fichaje.id_fichaje", viewonly=True
+    )
+
+
+class SaldoMensual(db.Model):
+    """SaldoMensual: segundos trabajados/teóricos de un mes y sus acumulados desde el inicio de la serie del trabajador."""
+    __tablename__ = "saldo_mensual"
+
+    id_trabajador = db.Column(db.Integer, db.ForeignKey("trabajador.id_trabajador"), primary_key=True)
+    mes = db.Column(db.Date, primary_key=True)  # día 1 del mes
+    trabajado_seg = db.Column(db.Integer, nullable=False, default=0)
+    teorico_seg = db.Column(db.Integer, nullable=False, default=0)
+    acum_trabajado_seg = db.Column(db.Integer, nullable=False, default=0)
+    acum_teorico_seg = db.Column(db.Integer, nullable=False, default=0)
+
+    trabajador = db.relationship("Trabajador", back_populates="saldos")
+
+
+class CierreMes(db.Model):
+    """CierreMes: mes cerrado de una empresa; sus resúmenes quedan congelados en resumen_cerrado."""
+    __tablename__ = "cierre_mes"
+
+    empresa_id = db.Column(db.Integer, db.ForeignKey("empresa.id_empresa"), primary_key=True)
+    mes = db.Column(db.Date, primary_key=True)  # día 1 del mes
+    cerrado_en = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    cerrado_por = db.Column(db.Integer, db.ForeignKey("trabajador.id_trabajador", ondelete="SET NULL"), nullable=True)
+
+    empresa = db.relationship("Empresa", back_populates="cierres")
+    resumenes = db.relationship("ResumenCerrado", back_populates="cierre", cascade="all, delete-orphan")
+
+
+class ResumenCerrado(db.Model):
+    """ResumenCerrado: resumen mensual de un trabajador tal como quedó al cerrar el mes (inmutable)."""
+    __tablename__ = "resumen_cerrado"
+    __table_args__ = (
+        db.ForeignKeyConstraint(["empresa_id", "mes"], ["cierre_mes.empresa_id", "cierre_mes.mes"]),
+    )
+
+    id_trabajador = db.Column(db.Integer, db.ForeignKey("trabajador.id_trabajador"), primary_key=True)
+    mes = db.Column(db.Date, primary_key=True)  # día 1 del mes
+    empresa_id = db.Column(db.Integer, nullable=False, index=True)
+    teoricas_seg = db.Column(db.Integer, nullable=False, default=0)
+    trabajadas_seg = db.Column(db.Integer, nullable=False, default=0)
+    saldo_seg = db.Column(db.Integer, nullable=False, default=0)
+    dias_incompletos = db.Column(db.Text, nullable=True)  # fechas ISO separadas por comas
+
+    trabajador = db.relationship("Trabajador", back_populates="resumenes_cerrados")
+    cierre = db.relationship("CierreMes", back_populates="resumenes")
+
+
+class Tarea(db.Model):
+    """Tarea: trabajo pesado de RRHH (informes, barridos) que ejecuta en segundo plano utils.tareas."""
+    __tablename__ = "tarea"
+    __table_args__ = (
+        db.Index("ix_tarea_estado_creada", "estado", "creada_en"),
+        db.Index("ix_tarea_empresa_creada", "empresa_id", "creada_en"),
+    )
+
+    id_tarea = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    empresa_id = db.Column(db.Integer, db.ForeignKey("empresa.id_empresa"), nullable=False)
+    creada_por = db.Column(db.Integer, db.ForeignKey("trabajador.id_trabajador", ondelete="SET NULL"), nullable=True)
+    tipo = db.Column(db.String(40), nullable=False)
+    parametros = db.Column(db.Text, nullable=True)  # JSON
+
+    estado = db.Column(db.String(20), nullable=False, default="PENDIENTE")  # PENDIENTE, EN_CURSO, COMPLETADA, FALLIDA, CANCELADA
+    progreso = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)
+    mensaje = db.Column(db.String(255), nullable=True)
+    cancelar = db.Column(db.Boolean, nullable=False, default=False)
+
+    creada_en = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    iniciada_en = db.Column(db.DateTime, nullable=True)
+    terminada_en = db.Column(db.DateTime, nullable=True)
+    latido = db.Column(db.DateTime, nullable=True)  # último aviso de vida del worker que la ejecuta
+
+    # Fichero de entrada (importaciones); se borra al terminar la tarea
+    entrada = db.deferred(db.Column(db.LargeBinary(length=2**32 - 1), nullable=True))
+
+    # Fichero resultado (descarga); LONGBLOB en MySQL
+    resultado = db.deferred(db.Column(db.LargeBinary(length=2**32 - 1), nullable=True))
+    resultado_nombre = db.Column(db.String(120), nullable=True)
+    resultado_tipo = db.Column(db.String(120), nullable=True)
+
+
+class Envio(db.Model):
+    """Envío: correo o push en la bandeja de salida; lo guarda la transacción del cambio y lo manda utils.envios."""
+    __tablename__ = "envio"
+    __table_args__ = (
+        db.Index("ix_envio_estado_siguiente", "estado", "siguiente_intento"),
+    )
+
+    id_envio = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    canal = db.Column(db.String(10), nullable=False)  # EMAIL, PUSH
+    destino = db.Column(db.String(255), nullable=False)  # email o token FCM
+    contenido = db.Column(db.Text, nullable=False)  # JSON
+
+    estado = db.Column(db.String(20), nullable=False, default="PENDIENTE")  # PENDIENTE, ENVIADO, FALLIDO
+    intentos = db.Column(db.Integer, nullable=False, default=0)
+    siguiente_intento = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    lote = db.Column(db.String(32), nullable=True)  # marca del worker que lo ha reclamado
+    error = db.Column(db.String(255), nullable=True)
+
+    creado_en = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    enviado_en = db.Column(db.DateTime, nullable=True)
+
+
 class Incidencia(db.Model):
     """Incidencia: solicitudes (vacaciones/baja/olvido...) con estado y comentarios."""
     __tablename__ = "incidencia"
+    __table_args__ = (
+        db.Index("ix_incidencia_trabajador_estado_fechas", "id_trabajador", "estado", "fecha_inicio", "fecha_fin"),
+    )
 
     id_incidencia = db.Column(db.Integer, primary_key=True, autoincrement=True)
     tipo = db.Column(db.String(50), nullable=False)
@@ -1,32 +1,23 @@
-import random
-import string
 import sys
 from datetime import datetime, time as dtime, timedelta
 
+from flask import url_for
 from flask.views import MethodView
 from flask_smorest import Blueprint, abort
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 from sqlalchemy import or_, func
 
 from extensions import db
-from models import Trabajador, Fichaje, Dia, Franja
+from models import Trabajador, Fichaje
 from schemas import UserLoginSchema, PasswordResetSchema, ChangePasswordSchema, FcmTokenSchema, ResetPasswordRequestSchema
-from utils.email_sender import enviar_correo_password
+from utils.email_sender import correo_password
+from utils.envios import encolar_correo
+from utils.horarios import dia_horario
+from utils.reset_tokens import generar_token_reset
 
 
 blp = Blueprint("auth", __name__, description="Autenticacion y Tokens")
 
-# Mapa weekday() -> nombre de día en BD (IMPORTANTE: coincide con tu tabla Dia.nombre)
-DIAS_SEMANA = {
-    0: "lunes",
-    1: "martes",
-    2: "miercoles",
-    3: "jueves",
-    4: "viernes",
-    5: "sabado",
-    6: "domingo"
-}
-
 # Margen para no avisar si aún es “temprano” respecto a la hora de entrada
 GRACE_MINUTES = 10
 
@@ -35,22 +26,6 @@ GRACE_MINUTES = 10
 # HELPERS: Recordatorio de fichaje
 # ------------------------------
 
-def _get_franjas_hoy(trabajador: Trabajador, hoy_fecha):
-    """Devuelve lista de franjas de HOY para el horario del trabajador."""
-    if not trabajador.idHorario:
-        return []
-
-    nombre_dia = DIAS_SEMANA.get(hoy_fecha.weekday())
-    if not nombre_dia:
-        return []
-
-    dia_db = Dia.query.filter_by(nombre=nombre_dia).first()
-    if not dia_db:
-        return []
-
-    return Franja.query.filter_by(id_horario=trabajador.idHorario, id_dia=dia_db.id).all()
-
-
 def _tiene_entrada_hoy(trabajador: Trabajador, hoy_fecha):
     """True si existe ENTRADA hoy (rango 00:00:00 - 23:59:59.999999)."""
     inicio_dia = datetime.combine(hoy_fecha, dtime.min)
@@ -80,12 +55,12 @@ def _debe_avisar_fichaje(trabajador: Trabajador):
     ahora = datetime.now()
     hoy_fecha = ahora.date()
 
-    franjas = _get_franjas_hoy(trabajador, hoy_fecha)
-    if not franjas:
+    jornada = dia_horario(trabajador.idHorario, hoy_fecha)
+    if not jornada.franjas:
         return (False, None, None, False, None)
 
     # Si hay varias franjas, usamos la hora_entrada más temprana
-    hora_entrada_min = min((f.hora_entrada for f in franjas if f.hora_entrada), default=None)
+    hora_entrada_min = jornada.entrada
     hora_entrada_str = hora_entrada_min.strftime("%H:%M") if hora_entrada_min else None
 
     if not hora_entrada_min:
@@ -209,15 +184,13 @@ class PasswordReset(MethodView):
         if not trabajador.email:
             return {"message": "Este usuario no tiene email configurado"}, 400
 
-        # Generar nueva contraseña simple (8 chars) y enviarla
-        caracteres = string.ascii_letters + string.digits
-        nueva_pass = ''.join(random.choice(caracteres) for _ in range(8))
-
-        trabajador.set_password(nueva_pass)
+        # Enlace de restablecimiento (caduca en 15 min), como en la web: la bandeja de salida no
+        # guarda ninguna contraseña y la actual sigue valiendo hasta que el usuario elige otra
+        token = generar_token_reset(trabajador.id_trabajador)
+        link = url_for("auth_web.reset_password_confirm", token=token, _external=True)
+        encolar_correo(trabajador.email, correo_password(trabajador.nombre, link))
         db.session.commit()
-
-        enviar_correo_password(trabajador.email, trabajador.nombre, nueva_pass)
-        return {"message": "Contraseña enviada al correo"}, 200
+        return {"message": "Te hemos enviado un enlace para restablecer la contraseña"}, 200
 
 
 # ------------------------------
@@ -290,14 +263,12 @@ class ResetPassword(MethodView):
             # Usamos _external=True para que ponga https://dominio.com/...
             link = url_for("auth_web.reset_password_confirm", token=token, _external=True)
 
-            # Envia email
-            enviado = enviar_correo_password(trabajador.email, trabajador.nombre, link)
-
-            if enviado:
-                return {"message": "Correo enviado correctamente."}
-            else:
-                abort(500, message="Error al enviar el correo electrónico.")
+            # Encola el email (lo manda el worker de la bandeja de salida)
+            encolar_correo(trabajador.email, correo_password(trabajador.nombre, link))
+            db.session.commit()
+            return {"message": "Correo enviado correctamente."}
 
         except Exception as e:
+            db.session.rollback()
             print(f"Error en API Reset: {e}")
             abort(500, message="Error interno del servidor")
@@ -1,17 +1,34 @@
 import re
+from datetime import datetime, date
+from zoneinfo import ZoneInfo
 from flask.views import MethodView
 from flask_smorest import Blueprint, abort
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 
 from extensions import db
-from models import Empresa, Trabajador
-from schemas import EmpresaSchema, TrabajadorSchema, FichajeNFCInputSchema
+from models import Empresa, Trabajador, TerminalKiosko, CierreMes
+from schemas import (
+    EmpresaSchema, TrabajadorSchema, FichajeNFCInputSchema, KioskoCrearSchema, KioskoSchema,
+    ResumenMensualQuerySchema, ResumenMensualEmpleadoSchema, CierreMesInputSchema, CierreMesSchema
+)
+from utils.geovallas import invalidar_sedes
+from utils.kiosko import generar_token, hash_token, invalidar_terminal
+from utils.resumen_empresa import resumen_mensual_empresa
+from utils.cierres import cerrar_mes, reabrir_mes, mes_cerrado, resumen_cerrado_empresa
+from utils.consultas import presupuesto_consultas
 
 blp = Blueprint("empresas", __name__, description="Fichajes y control de presencia")
 
+TZ = ZoneInfo("Europe/Madrid")
+
 # --- HELPERS ---
 
+def _local_now_naive():
+    """Hora actual en Madrid (naive) para comparar con BD."""
+    return datetime.now(TZ).replace(tzinfo=None)
+
 def normalizar_rol(raw: str) -> str:
     if not raw:
         return "SIN_ROL"
@@ -118,6 +135,7 @@ class EmpresaConfig(MethodView):
 
         try:
             db.session.commit()
+            invalidar_sedes(empresa.id_empresa)
         except Exception as e:
             db.session.rollback()
             abort(500, message=f"Error al guardar configuración: {str(e)}")
@@ -128,6 +146,7 @@ class EmpresaConfig(MethodView):
 class EmpleadoList(MethodView):
     @jwt_required()
     @blp.response(200, TrabajadorSchema(many=True))
+    @presupuesto_consultas(6)
     def get(self):
         user_id = get_jwt_identity()
         trabajador = Trabajador.query.get(user_id)
@@ -135,7 +154,10 @@ class EmpleadoList(MethodView):
         if not trabajador or not trabajador.empresa:
             abort(404, message="Usuario sin empresa asignada.")
 
-        return trabajador.empresa.trabajadores
+        # TrabajadorSchema anida empresa, rol y horario: se cargan en bloque, no uno por trabajador
+        return Trabajador.query.filter_by(idEmpresa=trabajador.idEmpresa).options(
+            selectinload(Trabajador.rol), selectinload(Trabajador.horario)
+        ).all()
 
 @blp.route("/empresa/config-nfc")
 class EmpresaNfcConfig(MethodView):
@@ -168,3 +190,134 @@ class EmpresaNfcConfig(MethodView):
 
         return {"message": f"NFC de Oficina actualizado: {nfc_limpio}", "rol": rol_norm}, 200
 
+def _admin_con_empresa(mensaje_403="Solo administradores pueden gestionar terminales kiosko."):
+    """Trabajador autenticado si es admin y tiene empresa (si no, aborta)."""
+    trabajador = Trabajador.query.get_or_404(get_jwt_identity())
+
+    es_admin, _ = es_admin_robusto(trabajador)
+    if not es_admin:
+        abort(403, message=mensaje_403)
+    if not trabajador.empresa:
+        abort(404, message="No tienes empresa asignada.")
+    return trabajador
+
+@blp.route("/empresa/kioskos")
+class KioskoList(MethodView):
+    @jwt_required()
+    @blp.response(200, KioskoSchema(many=True))
+    def get(self):
+        admin = _admin_con_empresa()
+        return TerminalKiosko.query.filter_by(empresa_id=admin.idEmpresa).order_by(TerminalKiosko.nombre).all()
+
+    @jwt_required()
+    @blp.arguments(KioskoCrearSchema)
+    @blp.response(201, KioskoSchema)
+    def post(self, data):
+        """Alta de terminal: el token en claro solo se devuelve en esta respuesta."""
+        admin = _admin_con_empresa()
+
+        token = generar_token()
+        terminal = TerminalKiosko(
+            empresa_id=admin.idEmpresa,
+            nombre=data["nombre"],
+            latitud=data.get("latitud"),
+            longitud=data.get("longitud"),
+            token_hash=hash_token(token)
+        )
+
+        try:
+            db.session.add(terminal)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            abort(500, message=f"Error creando terminal: {str(e)}")
+
+        terminal.token = token
+        return terminal
+
+@blp.route("/empresa/kioskos/<int:id_terminal>")
+class KioskoDetail(MethodView):
+    @jwt_required()
+    def delete(self, id_terminal):
+        """Desactiva el terminal (su token deja de valer)."""
+        admin = _admin_con_empresa()
+        terminal = TerminalKiosko.query.get_or_404(id_terminal)
+        if terminal.empresa_id != admin.idEmpresa:
+            abort(404, message="Terminal no encontrado.")
+
+        terminal.activo = False
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            abort(500, message=f"Error desactivando terminal: {str(e)}")
+
+        invalidar_terminal(terminal.token_hash)
+        return {"message": "Terminal desactivado."}, 200
+
+
+@blp.route("/empresa/resumen-mensual")
+class ResumenMensualEmpresa(MethodView):
+    """
+    Resumen mensual de toda la plantilla (admin): mismos cálculos que /resumen
+    de cada trabajador, en bloque (ver utils.resumen_empresa).
+    """
+    @jwt_required()
+    @blp.arguments(ResumenMensualQuerySchema, location="query")
+    @blp.response(200, ResumenMensualEmpleadoSchema(many=True))
+    def get(self, args):
+        admin = _admin_con_empresa("Solo administradores pueden ver el resumen de la plantilla.")
+
+        now = _local_now_naive()
+        mes = args.get("mes") or now.month
+        anio = args.get("anio") or now.year
+        if not 1 <= mes <= 12:
+            abort(422, message="Mes no válido.")
+
+        if mes_cerrado(admin.idEmpresa, date(anio, mes, 1)):
+            return resumen_cerrado_empresa(admin.idEmpresa, anio, mes)
+        return resumen_mensual_empresa(admin.idEmpresa, anio, mes)
+
+
+@blp.route("/empresa/cierres")
+class CierreMesList(MethodView):
+    """
+    Cierre de mes (admin): congela el resumen de cada trabajador; desde entonces el mes se sirve
+    del resumen congelado y no admite cambios de fichajes hasta reabrirlo (ver utils.cierres).
+    """
+    @jwt_required()
+    @blp.response(200, CierreMesSchema(many=True))
+    def get(self):
+        admin = _admin_con_empresa("Solo administradores pueden gestionar los cierres de mes.")
+        return CierreMes.query.filter_by(empresa_id=admin.idEmpresa).order_by(CierreMes.mes.desc()).all()
+
+    @jwt_required()
+    @blp.arguments(CierreMesInputSchema)
+    @blp.response(201, CierreMesSchema)
+    def post(self, data):
+        admin = _admin_con_empresa("Solo administradores pueden gestionar los cierres de mes.")
+        try:
+            return cerrar_mes(admin.idEmpresa, data["anio"], data["mes"], admin.id_trabajador, _local_now_naive().date())
+        except ValueError as e:
+            db.session.rollback()
+            abort(409, message=str(e))
+        except IntegrityError:
+            # Otro admin lo ha cerrado a la vez
+            db.session.rollback()
+            abort(409, message="El mes ya está cerrado.")
+
+@blp.route("/empresa/cierres/<int:anio>/<int:mes>")
+class CierreMesDetail(MethodView):
+    @jwt_required()
+    def delete(self, anio, mes):
+        """Reabre el mes: vuelve a calcularse en vivo y se pueden corregir sus fichajes."""
+        admin = _admin_con_empresa("Solo administradores pueden gestionar los cierres de mes.")
+        if not 1 <= mes <= 12:
+            abort(404, message="Mes no válido.")
+        try:
+            reabrir_mes(admin.idEmpresa, anio, mes)
+        except ValueError as e:
+            db.session.rollback()
+            abort(404, message=str(e))
+
+        return {"message": f"Mes {mes:02d}/{anio} reabierto."}, 200
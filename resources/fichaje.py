@@ -1,28 +1,44 @@
-import math
 import re
-from datetime import datetime, timedelta, date
+from datetime import datetime, timedelta
+from functools import wraps
 from zoneinfo import ZoneInfo
 
+from flask import request
 from flask.views import MethodView
 from flask_smorest import Blueprint, abort
+from sqlalchemy import insert, or_
+from werkzeug.exceptions import HTTPException
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 from extensions import db
-from models import Trabajador, Fichaje, Empresa, Incidencia, Dia, Franja
+from models import Trabajador, Fichaje, Empresa, Incidencia, EstadoTrabajador
+from utils.estado_trabajador import estado_actual, estado_para_fichar, registrar_fichaje, incidencia_olvido
+from utils.geovallas import indice_empresa
+from utils.nfc import normalizar_uid, uid_invertido, uid_es_valido
+from utils.kiosko import terminal_por_token
+from utils import antirrebote, idempotencia
+from utils.diario_fichajes import diario_activo
+from utils.jornada_diaria import recalcular_jornada, recalcular_jornadas, resumen_jornadas
+from utils.horarios import semana_horario, segundos_teoricos
+from utils.saldos import primer_dia, resumen_acumulado
+from utils.cierres import resumen_cerrado, meses_cerrados
 from schemas import (
     FichajeInputSchema,
     FichajeOutputSchema,
     ResumenMensualQuerySchema,
     ResumenMensualOutputSchema,
-    FichajeNFCInputSchema
+    ResumenAcumuladoQuerySchema,
+    ResumenAcumuladoOutputSchema,
+    FichajeNFCInputSchema,
+    FichajeLoteInputSchema,
+    FichajeLoteOutputSchema,
+    KioskoFichajeInputSchema,
+    KioskoFichajeOutputSchema
 )
 
 # Blueprint del módulo: controla fichajes (manual/NFC), resumen mensual y consultas.
 blp = Blueprint("fichajes", __name__, description="Fichajes y control de presencia")
 
-# Regex defensiva para validar UIDs en HEX puro.
-_UID_RE = re.compile(r"^[0-9A-F]+$")
-
 # Zona horaria única del sistema (debe coincidir con avisos.py para evitar desajustes).
 TZ = ZoneInfo("Europe/Madrid")
 
@@ -73,290 +89,471 @@ def es_admin_robusto(trabajador):
 # GEO / DISTANCIA
 # ---------------------------------------------------------------------
 
-def calcular_distancia(lat1, lon1, lat2, lon2):
+def _validar_distancia_empresa(empresa: Empresa, lat: float, lon: float, nfc_data_raw=None):
     """
-    Calcula distancia en metros entre dos coordenadas (Haversine).
+    Valida que el fichaje se hace dentro de alguna geovalla de la empresa.
+    - Geovallas = sede principal (lat/lon/radio de Empresa) + SedeEmpresa (índice en rejilla cacheado).
+    - Si la empresa no tiene ninguna, no se aplica control.
+    - Se usa (radio or 100) + 50 como tolerancia (m) en cada sede.
+    - Si todas las sedes en rango exigen su propio NFC, el recibido debe coincidir con el de alguna.
+    Devuelve True si el NFC recibido se ha validado como etiqueta de sede (sustituye al control de _validar_nfc).
     """
-    R = 6371000  # radio medio tierra (m)
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lon2 - lon1)
-    a = (
-        math.sin(delta_phi / 2) ** 2
-        + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
-    )
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-    return R * c
+    if not empresa:
+        return False
 
+    indice = indice_empresa(empresa)
+    if not indice:
+        return False
 
-def _validar_distancia_empresa(empresa: Empresa, lat: float, lon: float):
-    """
-    Valida que el fichaje se hace dentro de un radio razonable.
-    - Si la empresa no tiene lat/lon, no se aplica control.
-    - Se usa (empresa.radio or 100) + 50 como tolerancia (m).
-    """
-    if not empresa:
-        return
+    if lat is None or lon is None:
+        abort(400, message="Faltan coordenadas GPS para validar el fichaje.")
 
-    if empresa.latitud is not None and empresa.longitud is not None:
-        if lat is None or lon is None:
-            abort(400, message="Faltan coordenadas GPS para validar el fichaje.")
+    en_rango = indice.sedes_en_rango(lat, lon)
+    if not en_rango:
+        abort(403, message=f"Lejos de la empresa ({int(indice.distancia_minima(lat, lon))}m).")
+
+    if any(not sede.codigo_nfc for sede, _ in en_rango):
+        return False
 
-        distancia = calcular_distancia(lat, lon, empresa.latitud, empresa.longitud)
-        radio_permitido = (empresa.radio or 100) + 50  # margen extra
-        if distancia > radio_permitido:
-            abort(403, message=f"Lejos de la empresa ({int(distancia)}m).")
+    nfc_recibido = normalizar_uid(nfc_data_raw)
+    if not nfc_recibido:
+        abort(400, message="Fichaje restringido: Debes escanear el punto NFC de la sede.")
+
+    uid_inv = uid_invertido(nfc_recibido)
+    for sede, _ in en_rango:
+        nfc_sede = normalizar_uid(sede.codigo_nfc)
+        if nfc_recibido == nfc_sede or uid_inv == nfc_sede:
+            return True
+
+    abort(403, message=f"NFC Incorrecto. Escanea la etiqueta oficial de la sede ({en_rango[0][0].nombre}).")
 
 
 # ---------------------------------------------------------------------
-# NFC (UIDs)
+# CREACIÓN DE FICHAJE (ENTRADA/SALIDA)
 # ---------------------------------------------------------------------
 
-def _normalizar_uid(uid: str) -> str:
+def _decidir_tipo(trabajador_id, ultimo_tipo, ultima_fecha, now: datetime, anotar_olvido=True):
     """
-    Convierte cualquier UID recibido a un formato canónico:
-    - Uppercase
-    - Sin 0x
-    - Sin separadores (: - espacios)
-    - Solo HEX (0-9A-F)
+    Decide el tipo del siguiente fichaje a partir del último (tipo, fecha).
+
+    Reglas:
+    - Anti-doble click: si el último fichaje fue hace < 60s -> 429.
+    - Si el último fue ENTRADA y han pasado > 16h -> añade a la sesión una incidencia OLVIDO
+      (cierre automático, salvo anotar_olvido=False) y abre una nueva ENTRADA.
+    - Si el último fue ENTRADA (< 16h) -> SALIDA; en cualquier otro caso -> ENTRADA.
     """
-    if not uid:
-        return ""
-    cleaned = re.sub(r"[^0-9A-F]", "", uid.strip().upper())
-    if len(cleaned) % 2 == 1:
-        cleaned = "0" + cleaned
-    return cleaned
+    if not ultima_fecha:
+        return "ENTRADA"
+
+    segundos = (now - ultima_fecha).total_seconds()
+
+    if segundos < 60:
+        abort(429, message="Espera un minuto para volver a fichar.")
+
+    if ultimo_tipo != "ENTRADA":
+        return "ENTRADA"
+
+    horas = segundos / 3600
+    if horas <= 16:
+        return "SALIDA"
+
+    if anotar_olvido:
+        db.session.add(incidencia_olvido(trabajador_id, ultima_fecha, horas))
+    return "ENTRADA"
 
 
-def _uid_es_valido(uid_hex: str) -> bool:
+def _estado_para_decidir(trabajador_id):
     """
-    UID válido = HEX puro y no vacío.
+    Estado (último tipo/fecha) sobre el que decidir el siguiente fichaje.
+    - Normal: fila de estado_trabajador bloqueada (estado_para_fichar).
+    - Con diario de fichajes: lectura sin bloqueo (la escritura no va a la BD) con el último
+      fichaje pendiente del diario superpuesto si es más reciente. Es un objeto fuera de la sesión.
     """
-    return bool(uid_hex) and bool(_UID_RE.fullmatch(uid_hex))
+    diario = diario_activo()
+    if diario is None:
+        return estado_para_fichar(trabajador_id)
+
+    bd = estado_actual(trabajador_id)
+    estado = EstadoTrabajador(
+        id_trabajador=bd.id_trabajador,
+        ultimo_tipo=bd.ultimo_tipo,
+        ultimo_fecha_hora=bd.ultimo_fecha_hora
+    )
+    pendiente = diario.ultimo_pendiente(trabajador_id)
+    if pendiente and (estado.ultimo_fecha_hora is None or pendiente[1] >= estado.ultimo_fecha_hora):
+        estado.ultimo_tipo, estado.ultimo_fecha_hora = pendiente
+    return estado
 
 
-def _uid_invertido(uid_hex: str) -> str:
+def _crear_fichaje(trabajador: Trabajador, lat: float, lon: float, now: datetime | None = None, estado=None):
     """
-    Invierte el UID por bytes (endianness), por si el lector devuelve orden inverso.
-    Ej: A1B2C3D4 -> D4C3B2A1
+    Crea un fichaje alternando ENTRADA/SALIDA según el último fichaje (ver _decidir_tipo).
+
+    - now es inyectable para mantener consistencia temporal dentro del request.
+    - estado (de _estado_para_decidir) es inyectable para no releerlo; se actualiza en la misma transacción.
+    - Con diario de fichajes (DIARIO_FICHAJES_DIR) no se escribe en la BD: se anota en el diario y se
+      devuelve un Fichaje sin id; el volcado inserta el fichaje y, si procede, la incidencia OLVIDO.
     """
-    uid_hex = _normalizar_uid(uid_hex)
-    if len(uid_hex) < 2:
-        return uid_hex
+    if estado is None:
+        estado = _estado_para_decidir(trabajador.id_trabajador)
+
+    now = now or _local_now_naive()
+    diario = diario_activo()
+
+    tipo_nuevo = _decidir_tipo(
+        trabajador.id_trabajador, estado.ultimo_tipo, estado.ultimo_fecha_hora, now,
+        anotar_olvido=diario is None
+    )
 
-    if len(uid_hex) % 2 == 1:
-        uid_hex = "0" + uid_hex
+    if diario is not None:
+        olvido_desde = estado.ultimo_fecha_hora if estado.ultimo_tipo == "ENTRADA" and tipo_nuevo == "ENTRADA" else None
+        return diario.anotar(trabajador, tipo_nuevo, now, lat, lon, olvido_desde)
 
-    pares = [uid_hex[i:i + 2] for i in range(0, len(uid_hex), 2)]
-    pares.reverse()
-    return "".join(pares)
+    nuevo = Fichaje(
+        id_trabajador=trabajador.id_trabajador,
+        latitud=lat,
+        longitud=lon,
+        tipo=tipo_nuevo,
+        fecha_hora=now
+    )
+    db.session.add(nuevo)
+    db.session.flush()
+    registrar_fichaje(estado, nuevo)
+    recalcular_jornada(nuevo.id_trabajador, now.date())
+    db.session.commit()
+    return nuevo
 
 
-def _uids_equivalentes(uid_recibido_raw: str, uid_guardado_raw: str) -> bool:
+def _validar_nfc(trabajador: Trabajador, empresa: Empresa, nfc_data_raw):
     """
-    Decide si el UID recibido equivale al guardado, tolerando:
-    - separadores / 0x / mayúsculas
-    - inversión por bytes (endianness)
-    - ceros a la izquierda (dependiendo del lector)
+    Valida el NFC recibido según la política de la empresa:
+    - Si la empresa tiene NFC de oficina -> OBLIGATORIO y debe coincidir.
+    - Si la empresa NO tiene NFC de oficina -> si llega NFC, se valida contra el NFC del trabajador (si existe).
     """
-    recibido = _normalizar_uid(uid_recibido_raw)
-    guardado = _normalizar_uid(uid_guardado_raw)
+    nfc_oficina_requerido = normalizar_uid(getattr(empresa, "codigo_nfc_oficina", None))
 
-    if not _uid_es_valido(recibido) or not _uid_es_valido(guardado):
-        return False
+    if nfc_oficina_requerido:
+        nfc_recibido = normalizar_uid(nfc_data_raw)
+        if not nfc_recibido:
+            abort(400, message="Fichaje restringido: Debes escanear el punto NFC de la entrada.")
 
-    if recibido == guardado:
-        return True
+        uid_inv = uid_invertido(nfc_recibido)
 
-    r0 = recibido.lstrip("0")
-    g0 = guardado.lstrip("0")
-    if r0 and g0 and r0 == g0:
-        return True
+        if nfc_recibido != nfc_oficina_requerido and uid_inv != nfc_oficina_requerido:
+            abort(403, message="NFC Incorrecto. Escanea la etiqueta oficial de la entrada.")
+    else:
+        nfc_recibido = normalizar_uid(nfc_data_raw)
+        if nfc_recibido:
+            uid_guardado = normalizar_uid(getattr(trabajador, "codigo_nfc", None))
+            uid_inv = uid_invertido(nfc_recibido)
 
-    if _uid_invertido(recibido) == guardado:
-        return True
+            if not uid_guardado or (nfc_recibido != uid_guardado and uid_inv != uid_guardado):
+                abort(403, message="Código NFC no válido o no asignado a este usuario.")
 
-    if recibido == _uid_invertido(guardado):
-        return True
 
-    return False
+def _antirrebote_previo(clave, now: datetime, nfc: bool):
+    """
+    Rechazo de ráfagas sin SQL (ver utils.antirrebote) y reserva de la clave mientras se ficha.
+    - Si la caché conoce el último fichaje aplica las mismas reglas (8s NFC, 60s).
+    - Si no lo conoce no decide nada: lo hará la BD con estado_trabajador.
+    Quien llama debe liberar la clave (antirrebote.liberar) al terminar.
+    """
+    ultima = antirrebote.ultimo_fichaje(clave)
+    if ultima:
+        segundos = (now - ultima).total_seconds()
+        if nfc and segundos < 8:
+            abort(429, message="Lectura repetida NFC. Espera un momento y vuelve a acercar la tarjeta.")
+        if segundos < 60:
+            abort(429, message="Espera un minuto para volver a fichar.")
+
+    if not antirrebote.reclamar(clave):
+        if nfc:
+            abort(429, message="Lectura repetida NFC. Espera un momento y vuelve a acercar la tarjeta.")
+        abort(429, message="Ya hay un fichaje en curso. Espera un momento.")
+
+
+def _procesar_fichaje_comun(user_id, lat, lon, nfc_data_raw=None):
+    """
+    Punto único de entrada para fichar (manual o NFC).
+
+    Responsabilidades:
+    0) Antirrebote en memoria: corta las ráfagas antes de cualquier consulta.
+    1) Cargar trabajador + empresa.
+    2) Validar distancia GPS respecto a las geovallas de la empresa (y NFC propio de la sede, si lo tiene).
+    3) Validar NFC según política (ver _validar_nfc), salvo que ya se validara como etiqueta de sede.
+    4) Anti-doble lectura NFC: evita 2 requests seguidas al acercar la tarjeta.
+    5) Crear el fichaje (ENTRADA/SALIDA).
+    """
+    now = _local_now_naive()
+
+    # --- 0) Antirrebote (sin BD) ---
+    clave = antirrebote.clave_trabajador(user_id)
+    _antirrebote_previo(clave, now, bool(nfc_data_raw))
+
+    try:
+        trabajador = Trabajador.query.get_or_404(user_id)
+        empresa = trabajador.empresa
+
+        # --- 1) Validación GPS (geovallas de la empresa) ---
+        nfc_de_sede = _validar_distancia_empresa(empresa, lat, lon, nfc_data_raw)
+
+        # --- 2) Validación NFC (modo "NFC de oficina" vs "NFC personal") ---
+        if not nfc_de_sede:
+            _validar_nfc(trabajador, empresa, nfc_data_raw)
+
+        # --- 3) Anti-doble lectura NFC (estado por PK, se reutiliza al crear) ---
+        estado = _estado_para_decidir(trabajador.id_trabajador)
+        # Fallo de caché: lo que diga la BD sirve para cortar las siguientes repeticiones
+        antirrebote.recordar_fichaje(clave, estado.ultimo_fecha_hora, now)
+        if nfc_data_raw and estado.ultimo_fecha_hora:
+            segundos = (now - estado.ultimo_fecha_hora).total_seconds()
+            if segundos < 8:
+                abort(429, message="Lectura repetida NFC. Espera un momento y vuelve a acercar la tarjeta.")
+
+        # --- 4) Crear fichaje ---
+        nuevo = _crear_fichaje(trabajador, lat, lon, now=now, estado=estado)
+        antirrebote.recordar_fichaje(clave, nuevo.fecha_hora, now)
+        return nuevo
+    finally:
+        antirrebote.liberar(clave)
+
+
+def _fichaje_guardado(guardado):
+    """Fichaje de una clave de idempotencia: por id, o por (trabajador, fecha_hora) si se anotó en el diario."""
+    if isinstance(guardado, int):
+        return Fichaje.query.get(guardado)
+
+    trabajador_id, fecha_hora = guardado
+    fichaje = Fichaje.query.filter_by(id_trabajador=trabajador_id, fecha_hora=fecha_hora).first()
+    if fichaje is None:
+        diario = diario_activo()
+        fichaje = diario.pendiente(trabajador_id, fecha_hora) if diario else None
+    return fichaje
+
+
+def _idempotente(func):
+    """
+    Cabecera Idempotency-Key opcional (ver utils.idempotencia):
+    - Clave ya usada con éxito -> devuelve el mismo fichaje (201) sin volver a fichar.
+    - Clave en curso -> 409 (el cliente reintenta después).
+    - Si el fichaje falla, la clave se libera y el reintento se procesa de nuevo.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        clave_raw = (request.headers.get("Idempotency-Key") or "").strip()
+        if not clave_raw:
+            return func(*args, **kwargs)
+        if len(clave_raw) > idempotencia.MAX_LONGITUD_CLAVE:
+            abort(400, message="Idempotency-Key demasiado larga.")
+
+        clave = idempotencia.clave_usuario(get_jwt_identity(), clave_raw)
+
+        if not idempotencia.reservar(clave):
+            guardado = idempotencia.consultar(clave)
+            if guardado is None or guardado == idempotencia.EN_CURSO:
+                abort(409, message="Esta petición ya se está procesando. Reintenta en unos segundos.")
+            fichaje = _fichaje_guardado(guardado)
+            if fichaje is None:
+                abort(409, message="El fichaje de esta petición ya no existe.")
+            return fichaje
+
+        try:
+            fichaje = func(*args, **kwargs)
+        except BaseException:
+            idempotencia.liberar(clave)
+            raise
+        idempotencia.guardar(clave, fichaje)
+        return fichaje
+    return wrapper
 
 
 # ---------------------------------------------------------------------
-# CÁLCULO DE HORARIO (resumen mensual)
+# KIOSKO (lector NFC compartido)
 # ---------------------------------------------------------------------
 
-def _get_duration_seg(entrada, salida) -> int:
+def _trabajador_por_uid(empresa_id, uid_raw):
     """
-    Duración en segundos entre dos horas (time).
-    - Si cruza medianoche, suma 24h.
+    Resuelve la tarjeta a un trabajador de la empresa con una búsqueda indexada:
+    el UID recibido (canónico) se compara con nfc_canonico y nfc_invertido del trabajador.
     """
-    if not entrada or not salida:
-        return 0
-    d_entrada = datetime.combine(date.min, entrada)
-    d_salida = datetime.combine(date.min, salida)
-    diff = (d_salida - d_entrada).total_seconds()
-    if diff < 0:
-        diff += 86400
-    return int(diff)
+    uid = normalizar_uid(uid_raw)
+    if not uid_es_valido(uid):
+        abort(422, message="UID NFC no válido.")
+
+    candidatos = Trabajador.query.filter(
+        Trabajador.idEmpresa == empresa_id,
+        or_(Trabajador.nfc_canonico == uid, Trabajador.nfc_invertido == uid)
+    ).limit(2).all()
+
+    if not candidatos:
+        abort(404, message="Tarjeta no asignada a ningún empleado.")
+    if len(candidatos) > 1:
+        abort(409, message="Tarjeta ambigua: coincide con varios empleados.")
+    return candidatos[0]
 
 
-def _pair_punches_day(fichajes_day):
+def _procesar_fichaje_kiosko(terminal, uid_raw):
     """
-    Empareja fichajes ENTRADA/SALIDA en un día para calcular segundos trabajados.
-    Devuelve (worked_seconds, incomplete_flag).
+    Fichaje desde terminal kiosko: la tarjeta identifica al trabajador (sin JWT personal).
+    - El terminal está en un punto fijo de la empresa: no hay control GPS ni NFC de oficina.
+    - Se guardan las coordenadas del terminal (o las de la empresa si no tiene).
+    - Antirrebote por tarjeta antes de buscar al trabajador (el lector puede rebotar).
+    - Mismo anti-doble lectura NFC (8s) y reglas de _crear_fichaje.
     """
-    fichajes_day = sorted(fichajes_day, key=lambda f: f.fecha_hora)
-    worked = 0
-    incomplete = False
-    last_in = None
-    last_type = None
+    now = _local_now_naive()
 
-    for f in fichajes_day:
-        t = (f.tipo or "").strip().upper()
-        if t not in ("ENTRADA", "SALIDA"):
-            incomplete = True
-            continue
+    clave = antirrebote.clave_tarjeta(terminal.empresa_id, normalizar_uid(uid_raw))
+    _antirrebote_previo(clave, now, True)
 
-        if last_type == t:
-            incomplete = True
+    try:
+        trabajador = _trabajador_por_uid(terminal.empresa_id, uid_raw)
 
-        if t == "ENTRADA":
-            last_in = f.fecha_hora
-        else:
-            if last_in is None:
-                incomplete = True
-            else:
-                delta = int((f.fecha_hora - last_in).total_seconds())
-                if delta <= 0:
-                    incomplete = True
-                else:
-                    worked += delta
-                last_in = None
-        last_type = t
+        lat, lon = terminal.latitud, terminal.longitud
+        if lat is None or lon is None:
+            empresa = trabajador.empresa
+            lat, lon = empresa.latitud or 0.0, empresa.longitud or 0.0
 
-    if last_in is not None:
-        incomplete = True
+        estado = _estado_para_decidir(trabajador.id_trabajador)
+        antirrebote.recordar_fichaje(clave, estado.ultimo_fecha_hora, now)
+        if estado.ultimo_fecha_hora and (now - estado.ultimo_fecha_hora).total_seconds() < 8:
+            abort(429, message="Lectura repetida NFC. Espera un momento y vuelve a acercar la tarjeta.")
 
-    return worked, incomplete
+        nuevo = _crear_fichaje(trabajador, lat, lon, now=now, estado=estado)
+        antirrebote.recordar_fichaje(clave, nuevo.fecha_hora, now)
+        antirrebote.recordar_fichaje(antirrebote.clave_trabajador(trabajador.id_trabajador), nuevo.fecha_hora, now)
+        return nuevo
+    finally:
+        antirrebote.liberar(clave)
 
 
 # ---------------------------------------------------------------------
-# CREACIÓN DE FICHAJE (ENTRADA/SALIDA)
+# LOTE OFFLINE (sincronización de la app al recuperar cobertura)
 # ---------------------------------------------------------------------
 
-def _crear_fichaje(trabajador: Trabajador, lat: float, lon: float, now: datetime | None = None):
-    """
-    Crea un fichaje alternando ENTRADA/SALIDA según el último fichaje.
+# Tolerancia de reloj del dispositivo hacia el futuro.
+LOTE_MARGEN_FUTURO = timedelta(minutes=5)
 
-    Controles:
-    - Anti-doble click: si el último fichaje fue hace < 60s -> 429.
-    - Si el último fue ENTRADA y han pasado > 16h -> genera incidencia OLVIDO (cierre automático)
-      y abre una nueva ENTRADA.
-    - now es inyectable para mantener consistencia temporal dentro del request.
-    """
-    ultimo = (
-        Fichaje.query.filter_by(id_trabajador=trabajador.id_trabajador)
-        .order_by(Fichaje.fecha_hora.desc())
-        .first()
-    )
 
-    tipo_nuevo = "ENTRADA"
-    now = now or _local_now_naive()
+def _a_hora_local_naive(dt: datetime) -> datetime:
+    """Fecha del dispositivo -> hora Madrid naive (si viene con zona, se convierte; si no, se asume Madrid)."""
+    if dt.tzinfo is not None:
+        return dt.astimezone(TZ).replace(tzinfo=None)
+    return dt
 
-    if ultimo:
-        segundos = (now - ultimo.fecha_hora).total_seconds()
 
-        if segundos < 60:
-            abort(429, message="Espera un minuto para volver a fichar.")
+def _mensaje_error(err: HTTPException) -> str:
+    data = getattr(err, "data", None) or {}
+    return data.get("message") or err.description or err.name
 
-        if (ultimo.tipo or "").strip().upper() == "ENTRADA":
-            horas = segundos / 3600
-            if horas > 16:
-                inc = Incidencia(
-                    id_trabajador=trabajador.id_trabajador,
-                    tipo="OLVIDO",
-                    fecha_inicio=ultimo.fecha_hora.date(),
-                    fecha_fin=ultimo.fecha_hora.date(),
-                    comentario_trabajador=f"Autogenerada: Turno abierto de {int(horas)}h.",
-                    estado="PENDIENTE",
-                    comentario_admin="Cierre automático."
-                )
-                db.session.add(inc)
-                tipo_nuevo = "ENTRADA"
-            else:
-                tipo_nuevo = "SALIDA"
 
-    nuevo = Fichaje(
-        id_trabajador=trabajador.id_trabajador,
-        latitud=lat,
-        longitud=lon,
-        tipo=tipo_nuevo,
-        fecha_hora=now
-    )
-    db.session.add(nuevo)
-    db.session.commit()
-    return nuevo
-
-
-def _procesar_fichaje_comun(user_id, lat, lon, nfc_data_raw=None):
+def _procesar_lote(user_id, id_dispositivo: str, items: list):
     """
-    Punto único de entrada para fichar (manual o NFC).
+    Valida y guarda un lote de fichajes offline con la hora del dispositivo.
 
-    Responsabilidades:
-    1) Cargar trabajador + empresa.
-    2) Validar NFC según política:
-       - Si la empresa tiene NFC de oficina -> OBLIGATORIO y debe coincidir.
-       - Si la empresa NO tiene NFC de oficina -> si llega NFC, se valida contra el NFC del trabajador (si existe).
-    3) Validar distancia GPS respecto a la empresa.
-    4) Anti-doble lectura NFC: evita 2 requests seguidas al acercar la tarjeta.
-    5) Crear el fichaje (ENTRADA/SALIDA).
+    - Mismas reglas que _procesar_fichaje_comun (NFC, GPS, 8s NFC, 60s, alternancia, OLVIDO >16h),
+      pero los intervalos se miden entre horas del dispositivo, no con la hora del servidor.
+    - Un fichaje que ya existe (mismo trabajador y fecha_hora) se marca DUPLICADO: reenviar el lote es seguro.
+    - Un fichaje anterior al último registrado se rechaza (no se reescribe el histórico).
+    - Un fichaje de un mes cerrado por la empresa se rechaza (habría que reabrirlo).
+    - Los válidos se insertan en bloque en una sola transacción; el resultado es por elemento.
     """
     trabajador = Trabajador.query.get_or_404(user_id)
     empresa = trabajador.empresa
-
     now = _local_now_naive()
 
-    # --- 1) Validación NFC (modo "NFC de oficina" vs "NFC personal") ---
+    estado = estado_para_fichar(trabajador.id_trabajador)
 
-    nfc_oficina_requerido = _normalizar_uid(getattr(empresa, "codigo_nfc_oficina", None))
+    # Orden cronológico conservando el índice original para el resultado
+    ordenados = sorted(
+        ((i, item, _a_hora_local_naive(item["fecha_hora"])) for i, item in enumerate(items)),
+        key=lambda x: (x[2], x[0])
+    )
 
-    if nfc_oficina_requerido:
-        nfc_recibido = _normalizar_uid(nfc_data_raw)
-        if not nfc_recibido:
-            abort(400, message="Fichaje restringido: Debes escanear el punto NFC de la entrada.")
+    # Reenvíos: una sola consulta por rango sobre el índice (id_trabajador, fecha_hora)
+    existentes = {
+        f.fecha_hora
+        for f in Fichaje.query.filter(
+            Fichaje.id_trabajador == trabajador.id_trabajador,
+            Fichaje.fecha_hora >= ordenados[0][2],
+            Fichaje.fecha_hora <= ordenados[-1][2]
+        ).all()
+    }
 
-        uid_inv = _uid_invertido(nfc_recibido)
+    cerrados = meses_cerrados(trabajador.idEmpresa, ordenados[0][2].date(), ordenados[-1][2].date())
 
-        if nfc_recibido != nfc_oficina_requerido and uid_inv != nfc_oficina_requerido:
-            abort(403, message="NFC Incorrecto. Escanea la etiqueta oficial de la entrada.")
-    else:
-        nfc_recibido = _normalizar_uid(nfc_data_raw)
-        if nfc_recibido:
-            uid_guardado = _normalizar_uid(getattr(trabajador, "codigo_nfc", None))
-            uid_inv = _uid_invertido(nfc_recibido)
+    ultimo_tipo = estado.ultimo_tipo
+    ultima_fecha = estado.ultimo_fecha_hora
 
-            if not uid_guardado or (nfc_recibido != uid_guardado and uid_inv != uid_guardado):
-                abort(403, message="Código NFC no válido o no asignado a este usuario.")
+    # Fichajes en línea aún pendientes en el diario (si está activo) cuentan como último fichaje
+    diario = diario_activo()
+    pendiente = diario.ultimo_pendiente(trabajador.id_trabajador) if diario else None
+    if pendiente and (ultima_fecha is None or pendiente[1] >= ultima_fecha):
+        ultimo_tipo, ultima_fecha = pendiente
 
-    # --- 2) Validación GPS (radio empresa) ---
-    _validar_distancia_empresa(empresa, lat, lon)
+    resultados = [None] * len(items)
+    filas = []
 
-    # --- 3) Anti-doble lectura NFC ---
-    if nfc_data_raw:
-        ultimo = (
-            Fichaje.query.filter_by(id_trabajador=trabajador.id_trabajador)
-            .order_by(Fichaje.fecha_hora.desc())
-            .first()
-        )
-        if ultimo:
-            segundos = (now - ultimo.fecha_hora).total_seconds()
-            if segundos < 8:
-                abort(429, message="Lectura repetida NFC. Espera un momento y vuelve a acercar la tarjeta.")
+    for indice, item, fecha in ordenados:
+        if fecha in existentes:
+            resultados[indice] = {"indice": indice, "resultado": "DUPLICADO", "mensaje": "Fichaje ya registrado."}
+            continue
+
+        lat, lon, nfc_data_raw = item.get("latitud"), item.get("longitud"), item.get("nfc_data")
+        try:
+            if fecha > now + LOTE_MARGEN_FUTURO:
+                abort(422, message="La fecha del fichaje es posterior a la hora actual.")
+            if fecha.date().replace(day=1) in cerrados:
+                abort(409, message="El mes del fichaje está cerrado.")
+
+            if not _validar_distancia_empresa(empresa, lat, lon, nfc_data_raw):
+                _validar_nfc(trabajador, empresa, nfc_data_raw)
+
+            if ultima_fecha:
+                segundos = (fecha - ultima_fecha).total_seconds()
+                if segundos < 0:
+                    abort(409, message="Fichaje anterior al último registrado.")
+                if nfc_data_raw and segundos < 8:
+                    abort(429, message="Lectura repetida NFC. Espera un momento y vuelve a acercar la tarjeta.")
+
+            tipo = _decidir_tipo(trabajador.id_trabajador, ultimo_tipo, ultima_fecha, fecha)
+        except HTTPException as err:
+            resultados[indice] = {"indice": indice, "resultado": "RECHAZADO", "mensaje": _mensaje_error(err)}
+            continue
+
+        filas.append({
+            "id_trabajador": trabajador.id_trabajador,
+            "fecha_hora": fecha,
+            "tipo": tipo,
+            "latitud": lat if lat is not None else 0.0,
+            "longitud": lon if lon is not None else 0.0,
+            "id_dispositivo": id_dispositivo,
+        })
+        existentes.add(fecha)
+        ultimo_tipo, ultima_fecha = tipo, fecha
+        resultados[indice] = {"indice": indice, "resultado": "CREADO", "fecha_hora": fecha}
+
+    creados = []
+    if filas:
+        db.session.execute(insert(Fichaje), filas)
+        creados = Fichaje.query.filter(
+            Fichaje.id_trabajador == trabajador.id_trabajador,
+            Fichaje.fecha_hora.in_([f["fecha_hora"] for f in filas])
+        ).order_by(Fichaje.fecha_hora.asc()).all()
+        registrar_fichaje(estado, creados[-1])
+        recalcular_jornadas((trabajador.id_trabajador, f["fecha_hora"].date()) for f in filas)
+    db.session.commit()
+
+    por_fecha = {f.fecha_hora: f for f in creados}
+    for r in resultados:
+        if r["resultado"] == "CREADO":
+            r["fichaje"] = por_fecha.get(r.pop("fecha_hora"))
 
-    # --- 4) Crear fichaje ---
-    return _crear_fichaje(trabajador, lat, lon, now=now)
+    return {
+        "id_dispositivo": id_dispositivo,
+        "creados": len(creados),
+        "rechazados": sum(1 for r in resultados if r["resultado"] == "RECHAZADO"),
+        "resultados": resultados,
+    }
 
 
 # ---------------------------------------------------------------------
@@ -367,10 +564,11 @@ def _procesar_fichaje_comun(user_id, lat, lon, nfc_data_raw=None):
 class ResumenMensual(MethodView):
     """
     Resumen mensual:
-    - horas teóricas según horario (Franja + Dia)
-    - horas trabajadas emparejando ENTRADA/SALIDA
+    - horas teóricas según horario (semana compilada del horario)
+    - horas trabajadas emparejando ENTRADA/SALIDA (agregado jornada_diaria)
     - saldo = trabajadas - teóricas
     - marca días incompletos
+    - mes cerrado por la empresa: resumen congelado al cerrarlo (utils.cierres)
     """
     @jwt_required()
     @blp.arguments(ResumenMensualQuerySchema, location="query")
@@ -383,6 +581,11 @@ class ResumenMensual(MethodView):
         mes = args.get("mes") or now.month
         anio = args.get("anio") or now.year
 
+        # Mes cerrado: se sirve el resumen congelado tal cual
+        cerrado = resumen_cerrado(trabajador.id_trabajador, anio, mes) if 1 <= mes <= 12 else None
+        if cerrado:
+            return cerrado
+
         if not trabajador.idHorario:
             return {
                 "mes": f"{mes:02d}/{anio}",
@@ -394,14 +597,15 @@ class ResumenMensual(MethodView):
                 "saldo_seg": 0,
                 "dias_incompletos": [],
                 "num_dias_incompletos": 0,
-                "calculo_confiable": True
+                "calculo_confiable": True,
+                "cerrado": False
             }
 
         start_dt = datetime(anio, mes, 1)
         end_dt = datetime(anio + 1, 1, 1) if mes == 12 else datetime(anio, mes + 1, 1)
 
         TIPOS_AUSENCIA = {"VACACIONES", "BAJA", "ASUNTOS_PROPIOS"}
-        incidencias_aprobadas = Incidencia.query.filter(
+        ausencias = db.session.query(Incidencia.fecha_inicio, Incidencia.fecha_fin).filter(
             Incidencia.id_trabajador == user_id,
             Incidencia.estado == "APROBADA",
             Incidencia.tipo.in_(TIPOS_AUSENCIA),
@@ -409,53 +613,14 @@ class ResumenMensual(MethodView):
             Incidencia.fecha_fin >= start_dt.date()
         ).all()
 
-        dias_semana = {
-            0: "lunes", 1: "martes", 2: "miercoles", 3: "jueves",
-            4: "viernes", 5: "sabado", 6: "domingo"
-        }
-        nombre_to_weekday = {v: k for k, v in dias_semana.items()}
-        dia_id_to_weekday = {}
-
-        for d in Dia.query.all():
-            key = (d.nombre or "").strip().lower()
-            wd = nombre_to_weekday.get(key)
-            if wd is not None:
-                dia_id_to_weekday[d.id] = wd
-
-        segundos_teoricos_dia = {i: 0 for i in range(7)}
-        for f in Franja.query.filter_by(id_horario=trabajador.idHorario).all():
-            wd = dia_id_to_weekday.get(f.id_dia)
-            if wd is not None:
-                segundos_teoricos_dia[wd] += _get_duration_seg(f.hora_entrada, f.hora_salida)
-
-        fichajes = Fichaje.query.filter(
-            Fichaje.id_trabajador == user_id,
-            Fichaje.fecha_hora >= start_dt,
-            Fichaje.fecha_hora < end_dt
-        ).order_by(Fichaje.fecha_hora.asc()).all()
-
-        fichajes_por_dia = {}
-        for f in fichajes:
-            fichajes_por_dia.setdefault(f.fecha_hora.date(), []).append(f)
-
-        total_teorico_seg = 0
-        total_trabajado_seg = 0
-        dias_incompletos = []
-
-        curr = start_dt.date()
-        while curr < end_dt.date():
-            es_ausencia = any(inc.fecha_inicio <= curr <= inc.fecha_fin for inc in incidencias_aprobadas)
-            if not es_ausencia:
-                total_teorico_seg += segundos_teoricos_dia.get(curr.weekday(), 0)
-
-            punches = fichajes_por_dia.get(curr, [])
-            if punches:
-                worked, incomplete = _pair_punches_day(punches)
-                total_trabajado_seg += worked
-                if incomplete:
-                    dias_incompletos.append(curr.isoformat())
+        # Teórico: recuento de días de la semana del mes menos los tramos de ausencia fusionados
+        total_teorico_seg = segundos_teoricos(
+            semana_horario(trabajador.idHorario), start_dt.date(), end_dt.date(), ausencias
+        )
 
-            curr += timedelta(days=1)
+        # Trabajado: suma del agregado jornada_diaria (una fila por día con fichajes)
+        total_trabajado_seg, fechas_incompletas = resumen_jornadas(user_id, start_dt.date(), end_dt.date())
+        dias_incompletos = [d.isoformat() for d in fechas_incompletas]
 
         balance_seg = total_trabajado_seg - total_teorico_seg
 
@@ -469,19 +634,49 @@ class ResumenMensual(MethodView):
             "saldo_seg": balance_seg,
             "dias_incompletos": dias_incompletos,
             "num_dias_incompletos": len(dias_incompletos),
-            "calculo_confiable": len(dias_incompletos) == 0
+            "calculo_confiable": len(dias_incompletos) == 0,
+            "cerrado": False
         }
 
 
+@blp.route("/resumen-acumulado")
+class ResumenAcumulado(MethodView):
+    """
+    Saldo acumulado en un rango de fechas (ambas incluidas); por defecto, del 1 de enero a hoy.
+    - desde_alta=true: desde el primer día con fichajes del trabajador.
+    - Mismas cifras que sumar /resumen mes a mes, pero con sumas prefijas mensuales (saldo_mensual).
+    """
+    @jwt_required()
+    @blp.arguments(ResumenAcumuladoQuerySchema, location="query")
+    @blp.response(200, ResumenAcumuladoOutputSchema)
+    def get(self, args):
+        user_id = get_jwt_identity()
+        trabajador = Trabajador.query.get_or_404(user_id)
+
+        hoy = _local_now_naive().date()
+        hasta = args.get("hasta") or hoy
+        if args.get("desde_alta"):
+            desde = min(primer_dia(trabajador.id_trabajador) or hasta, hasta)
+        else:
+            desde = args.get("desde") or hoy.replace(month=1, day=1)
+
+        if desde > hasta:
+            abort(422, message="'desde' no puede ser posterior a 'hasta'.")
+
+        return resumen_acumulado(trabajador, desde, hasta)
+
+
 @blp.route("/fichar")
 class Fichar(MethodView):
     """
     Fichaje normal.
     Si la empresa exige NFC de oficina, este endpoint también lo validará si mandas nfc_data.
+    Admite Idempotency-Key para reintentos seguros desde la app.
     """
     @jwt_required()
     @blp.arguments(FichajeInputSchema)
     @blp.response(201, FichajeOutputSchema)
+    @_idempotente
     def post(self, data):
         user_id = get_jwt_identity()
         return _procesar_fichaje_comun(
@@ -496,10 +691,12 @@ class Fichar(MethodView):
 class FicharNFC(MethodView):
     """
     Fichaje vía NFC (mismo flujo, pero schema separado si lo necesitas en cliente).
+    Admite Idempotency-Key para reintentos seguros desde la app.
     """
     @jwt_required()
     @blp.arguments(FichajeNFCInputSchema)
     @blp.response(201, FichajeOutputSchema)
+    @_idempotente
     def post(self, data):
         user_id = get_jwt_identity()
         return _procesar_fichaje_comun(
@@ -510,6 +707,35 @@ class FicharNFC(MethodView):
         )
 
 
+@blp.route("/fichar-lote")
+class FicharLote(MethodView):
+    """
+    Sincronización offline: lote ordenado de fichajes con la hora del dispositivo.
+    Devuelve 200 con el resultado de cada elemento (CREADO / DUPLICADO / RECHAZADO).
+    """
+    @jwt_required()
+    @blp.arguments(FichajeLoteInputSchema)
+    @blp.response(200, FichajeLoteOutputSchema)
+    def post(self, data):
+        user_id = get_jwt_identity()
+        return _procesar_lote(user_id, data["id_dispositivo"], data["fichajes"])
+
+
+@blp.route("/kiosko/fichar")
+class FicharKiosko(MethodView):
+    """
+    Terminal compartido: se autentica con la cabecera X-Kiosko-Token (token de empresa)
+    y solo envía el UID de la tarjeta.
+    """
+    @blp.arguments(KioskoFichajeInputSchema)
+    @blp.response(201, KioskoFichajeOutputSchema)
+    def post(self, data):
+        terminal = terminal_por_token(request.headers.get("X-Kiosko-Token"))
+        if not terminal:
+            abort(401, message="Terminal kiosko no autorizado.")
+        return _procesar_fichaje_kiosko(terminal, data["uid"])
+
+
 @blp.route("/mis-fichajes")
 class MisFichajes(MethodView):
     """
@@ -3,7 +3,8 @@ from sqlalchemy import or_
 
 from models import Trabajador, Empresa
 from forms import LoginForm, RequestPasswordForm, ChangePasswordForm, ResetPasswordTokenForm
-from utils.email_sender import enviar_correo_password
+from utils.email_sender import correo_password
+from utils.envios import encolar_correo
 from utils.reset_tokens import generar_token_reset, validar_token_reset
 from itsdangerous import BadSignature, SignatureExpired
 
@@ -74,14 +75,12 @@ def reset_password_web():
             token = generar_token_reset(trabajador.id_trabajador)
             link = url_for("auth_web.reset_password_confirm", token=token, _external=True)
 
-            enviado = enviar_correo_password(trabajador.email, trabajador.nombre, link)
+            # Sale por la bandeja de salida: la respuesta no espera al servidor de correo
+            encolar_correo(trabajador.email, correo_password(trabajador.nombre, link))
+            db.session.commit()
 
-            if enviado:
-                flash("Si el correo existe, recibirás un enlace para restablecer tu contraseña.", "success")
-                return redirect(url_for("auth_web.login"))
-            else:
-                flash("Error al enviar el correo. Inténtalo más tarde.", "danger")
-                return redirect(url_for("auth_web.login"))
+            flash("Si el correo existe, recibirás un enlace para restablecer tu contraseña.", "success")
+            return redirect(url_for("auth_web.login"))
 
         flash("Si el correo existe, recibirás un enlace para restablecer tu contraseña.", "info")
         return redirect(url_for("auth_web.login"))
@@ -1,7 +1,8 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, session
-from models import Trabajador, Empresa, Rol, Horario, Fichaje
+from flask import Blueprint, render_template, redirect, url_for, flash, session, request
+from models import Trabajador, Empresa, Rol, Horario, Fichaje, SedeEmpresa
 from forms import EmpresaForm
 from utils.decorators import admin_required
+from utils.geovallas import invalidar_sedes
 from extensions import db
 
 # Blueprint que agrupa las vistas web relacionadas con la empresa (zona admin).
@@ -55,6 +56,7 @@ def empresa_view():
         # Guarda cambios con rollback si algo falla, y devuelve feedback al usuario.
         try:
             db.session.commit()
+            invalidar_sedes(empresa.id_empresa)
             flash("Datos de la empresa actualizados correctamente.", "success")
         except Exception as e:
             db.session.rollback()
@@ -62,4 +64,60 @@ def empresa_view():
 
         return redirect(url_for("empresa_web.empresa_view"))
 
-    return render_template("empresa.html", form=form)
+    sedes = SedeEmpresa.query.filter_by(empresa_id=empresa_id).order_by(SedeEmpresa.nombre).all()
+    return render_template("empresa.html", form=form, sedes=sedes)
+
+@empresa_bp.post("/empresa/sedes/nueva")
+@admin_required
+def sede_nueva():
+    # Alta de una sede adicional (geovalla propia) desde la vista de empresa.
+    empresa_id = session.get("empresa_id")
+    if not empresa_id:
+        return redirect(url_for("auth_web.login"))
+
+    nombre = (request.form.get("nombre") or "").strip()
+    codigo_nfc = (request.form.get("codigo_nfc") or "").strip().upper() or None
+    try:
+        latitud = float(request.form.get("latitud"))
+        longitud = float(request.form.get("longitud"))
+        radio = int(request.form.get("radio") or 100)
+    except (TypeError, ValueError):
+        flash("Coordenadas o radio no válidos.", "danger")
+        return redirect(url_for("empresa_web.empresa_view"))
+
+    if not nombre:
+        flash("La sede necesita un nombre.", "warning")
+        return redirect(url_for("empresa_web.empresa_view"))
+
+    try:
+        db.session.add(SedeEmpresa(
+            empresa_id=empresa_id,
+            nombre=nombre,
+            latitud=latitud,
+            longitud=longitud,
+            radio=radio,
+            codigo_nfc=codigo_nfc
+        ))
+        db.session.commit()
+        invalidar_sedes(empresa_id)
+        flash("Sede añadida.", "success")
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error al guardar: {str(e)}", "danger")
+
+    return redirect(url_for("empresa_web.empresa_view"))
+
+@empresa_bp.post("/empresa/sedes/<int:sede_id>/eliminar")
+@admin_required
+def sede_delete(sede_id):
+    # Baja de una sede: solo si pertenece a la empresa de la sesión.
+    sede = SedeEmpresa.query.get_or_404(sede_id)
+    if sede.empresa_id != session.get("empresa_id"):
+        flash("No tienes permiso para eliminar esta sede.", "danger")
+        return redirect(url_for("empresa_web.empresa_view"))
+
+    db.session.delete(sede)
+    db.session.commit()
+    invalidar_sedes(sede.empresa_id)
+    flash("Sede eliminada.", "success")
+    return redirect(url_for("empresa_web.empresa_view"))
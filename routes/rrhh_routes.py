@@ -3,12 +3,23 @@ Blueprint: rrhh_web
 Objetivo: panel RRHH (admin) para empleados, horarios/franjas, fichajes e incidencias.
 """
 
-from flask import Blueprint, render_template, redirect, url_for, flash, session, request
-from models import Trabajador, Rol, Horario, Franja, Fichaje, Empresa, Incidencia, Dia
+from flask import Blueprint, render_template, redirect, url_for, flash, session, request, Response, stream_with_context, jsonify, make_response, current_app
+from models import Trabajador, Rol, Horario, Franja, Fichaje, Empresa, Incidencia, Dia, CierreMes, Tarea
 from forms import TrabajadorForm, HorarioForm, FichajeManualForm, IncidenciaCrearForm, IncidenciaAdminForm
 from utils.decorators import admin_required
-from utils.email_sender import enviar_correo_resolucion, enviar_correo_ausencia
-from utils.firebase_sender import enviar_notificacion_push
+from utils import presencia
+from utils.email_sender import correo_resolucion
+from utils.envios import encolar_correo
+from utils.estado_trabajador import estado_para_fichar, registrar_fichaje, recalcular_estado
+from utils.jornada_diaria import recalcular_jornada, recalcular_jornadas, resumen_jornadas
+from utils.horarios import semana_horario, invalidar_horario, segundos_teoricos
+from utils.saldos import recalcular_teoricos, recalcular_teoricos_horario, ausencia_cambiada, resumen_acumulado
+from utils.cierres import mes_cerrado, cerrar_mes, reabrir_mes
+from utils.nomina import resumenes_empresa, csv_stream, xlsx_stream
+from utils.listado_fichajes import query_jornadas_empresa, pagina_jornadas, leer_cursor, FILTROS_ESTADO
+from utils.consultas import presupuesto_consultas
+from utils.importacion import leer_filas, validar, OBLIGATORIAS, OPCIONALES, MAX_ERRORES_PANTALLA
+from utils.tareas import encolar, cancelar, titulo_tipo, FINALES, COMPLETADA
 from extensions import db
 from datetime import datetime, timedelta, date, time
 import calendar
@@ -16,6 +27,36 @@ import calendar
 rrhh_bp = Blueprint('rrhh_web', __name__)
 
 
+def _parse_fecha(valor):
+    """Convierte 'YYYY-MM-DD' en date; devuelve None si falta o no es válida."""
+    if not valor:
+        return None
+    try:
+        return datetime.strptime(valor, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+def query_fichajes_empresa(empresa_id, empleado_id=None, desde=None, hasta=None):
+    """
+    Fichajes de la empresa con filtros opcionales.
+    Las fechas se filtran como rango semiabierto [desde 00:00, hasta+1 00:00) sobre fecha_hora
+    para poder usar el índice (id_trabajador, fecha_hora); nunca con DATE(fecha_hora).
+    """
+    query = Fichaje.query.join(Trabajador).filter(Trabajador.idEmpresa == empresa_id)
+
+    if empleado_id:
+        query = query.filter(Trabajador.id_trabajador == empleado_id)
+
+    if desde:
+        query = query.filter(Fichaje.fecha_hora >= datetime.combine(desde, time.min))
+
+    if hasta:
+        query = query.filter(Fichaje.fecha_hora < datetime.combine(hasta + timedelta(days=1), time.min))
+
+    return query
+
+
 def calcular_resumen_rango(empleado_id, start_date, end_date):
     """Calcula horas teóricas vs trabajadas en un rango (por horario + fichajes)."""
     trabajador = Trabajador.query.get(empleado_id)
@@ -27,47 +68,14 @@ def calcular_resumen_rango(empleado_id, start_date, end_date):
     if isinstance(end_date, date):
         end_date = datetime.combine(end_date, time.max)
 
-    dias_semana = {0: 'lunes', 1: 'martes', 2: 'miercoles', 3: 'jueves', 4: 'viernes', 5: 'sabado', 6: 'domingo'}
-    horas_por_weekday = {}
-
-    # Tabla: weekday -> segundos teóricos según franjas del horario
-    for wd, nombre_dia in dias_semana.items():
-        dia_bd = Dia.query.filter_by(nombre=nombre_dia).first()
-        if dia_bd:
-            franjas = Franja.query.filter_by(id_horario=trabajador.idHorario, id_dia=dia_bd.id).all()
-            total_seconds = 0
-            for f in franjas:
-                t_in = timedelta(hours=f.hora_entrada.hour, minutes=f.hora_entrada.minute)
-                t_out = timedelta(hours=f.hora_salida.hour, minutes=f.hora_salida.minute)
-                total_seconds += (t_out - t_in).total_seconds()
-            horas_por_weekday[wd] = total_seconds
-        else:
-            horas_por_weekday[wd] = 0
-
-    total_teorico_sec = 0
-    delta_days = (end_date - start_date).days + 1
-
-    for i in range(delta_days):
-        current_day = start_date + timedelta(days=i)
-        total_teorico_sec += horas_por_weekday.get(current_day.weekday(), 0)
-
-    # Empareja ENTRADA->SALIDA para estimar trabajado (lo no emparejado queda fuera)
-    fichajes = Fichaje.query.filter(
-        Fichaje.id_trabajador == empleado_id,
-        Fichaje.fecha_hora >= start_date,
-        Fichaje.fecha_hora <= end_date
-    ).order_by(Fichaje.fecha_hora).all()
+    desde = start_date.date()
+    hasta = end_date.date() + timedelta(days=1)
 
-    total_trabajado_sec = 0
-    pendientes = []
+    # Teórico: recuento de días de la semana del rango según la semana compilada del horario
+    total_teorico_sec = segundos_teoricos(semana_horario(trabajador.idHorario), desde, hasta)
 
-    for f in fichajes:
-        if f.tipo == 'ENTRADA':
-            pendientes.append(f)
-        elif f.tipo == 'SALIDA':
-            if pendientes:
-                ent = pendientes.pop()
-                total_trabajado_sec += (f.fecha_hora - ent.fecha_hora).total_seconds()
+    # Trabajado: suma del agregado jornada_diaria del rango, la misma fuente que el saldo acumulado
+    total_trabajado_sec, _ = resumen_jornadas(empleado_id, desde, hasta)
 
     horas_teoricas = total_teorico_sec / 3600
     horas_trabajadas = total_trabajado_sec / 3600
@@ -142,6 +150,50 @@ def empleado_new():
     return render_template("empleados_form.html", form=form, is_new=True)
 
 
+@rrhh_bp.route("/empleados/importar", methods=["GET", "POST"])
+@admin_required
+def empleados_importar():
+    empresa_id = session.get("empresa_id")
+    columnas = {"obligatorias": OBLIGATORIAS, "opcionales": OPCIONALES}
+
+    if request.method == "POST":
+        fichero = request.files.get("fichero")
+        if fichero is None or not fichero.filename:
+            flash("Elige un fichero CSV o XLSX.", "warning")
+            return redirect(url_for("rrhh_web.empleados_importar"))
+
+        datos = fichero.read()
+        try:
+            filas = leer_filas(fichero.filename, datos)
+        except ValueError as e:
+            flash(str(e), "danger")
+            return redirect(url_for("rrhh_web.empleados_importar"))
+
+        # Se valida todo aquí (pocas consultas) y solo el alta, que hashea contraseñas, va en segundo plano
+        altas, errores = validar(filas, empresa_id)
+        if errores:
+            flash(f"No se ha importado nada: {len(errores)} errores en {fichero.filename}.", "danger")
+            return render_template(
+                "empleados_importar.html",
+                **columnas,
+                errores=errores[:MAX_ERRORES_PANTALLA],
+                total_errores=len(errores),
+                total_filas=len(filas)
+            )
+        if not altas:
+            flash("El fichero no tiene empleados.", "warning")
+            return redirect(url_for("rrhh_web.empleados_importar"))
+
+        encolar(
+            "importar_empleados", empresa_id, session.get("user_id"),
+            entrada=datos, nombre=fichero.filename
+        )
+        flash(f"Importación de {len(altas)} empleados en marcha. Sigue su progreso en Tareas.", "info")
+        return redirect(url_for("rrhh_web.tareas_list"))
+
+    return render_template("empleados_importar.html", errores=None, **columnas)
+
+
 @rrhh_bp.route("/empleados/<int:emp_id>/editar", methods=["GET", "POST"])
 @admin_required
 def empleado_edit(emp_id):
@@ -173,6 +225,7 @@ def empleado_edit(emp_id):
         empleado.telef = form.telef.data
 
         empleado.idRol = form.rol_id.data
+        cambia_horario = empleado.idHorario != form.horario_id.data
         empleado.idHorario = form.horario_id.data
 
         # Contraseña: solo si viene nueva
@@ -185,6 +238,8 @@ def empleado_edit(emp_id):
             clean = raw.strip().upper().replace(":", "").replace("-", "").replace(" ", "") if raw else None
             empleado.codigo_nfc = clean
 
+        if cambia_horario:
+            recalcular_teoricos(empleado.id_trabajador)
         db.session.commit()
         flash("Datos actualizados correctamente.", "success")
         return redirect(url_for("rrhh_web.empleados_list"))
@@ -293,6 +348,7 @@ def horario_delete(horario_id):
 
         db.session.delete(horario)
         db.session.commit()
+        invalidar_horario(horario_id)
         flash("Horario eliminado.", "success")
 
     return redirect(url_for("rrhh_web.horarios_list"))
@@ -333,8 +389,12 @@ def horario_franjas(horario_id):
                         hora_entrada=datetime.strptime(h_inicio, "%H:%M").time(),
                         hora_salida=datetime.strptime(h_fin, "%H:%M").time()
                     )
+                    # Franja y horas teóricas de la plantilla se confirman juntas
                     db.session.add(nueva)
+                    db.session.flush()
+                    recalcular_teoricos_horario(horario_id)
                     db.session.commit()
+                    invalidar_horario(horario_id)
                     flash("Franja horaria añadida.", "success")
             except ValueError:
                 flash("Formato de hora inválido.", "danger")
@@ -364,6 +424,7 @@ def horario_update_dias(horario_id):
             setattr(horario, dia, valor)
 
     db.session.commit()
+    invalidar_horario(horario_id)
     flash("Días laborables actualizados.", "success")
     return redirect(url_for("rrhh_web.horario_franjas", horario_id=horario_id))
 
@@ -371,13 +432,17 @@ def horario_update_dias(horario_id):
 @rrhh_bp.post("/horarios/<int:horario_id>/franjas/delete/<int:dia_id>")
 @admin_required
 def franja_delete(horario_id, dia_id):
-    franja = Franja.query.get_or_404((dia_id, horario_id))
+    franja = Franja.query.get_or_404((horario_id, dia_id))
 
     if hasattr(franja.horario, 'empresa_id') and franja.horario.empresa_id != session.get("empresa_id"):
         return redirect(url_for("rrhh_web.horarios_list"))
 
+    # Borrado y horas teóricas de la plantilla se confirman juntos
     db.session.delete(franja)
+    db.session.flush()
+    recalcular_teoricos_horario(horario_id)
     db.session.commit()
+    invalidar_horario(horario_id)
     flash("Franja eliminada.", "success")
     return redirect(url_for("rrhh_web.horario_franjas", horario_id=horario_id))
 
@@ -388,97 +453,43 @@ def franja_delete(horario_id, dia_id):
 
 @rrhh_bp.get("/fichajes")
 @admin_required
+@presupuesto_consultas(25)
 def fichajes_list():
     empresa_id = session.get("empresa_id")
 
     filtro_empleado = request.args.get('empleado_id', type=int)
     filtro_desde = request.args.get('fecha_desde')
     filtro_hasta = request.args.get('fecha_hasta')
+    filtro_estado = request.args.get('estado') if request.args.get('estado') in FILTROS_ESTADO else None
+
+    query = query_jornadas_empresa(
+        empresa_id,
+        empleado_id=filtro_empleado,
+        desde=_parse_fecha(filtro_desde),
+        hasta=_parse_fecha(filtro_hasta),
+        estado=filtro_estado
+    )
 
-    query = Fichaje.query.join(Trabajador).filter(Trabajador.idEmpresa == empresa_id)
-
-    if filtro_empleado:
-        query = query.filter(Trabajador.id_trabajador == filtro_empleado)
-
-    if filtro_desde:
-        query = query.filter(db.func.date(Fichaje.fecha_hora) >= filtro_desde)
-
-    if filtro_hasta:
-        query = query.filter(db.func.date(Fichaje.fecha_hora) <= filtro_hasta)
-
-    fichajes_raw = query.order_by(Fichaje.fecha_hora.asc()).limit(2000).all()
-
-    jornadas = []
-    pendientes = {}
-
-    # Reconstrucción de jornadas por empleado (detecta huérfanos y entradas sin salida)
-    for f in fichajes_raw:
-        emp_id = f.id_trabajador
-
-        if f.tipo == 'ENTRADA':
-            if emp_id in pendientes:
-                prev = pendientes[emp_id]
-                jornadas.append({
-                    'trabajador': prev.trabajador,
-                    'entrada': prev,
-                    'salida': None,
-                    'duracion': "Error: Sin salida",
-                    'status': 'error',
-                    'is_zombie': True,
-                    'fecha_ref': prev.fecha_hora
-                })
-            pendientes[emp_id] = f
-
-        elif f.tipo == 'SALIDA':
-            if emp_id in pendientes:
-                ent = pendientes.pop(emp_id)
-                delta = f.fecha_hora - ent.fecha_hora
-                horas = delta.total_seconds() / 3600
-                status = 'warning' if horas > 12 else 'closed'
-                duracion_txt = f"{int(horas)}h {int((horas*60)%60)}m"
-
-                jornadas.append({
-                    'trabajador': ent.trabajador,
-                    'entrada': ent,
-                    'salida': f,
-                    'duracion': duracion_txt,
-                    'status': status,
-                    'is_long': (status == 'warning'),
-                    'fecha_ref': ent.fecha_hora
-                })
-            else:
-                jornadas.append({
-                    'trabajador': f.trabajador,
-                    'entrada': None,
-                    'salida': f,
-                    'duracion': "Error: Sin entrada",
-                    'status': 'error',
-                    'is_orphan': True,
-                    'fecha_ref': f.fecha_hora
-                })
-
-    # Entradas pendientes al final: activas o demasiado largas
-    for emp_id, ent in pendientes.items():
-        delta = datetime.now() - ent.fecha_hora
-        horas = delta.total_seconds() / 3600
-        status = 'error' if horas > 16 else 'active'
-        duracion_txt = f"En curso ({int(horas)}h)"
-
-        jornadas.append({
-            'trabajador': ent.trabajador,
-            'entrada': ent,
-            'salida': None,
-            'duracion': duracion_txt,
-            'status': status,
-            'is_active': (status == 'active'),
-            'fecha_ref': ent.fecha_hora
-        })
-
-    jornadas.sort(key=lambda x: x['fecha_ref'], reverse=True)
-    empleados = Trabajador.query.filter_by(idEmpresa=empresa_id).order_by(Trabajador.nombre).all()
+    # Una página de turnos guardados (cursor sobre fecha_ref, id_turno); "Cargar más" pide la siguiente
+    jornadas, siguiente = pagina_jornadas(query, leer_cursor(request.args.get('cursor')))
+    url_siguiente = url_for(
+        'rrhh_web.fichajes_list',
+        empleado_id=filtro_empleado,
+        fecha_desde=filtro_desde or None,
+        fecha_hasta=filtro_hasta or None,
+        estado=filtro_estado,
+        cursor=siguiente
+    ) if siguiente else None
+
+    if request.args.get('parcial'):
+        # Solo las filas, para añadirlas a la tabla ya pintada
+        respuesta = make_response(render_template("fichajes_filas.html", jornadas=jornadas))
+        respuesta.headers["X-Siguiente"] = url_siguiente or ""
+        return respuesta
 
     # Resumen solo cuando hay empleado seleccionado (con rango explícito o mes actual)
     resumen = None
+    acumulado = None
     if filtro_empleado:
         if not filtro_desde or not filtro_hasta:
             today = date.today()
@@ -495,6 +506,13 @@ def fichajes_list():
 
         resumen = calcular_resumen_rango(filtro_empleado, start_date, end_date)
 
+        # Saldo acumulado del año hasta el final del periodo (sumas prefijas mensuales)
+        empleado = Trabajador.query.get(filtro_empleado)
+        if resumen and empleado and empleado.idEmpresa == empresa_id:
+            acumulado = resumen_acumulado(empleado, date(end_date.year, 1, 1), end_date)
+
+    empleados = Trabajador.query.filter_by(idEmpresa=empresa_id).order_by(Trabajador.nombre).all()
+
     return render_template(
         "fichajes_list.html",
         jornadas=jornadas,
@@ -502,7 +520,43 @@ def fichajes_list():
         filtro_empleado=filtro_empleado,
         filtro_desde=filtro_desde,
         filtro_hasta=filtro_hasta,
-        resumen=resumen
+        filtro_estado=filtro_estado,
+        filtros_estado=FILTROS_ESTADO,
+        resumen=resumen,
+        acumulado=acumulado,
+        siguiente=url_siguiente,
+        # Exportación para nómina: por defecto, el mes anterior
+        mes_exportar=(date.today().replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+    )
+
+
+@rrhh_bp.get("/fichajes/exportar")
+@admin_required
+def fichajes_exportar():
+    """Resumen del mes de toda la plantilla para nómina (CSV o XLSX), generado en streaming."""
+    empresa_id = session.get("empresa_id")
+    try:
+        inicio = datetime.strptime(request.args.get("mes", ""), '%Y-%m').date()
+    except ValueError:
+        flash("Indica un mes válido para exportar.", "warning")
+        return redirect(url_for("rrhh_web.fichajes_list"))
+
+    formato = request.args.get("formato", "csv").lower()
+    resumenes = resumenes_empresa(empresa_id, inicio.year, inicio.month)
+    nombre = f"resumen_{inicio.strftime('%Y_%m')}"
+
+    if formato == "xlsx":
+        cuerpo = xlsx_stream(resumenes, nombre_hoja=inicio.strftime('%m-%Y'))
+        mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        formato = "csv"
+        cuerpo = csv_stream(resumenes)
+        mimetype = "text/csv; charset=utf-8"
+
+    return Response(
+        stream_with_context(cuerpo),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.{formato}"'}
     )
 
 
@@ -521,6 +575,10 @@ def fichaje_nuevo():
         form.longitud.data = empresa.longitud
 
     if form.validate_on_submit():
+        if mes_cerrado(empresa_id, form.fecha_hora.data):
+            flash("Ese mes está cerrado: reábrelo en Cierres de mes para añadir fichajes.", "danger")
+            return render_template("fichaje_manual.html", form=form, titulo="Nuevo Fichaje")
+
         lat = form.latitud.data if form.latitud.data is not None else (empresa.latitud or 0.0)
         lon = form.longitud.data if form.longitud.data is not None else (empresa.longitud or 0.0)
 
@@ -532,6 +590,9 @@ def fichaje_nuevo():
             longitud=lon
         )
         db.session.add(nuevo_fichaje)
+        db.session.flush()
+        registrar_fichaje(estado_para_fichar(nuevo_fichaje.id_trabajador), nuevo_fichaje)
+        recalcular_jornada(nuevo_fichaje.id_trabajador, nuevo_fichaje.fecha_hora.date())
         db.session.commit()
         flash("Fichaje manual creado con éxito.", "success")
         return redirect(url_for("rrhh_web.fichajes_list"))
@@ -553,6 +614,10 @@ def fichaje_editar(fichaje_id):
         flash("No tienes permiso para editar este fichaje.", "danger")
         return redirect(url_for("rrhh_web.fichajes_list"))
 
+    if mes_cerrado(fichaje.trabajador.idEmpresa, fichaje.fecha_hora):
+        flash("El fichaje es de un mes cerrado: reábrelo en Cierres de mes para editarlo.", "danger")
+        return redirect(url_for("rrhh_web.fichajes_list"))
+
     form = FichajeManualForm(obj=fichaje)
 
     empresa_id = session.get("empresa_id")
@@ -560,7 +625,18 @@ def fichaje_editar(fichaje_id):
     form.trabajador_id.choices = [(t.id_trabajador, f"{t.nombre} {t.apellidos}") for t in empleados]
 
     if form.validate_on_submit():
+        if mes_cerrado(empresa_id, form.fecha_hora.data):
+            flash("Ese mes está cerrado: reábrelo en Cierres de mes para mover fichajes a él.", "danger")
+            return render_template("fichaje_manual.html", form=form, titulo="Editar Fichaje")
+
+        # El fichaje puede cambiar de día o de trabajador: se recalculan ambas jornadas
+        antes = (fichaje.id_trabajador, fichaje.fecha_hora.date())
         form.populate_obj(fichaje)
+        db.session.flush()
+        recalcular_estado(fichaje.id_trabajador)
+        if antes[0] != fichaje.id_trabajador:
+            recalcular_estado(antes[0])
+        recalcular_jornadas([antes, (fichaje.id_trabajador, fichaje.fecha_hora.date())])
         db.session.commit()
         flash("Fichaje actualizado correctamente.", "success")
         return redirect(url_for("rrhh_web.fichajes_list"))
@@ -621,6 +697,8 @@ def incidencia_nueva():
             comentario_admin="Creada manualmente por Administración."
         )
         db.session.add(nueva_incidencia)
+        db.session.flush()
+        ausencia_cambiada(nueva_incidencia)
         db.session.commit()
         flash("Incidencia registrada y aprobada.", "success")
         return redirect(url_for("rrhh_web.incidencias_list"))
@@ -641,20 +719,23 @@ def incidencia_resolver(incidencia_id):
     form = IncidenciaAdminForm(obj=incidencia)
 
     if form.validate_on_submit():
+        estado_anterior = incidencia.estado
         incidencia.estado = form.estado.data
         incidencia.comentario_admin = form.comentario_admin.data
-        db.session.commit()
+        if incidencia.estado != estado_anterior:
+            db.session.flush()
+            ausencia_cambiada(incidencia)
 
-        # Notificación por email al cerrar la incidencia
-        enviar_correo_resolucion(
-            destinatario=incidencia.trabajador.email,
+        # Notificación por email al cerrar la incidencia (sale de la bandeja de salida tras el commit)
+        encolar_correo(incidencia.trabajador.email, correo_resolucion(
             nombre=incidencia.trabajador.nombre,
             tipo_incidencia=incidencia.tipo,
             estado=incidencia.estado,
             comentario_admin=incidencia.comentario_admin,
             f_inicio=incidencia.fecha_inicio,
             f_fin=incidencia.fecha_fin
-        )
+        ))
+        db.session.commit()
 
         flash(f"Incidencia {incidencia.estado.lower()} y empleado notificado.", "success")
         return redirect(url_for("rrhh_web.incidencias_list"))
@@ -674,6 +755,8 @@ def incidencia_delete(incidencia_id):
 
     try:
         db.session.delete(incidencia)
+        db.session.flush()
+        ausencia_cambiada(incidencia)
         db.session.commit()
         flash("Incidencia eliminada correctamente.", "success")
     except Exception as e:
@@ -690,9 +773,15 @@ def fichaje_delete(fichaje_id):
     if fichaje.trabajador.idEmpresa != session.get("empresa_id"):
         flash("No tienes permiso para eliminar este fichaje.", "danger")
         return redirect(url_for("rrhh_web.fichajes_list"))
+    if mes_cerrado(fichaje.trabajador.idEmpresa, fichaje.fecha_hora):
+        flash("El fichaje es de un mes cerrado: reábrelo en Cierres de mes para eliminarlo.", "danger")
+        return redirect(url_for("rrhh_web.fichajes_list"))
 
     try:
         db.session.delete(fichaje)
+        db.session.flush()
+        recalcular_estado(fichaje.id_trabajador)
+        recalcular_jornada(fichaje.id_trabajador, fichaje.fecha_hora.date())
         db.session.commit()
         flash("Registro de fichaje eliminado correctamente.", "success")
     except Exception as e:
@@ -702,6 +791,58 @@ def fichaje_delete(fichaje_id):
     return redirect(url_for("rrhh_web.fichajes_list"))
 
 
+# =========================
+# CIERRES DE MES
+# =========================
+
+@rrhh_bp.get("/cierres")
+@admin_required
+def cierres_list():
+    empresa_id = session.get("empresa_id")
+    cierres = CierreMes.query.filter_by(empresa_id=empresa_id).order_by(CierreMes.mes.desc()).all()
+    hoy = date.today()
+    # Por defecto se propone el mes anterior (el último que se puede cerrar)
+    propuesto = (hoy.replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+    return render_template("cierres_list.html", cierres=cierres, propuesto=propuesto)
+
+
+@rrhh_bp.post("/cierres/cerrar")
+@admin_required
+def cierre_mes_nuevo():
+    empresa_id = session.get("empresa_id")
+    try:
+        inicio = datetime.strptime(request.form.get("mes", ""), '%Y-%m').date()
+    except ValueError:
+        flash("Indica un mes válido.", "warning")
+        return redirect(url_for("rrhh_web.cierres_list"))
+
+    try:
+        cerrar_mes(empresa_id, inicio.year, inicio.month, session.get("user_id"))
+        flash(f"Mes {inicio.month:02d}/{inicio.year} cerrado: sus resúmenes quedan congelados.", "success")
+    except ValueError as e:
+        db.session.rollback()
+        flash(str(e), "danger")
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error al cerrar el mes: {str(e)}", "danger")
+
+    return redirect(url_for("rrhh_web.cierres_list"))
+
+
+@rrhh_bp.post("/cierres/<int:anio>/<int:mes>/reabrir")
+@admin_required
+def cierre_mes_reabrir(anio, mes):
+    empresa_id = session.get("empresa_id")
+    try:
+        reabrir_mes(empresa_id, anio, mes)
+        flash(f"Mes {mes:02d}/{anio} reabierto: ya se pueden corregir sus fichajes.", "success")
+    except ValueError as e:
+        db.session.rollback()
+        flash(str(e), "danger")
+
+    return redirect(url_for("rrhh_web.cierres_list"))
+
+
 # =========================
 # NOTIFICACIONES AUSENCIAS (manual)
 # =========================
@@ -709,57 +850,129 @@ def fichaje_delete(fichaje_id):
 @rrhh_bp.post("/notificaciones/ejecutar-ausencias")
 @admin_required
 def ejecutar_notificaciones_ausencia():
-    print("--- EJECUTANDO NOTIFICACIONES (FIREBASE + EMAIL) ---")
+    # El barrido recorre la plantilla y deja los avisos en la bandeja de salida: va en segundo plano
+    encolar("notificar_ausencias", session.get("empresa_id"), session.get("user_id"))
+    flash("Verificación de ausencias en marcha. Sigue su progreso en Tareas.", "info")
+    return redirect(url_for('rrhh_web.tareas_list'))
 
-    DIAS_SEMANA = {0: "lunes", 1: "martes", 2: "miercoles", 3: "jueves", 4: "viernes", 5: "sabado", 6: "domingo"}
-    hoy = date.today()
-    nombre_dia = DIAS_SEMANA[hoy.weekday()]
-
-    dia_db = Dia.query.filter_by(nombre=nombre_dia).first()
-    if not dia_db:
-        flash(f"Error: No existe el día '{nombre_dia}' en la base de datos.", "danger")
-        return redirect(url_for('rrhh_web.fichajes_list'))
-
-    trabajadores = Trabajador.query.all()
-    detectados = 0
-    enviados_email = 0
-    enviados_push = 0
-
-    for t in trabajadores:
-        if not t.idHorario:
-            continue
-
-        franja_hoy = Franja.query.filter_by(id_horario=t.idHorario, id_dia=dia_db.id).first()
-        if not franja_hoy:
-            continue
-
-        fichaje = Fichaje.query.filter(
-            Fichaje.id_trabajador == t.id_trabajador,
-            Fichaje.tipo == 'ENTRADA',
-            db.func.date(Fichaje.fecha_hora) == hoy
-        ).first()
-
-        if not fichaje:
-            detectados += 1
-            print(f"⚠️ Ausencia detectada: {t.nombre} {t.apellidos}")
-
-            # Prioriza push si hay token, y refuerza por email si existe
-            if t.fcm_token:
-                titulo = "ALERTA DE AUSENCIA"
-                cuerpo = f"Hola {t.nombre}, tienes turno hoy y no has fichado."
-                exito_push = enviar_notificacion_push(t.fcm_token, titulo, cuerpo)
-                if exito_push:
-                    enviados_push += 1
-
-            if t.email:
-                exito_email = enviar_correo_ausencia(t.email, t.nombre)
-                if exito_email:
-                    enviados_email += 1
-
-    msg = f"Revisión completada. Ausentes: {detectados}. Push enviados: {enviados_push}. Emails: {enviados_email}."
-    if detectados == 0:
-        flash("Todos han fichado correctamente hoy.", "success")
+
+# =========================
+# TAREAS EN SEGUNDO PLANO
+# =========================
+
+def _tarea_empresa(tarea_id):
+    """Tarea de la empresa en sesión, o None."""
+    tarea = Tarea.query.get(tarea_id)
+    if tarea is None or tarea.empresa_id != session.get("empresa_id"):
+        return None
+    return tarea
+
+
+def _estado_tarea(tarea):
+    return {
+        "id": tarea.id_tarea,
+        "tipo": titulo_tipo(tarea.tipo),
+        "estado": tarea.estado,
+        "progreso": tarea.progreso,
+        "total": tarea.total,
+        "porcentaje": round(100 * tarea.progreso / tarea.total) if tarea.total else (100 if tarea.estado == COMPLETADA else 0),
+        "mensaje": tarea.mensaje,
+        "terminada": tarea.estado in FINALES,
+        "descarga": url_for("rrhh_web.tarea_descargar", tarea_id=tarea.id_tarea) if tarea.resultado_nombre else None,
+    }
+
+
+@rrhh_bp.get("/tareas")
+@admin_required
+def tareas_list():
+    tareas = Tarea.query.filter_by(empresa_id=session.get("empresa_id")).order_by(
+        Tarea.creada_en.desc(), Tarea.id_tarea.desc()
+    ).limit(30).all()
+    mes_exportar = (date.today().replace(day=1) - timedelta(days=1)).strftime('%Y-%m')
+    return render_template(
+        "tareas_list.html",
+        tareas=[(t, _estado_tarea(t)) for t in tareas],
+        mes_exportar=mes_exportar
+    )
+
+
+@rrhh_bp.post("/tareas/exportar")
+@admin_required
+def tarea_exportar():
+    try:
+        inicio = datetime.strptime(request.form.get("mes", ""), '%Y-%m').date()
+    except ValueError:
+        flash("Indica un mes válido para exportar.", "warning")
+        return redirect(url_for("rrhh_web.tareas_list"))
+
+    formato = "xlsx" if request.form.get("formato") == "xlsx" else "csv"
+    encolar(
+        "exportar_resumen", session.get("empresa_id"), session.get("user_id"),
+        anio=inicio.year, mes=inicio.month, formato=formato
+    )
+    flash(f"Exportación de {inicio.strftime('%m/%Y')} en marcha.", "info")
+    return redirect(url_for("rrhh_web.tareas_list"))
+
+
+@rrhh_bp.get("/tareas/<int:tarea_id>/estado")
+@admin_required
+def tarea_estado(tarea_id):
+    """Estado y progreso de la tarea en JSON (la página de tareas lo consulta cada pocos segundos)."""
+    tarea = _tarea_empresa(tarea_id)
+    if tarea is None:
+        return jsonify({"error": "Tarea no encontrada."}), 404
+    return jsonify(_estado_tarea(tarea))
+
+
+@rrhh_bp.post("/tareas/<int:tarea_id>/cancelar")
+@admin_required
+def tarea_cancelar(tarea_id):
+    tarea = _tarea_empresa(tarea_id)
+    if tarea is None:
+        flash("Tarea no encontrada.", "danger")
+    elif cancelar(tarea):
+        flash("Cancelación solicitada.", "success")
     else:
-        flash(msg, "warning")
+        flash("La tarea ya había terminado.", "warning")
+    return redirect(url_for("rrhh_web.tareas_list"))
 
-    return redirect(url_for('rrhh_web.fichajes_list'))
+
+@rrhh_bp.get("/tareas/<int:tarea_id>/descargar")
+@admin_required
+def tarea_descargar(tarea_id):
+    tarea = _tarea_empresa(tarea_id)
+    if tarea is None or tarea.estado != COMPLETADA or not tarea.resultado_nombre:
+        flash("No hay nada que descargar para esa tarea.", "warning")
+        return redirect(url_for("rrhh_web.tareas_list"))
+
+    return Response(
+        tarea.resultado,
+        mimetype=tarea.resultado_tipo,
+        headers={"Content-Disposition": f'attachment; filename="{tarea.resultado_nombre}"'}
+    )
+
+
+# =========================
+# PRESENCIA EN VIVO
+# =========================
+
+@rrhh_bp.get("/presencia")
+@admin_required
+def presencia_view():
+    _, filas = presencia.tablero(session.get("empresa_id"))
+    return render_template(
+        "presencia.html",
+        dentro=[f for f in filas if f["dentro"]],
+        fuera=[f for f in filas if not f["dentro"]]
+    )
+
+
+@rrhh_bp.get("/presencia/stream")
+@admin_required
+def presencia_stream():
+    # Sin stream_with_context: la sesión de BD se libera al volver y el flujo solo espera en memoria
+    return Response(
+        presencia.flujo(current_app._get_current_object(), session.get("empresa_id")),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
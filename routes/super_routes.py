@@ -2,6 +2,7 @@ from flask import Blueprint, render_template, redirect, url_for, flash, session
 from models import Empresa, Rol
 from forms import EmpresaForm, RolForm
 from utils.decorators import superadmin_required
+from utils.geovallas import invalidar_sedes
 from extensions import db
 
 super_bp = Blueprint('super_web', __name__)
@@ -51,6 +52,7 @@ def empresa_edit(empresa_id):
         empresa.radio = form.radio.data
 
         db.session.commit()
+        invalidar_sedes(empresa.id_empresa)
         flash("Empresa actualizada correctamente.", "success")
         return redirect(url_for("super_web.empresas_list"))
 
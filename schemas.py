@@ -110,6 +110,42 @@ class ResumenMensualOutputSchema(Schema):
     teoricas = fields.Float()
     trabajadas = fields.Float()
     saldo = fields.Float()
+    cerrado = fields.Boolean()
+
+class ResumenMensualEmpleadoSchema(ResumenMensualOutputSchema):
+    id_trabajador = fields.Int()
+    nombre = fields.String()
+    apellidos = fields.String()
+    teoricas_seg = fields.Int()
+    trabajadas_seg = fields.Int()
+    saldo_seg = fields.Int()
+    dias_incompletos = fields.List(fields.String())
+    num_dias_incompletos = fields.Int()
+    calculo_confiable = fields.Boolean()
+
+class CierreMesInputSchema(Schema):
+    anio = fields.Int(required=True, validate=validate.Range(min=2000, max=2100))
+    mes = fields.Int(required=True, validate=validate.Range(min=1, max=12))
+
+class CierreMesSchema(Schema):
+    mes = fields.Date()
+    cerrado_en = fields.DateTime()
+    cerrado_por = fields.Int(allow_none=True)
+
+class ResumenAcumuladoQuerySchema(Schema):
+    desde = fields.Date(load_default=None)
+    hasta = fields.Date(load_default=None)
+    desde_alta = fields.Boolean(load_default=False)
+
+class ResumenAcumuladoOutputSchema(Schema):
+    desde = fields.Date()
+    hasta = fields.Date()
+    teoricas = fields.Float()
+    trabajadas = fields.Float()
+    saldo = fields.Float()
+    teoricas_seg = fields.Int()
+    trabajadas_seg = fields.Int()
+    saldo_seg = fields.Int()
 
 class FcmTokenSchema(Schema):
     token = fields.String(required=True)
@@ -119,5 +155,53 @@ class FichajeNFCInputSchema(Schema):
     latitud = fields.Float(load_default=None)
     longitud = fields.Float(load_default=None)
 
+class FichajeLoteItemSchema(Schema):
+    fecha_hora = fields.DateTime(required=True)
+    latitud = fields.Float(load_default=None)
+    longitud = fields.Float(load_default=None)
+    nfc_data = fields.String(load_default=None)
+
+class FichajeLoteInputSchema(Schema):
+    id_dispositivo = fields.String(required=True, validate=validate.Length(min=1, max=64))
+    fichajes = fields.List(
+        fields.Nested(FichajeLoteItemSchema()),
+        required=True,
+        validate=validate.Length(min=1, max=500)
+    )
+
+class FichajeLoteResultadoSchema(Schema):
+    indice = fields.Int()
+    resultado = fields.String()
+    mensaje = fields.String()
+    fichaje = fields.Nested(FichajeOutputSchema(), allow_none=True)
+
+class FichajeLoteOutputSchema(Schema):
+    id_dispositivo = fields.String()
+    creados = fields.Int()
+    rechazados = fields.Int()
+    resultados = fields.List(fields.Nested(FichajeLoteResultadoSchema()))
+
+class KioskoCrearSchema(Schema):
+    nombre = fields.String(required=True, validate=validate.Length(min=1, max=120))
+    latitud = fields.Float(load_default=None)
+    longitud = fields.Float(load_default=None)
+
+class KioskoSchema(Schema):
+    id_terminal = fields.Int(dump_only=True)
+    nombre = fields.String(dump_only=True)
+    latitud = fields.Float(dump_only=True)
+    longitud = fields.Float(dump_only=True)
+    activo = fields.Bool(dump_only=True)
+    fecha_alta = fields.DateTime(dump_only=True)
+    token = fields.String(dump_only=True)
+
+class KioskoFichajeInputSchema(Schema):
+    uid = fields.String(required=True)
+
+class KioskoFichajeOutputSchema(FichajeOutputSchema):
+    id_trabajador = fields.Int(dump_only=True)
+    nombre = fields.String(attribute="trabajador.nombre", dump_only=True)
+    apellidos = fields.String(attribute="trabajador.apellidos", dump_only=True)
+
 class ResetPasswordRequestSchema(Schema):
     email = fields.Str(required=True)
\ No newline at end of file
@@ -0,0 +1,33 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // "Cargar más": pide solo las filas de la siguiente página y las añade a la tabla.
+    // Sin JS el enlace sigue funcionando y abre la siguiente página completa.
+    var boton = document.getElementById('cargar-mas');
+    var tabla = document.getElementById('filas-jornadas');
+    if (!boton || !tabla) return;
+
+    boton.addEventListener('click', function(e) {
+        e.preventDefault();
+        if (boton.classList.contains('disabled')) return;
+        boton.classList.add('disabled');
+
+        var url = boton.getAttribute('href');
+        fetch(url + (url.indexOf('?') === -1 ? '?' : '&') + 'parcial=1', { credentials: 'same-origin' })
+            .then(function(r) {
+                if (!r.ok) throw new Error(r.status);
+                return r.text().then(function(html) {
+                    tabla.insertAdjacentHTML('beforeend', html);
+                    var siguiente = r.headers.get('X-Siguiente');
+                    if (siguiente) {
+                        boton.setAttribute('href', siguiente);
+                        boton.classList.remove('disabled');
+                    } else {
+                        boton.parentNode.removeChild(boton);
+                    }
+                });
+            })
+            .catch(function() {
+                // Si falla la petición, se navega a la página como sin JS
+                window.location.href = url;
+            });
+    });
+});
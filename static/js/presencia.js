@@ -0,0 +1,45 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // Tablero en vivo: el servidor manda la plantilla completa en cada cambio (SSE)
+    var tablero = document.getElementById('tablero-presencia');
+    if (!tablero || !window.EventSource) return;
+
+    var conexion = document.getElementById('estado-conexion');
+
+    function fila(t) {
+        var li = document.createElement('li');
+        li.className = 'list-group-item d-flex justify-content-between align-items-center fw-bold';
+        var nombre = document.createElement('span');
+        nombre.textContent = t.nombre;
+        li.appendChild(nombre);
+        if (t.desde) {
+            var desde = document.createElement('span');
+            desde.className = 'small text-muted font-monospace';
+            desde.textContent = t.desde.substring(11, 16) + ' · ' + t.desde.substring(8, 10) + '/' + t.desde.substring(5, 7);
+            li.appendChild(desde);
+        }
+        return li;
+    }
+
+    function pintar(id, filas) {
+        var lista = document.getElementById('lista-' + id);
+        lista.innerHTML = '';
+        filas.forEach(function(t) { lista.appendChild(fila(t)); });
+        document.getElementById('total-' + id).textContent = filas.length;
+    }
+
+    function marcar(texto, clase) {
+        conexion.className = 'badge border border-dark p-2 ' + clase;
+        conexion.textContent = texto;
+    }
+
+    var fuente = new EventSource(tablero.dataset.streamUrl);
+    fuente.addEventListener('presencia', function(e) {
+        var filas = JSON.parse(e.data);
+        pintar('dentro', filas.filter(function(t) { return t.dentro; }));
+        pintar('fuera', filas.filter(function(t) { return !t.dentro; }));
+        marcar('EN VIVO', 'bg-success text-white');
+    });
+    fuente.onopen = function() { marcar('EN VIVO', 'bg-success text-white'); };
+    // EventSource se reconecta solo; mientras tanto se avisa de que los datos pueden estar atrasados
+    fuente.onerror = function() { marcar('RECONECTANDO', 'bg-warning'); };
+});
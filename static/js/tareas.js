@@ -0,0 +1,37 @@
+document.addEventListener('DOMContentLoaded', function() {
+    // Filas de tareas aún en marcha: se consulta su estado cada pocos segundos
+    var INTERVALO_MS = 2000;
+    var filas = Array.prototype.filter.call(
+        document.querySelectorAll('.fila-tarea'),
+        function(fila) { return fila.dataset.terminada !== 'true'; }
+    );
+    if (!filas.length) return;
+
+    function consultar() {
+        var pendientes = filas.length;
+        var alguna_terminada = false;
+
+        filas.forEach(function(fila) {
+            fetch(fila.dataset.estadoUrl, { credentials: 'same-origin' })
+                .then(function(r) { return r.json(); })
+                .then(function(estado) {
+                    var barra = fila.querySelector('.barra-tarea');
+                    barra.style.width = estado.porcentaje + '%';
+                    barra.textContent = estado.porcentaje + '%';
+                    fila.querySelector('.mensaje-tarea').textContent =
+                        estado.estado + (estado.mensaje ? ' · ' + estado.mensaje : '');
+                    if (estado.terminada) alguna_terminada = true;
+                })
+                .catch(function() {})
+                .finally(function() {
+                    pendientes -= 1;
+                    if (pendientes > 0) return;
+                    // Al terminar alguna, se recarga para mostrar descarga y estado final
+                    if (alguna_terminada) window.location.reload();
+                    else setTimeout(consultar, INTERVALO_MS);
+                });
+        });
+    }
+
+    setTimeout(consultar, INTERVALO_MS);
+});
@@ -0,0 +1,173 @@
+"""
+Antirrebote de fichajes en memoria: rechaza ráfagas antes de tocar la BD.
+
+Un lector NFC que rebota dispara 5-10 peticiones en 2s con la misma tarjeta. Aquí se guarda,
+por clave (trabajador o tarjeta), la hora del último fichaje aceptado y una marca "en curso",
+de modo que las repeticiones se rechazan sin SQL. Si la clave no está, decide la BD como siempre
+(estado_trabajador): la caché solo adelanta rechazos, nunca autoriza un fichaje.
+
+Almacén:
+- Por defecto, un mapa TTL en el proceso (AlmacenLocal).
+- Con ANTIRREBOTE_REDIS_URL configurado (y redis instalado), uno compartido entre workers.
+- configurar_almacen() permite sustituirlo (p. ej. por un AlmacenLocal propio en pruebas).
+"""
+
+import threading
+import time
+from datetime import datetime
+
+from flask import current_app
+
+try:
+    import redis
+except ImportError:  # dependencia opcional
+    redis = None
+
+# Ventana máxima que importa recordar (regla de 60s entre fichajes).
+VENTANA_SEGUNDOS = 60
+
+# Vida de la marca "en curso": cubre una petición lenta sin bloquear si el proceso muere.
+EN_CURSO_SEGUNDOS = 5
+
+PREFIJO = "antirrebote:"
+
+
+class AlmacenLocal:
+    """Mapa clave -> (caduca, valor) con bloqueo; acotado a max_entradas."""
+
+    def __init__(self, max_entradas=10000):
+        self.max_entradas = max_entradas
+        self._datos = {}
+        self._lock = threading.Lock()
+
+    def _purgar(self, ahora):
+        caducadas = [k for k, (caduca, _) in self._datos.items() if caduca <= ahora]
+        for k in caducadas:
+            del self._datos[k]
+        # Si sigue lleno, se descartan las más antiguas (orden de inserción)
+        sobrantes = len(self._datos) - self.max_entradas
+        for k in list(self._datos)[:max(sobrantes, 0)]:
+            del self._datos[k]
+
+    def get(self, clave):
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None:
+                return None
+            if entrada[0] <= ahora:
+                del self._datos[clave]
+                return None
+            return entrada[1]
+
+    def set(self, clave, valor, ttl):
+        ahora = time.monotonic()
+        with self._lock:
+            self._datos.pop(clave, None)
+            self._datos[clave] = (ahora + ttl, valor)
+            if len(self._datos) > self.max_entradas:
+                self._purgar(ahora)
+
+    def add(self, clave, valor, ttl) -> bool:
+        """Guarda solo si la clave no existe (o caducó). Devuelve si la guardó."""
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is not None and entrada[0] > ahora:
+                return False
+            self._datos.pop(clave, None)
+            self._datos[clave] = (ahora + ttl, valor)
+            if len(self._datos) > self.max_entradas:
+                self._purgar(ahora)
+            return True
+
+    def delete(self, clave):
+        with self._lock:
+            self._datos.pop(clave, None)
+
+
+class AlmacenRedis:
+    """Mismo contrato que AlmacenLocal sobre Redis (SET NX/PX), compartido entre procesos."""
+
+    def __init__(self, url, prefijo=PREFIJO):
+        self._cliente = redis.Redis.from_url(url, decode_responses=True)
+        self._prefijo = prefijo
+
+    def get(self, clave):
+        return self._cliente.get(self._prefijo + clave)
+
+    def set(self, clave, valor, ttl):
+        self._cliente.set(self._prefijo + clave, valor, px=int(ttl * 1000))
+
+    def add(self, clave, valor, ttl) -> bool:
+        return bool(self._cliente.set(self._prefijo + clave, valor, px=int(ttl * 1000), nx=True))
+
+    def delete(self, clave):
+        self._cliente.delete(self._prefijo + clave)
+
+
+def crear_almacen(prefijo=PREFIJO, max_entradas=10000):
+    """Almacén según la config: Redis si ANTIRREBOTE_REDIS_URL está definido (y redis instalado), si no local."""
+    url = current_app.config.get("ANTIRREBOTE_REDIS_URL")
+    if url and redis is not None:
+        return AlmacenRedis(url, prefijo)
+    if url:
+        current_app.logger.warning("ANTIRREBOTE_REDIS_URL configurado pero redis no está instalado: se usa memoria local.")
+    return AlmacenLocal(max_entradas)
+
+
+_almacen = None
+_almacen_lock = threading.Lock()
+
+
+def configurar_almacen(almacen):
+    """Fija el almacén a usar (None -> se vuelve a elegir según la config en el próximo uso)."""
+    global _almacen
+    with _almacen_lock:
+        _almacen = almacen
+
+
+def almacen():
+    global _almacen
+    if _almacen is None:
+        with _almacen_lock:
+            if _almacen is None:
+                _almacen = crear_almacen()
+    return _almacen
+
+
+def clave_trabajador(trabajador_id) -> str:
+    return f"t:{trabajador_id}"
+
+
+def clave_tarjeta(empresa_id, uid) -> str:
+    return f"nfc:{empresa_id}:{uid}"
+
+
+def ultimo_fichaje(clave):
+    """Hora (naive Madrid) del último fichaje recordado para la clave, o None si no se sabe."""
+    valor = almacen().get(clave)
+    return datetime.fromisoformat(valor) if valor else None
+
+
+def recordar_fichaje(clave, fecha_hora: datetime, now: datetime):
+    """Recuerda el último fichaje solo mientras siga dentro de la ventana de rechazo."""
+    if fecha_hora is None:
+        return
+    restante = VENTANA_SEGUNDOS - (now - fecha_hora).total_seconds()
+    if restante > 0:
+        almacen().set(clave, fecha_hora.isoformat(), restante)
+
+
+def reclamar(clave) -> bool:
+    """Marca la clave como "fichando". False si ya hay otra petición en curso para ella."""
+    return almacen().add(clave + ":en_curso", "1", EN_CURSO_SEGUNDOS)
+
+
+def liberar(clave):
+    almacen().delete(clave + ":en_curso")
+
+
+def olvidar(clave):
+    """Descarta lo recordado (p. ej. tras editar o borrar fichajes desde RRHH)."""
+    almacen().delete(clave)
@@ -0,0 +1,110 @@
+"""
+Barrido manual de ausencias: avisa (push y email) a quien tiene turno hoy y no ha fichado la entrada.
+Se lanza desde el panel RRHH como tarea en segundo plano (utils.tareas); los avisos se dejan en la
+bandeja de salida (utils.envios), que los manda por lotes al terminar.
+
+- Solo la plantilla de la empresa que lo lanza.
+- Los ausentes salen de una sola consulta por conjuntos: trabajadores con horario que trabaja hoy,
+  sin ausencia aprobada que cubra hoy y sin ENTRADA hoy (NOT EXISTS sobre los índices de fichaje
+  e incidencia). Qué horarios trabajan hoy lo dicen las semanas cacheadas de utils.horarios.
+- Coste fijo: un puñado de consultas y un INSERT de avisos (utils.envios.encolar_varios), tenga la
+  empresa 30 o 3.000 trabajadores.
+"""
+
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from flask import current_app
+from sqlalchemy import and_, exists
+
+from extensions import db
+from models import Trabajador, Fichaje, Incidencia
+from utils.email_sender import correo_ausencia
+from utils.envios import encolar_varios
+from utils.horarios import semanas_horarios
+
+TIPOS_AUSENCIA = {"VACACIONES", "BAJA", "ASUNTOS_PROPIOS"}
+
+TZ = ZoneInfo("Europe/Madrid")
+
+
+def _local_now_naive():
+    """Hora local de España sin tzinfo, como se guardan los fichajes."""
+    return datetime.now(TZ).replace(tzinfo=None)
+
+
+def horarios_con_turno(empresa_id, hoy) -> list:
+    """Ids de los horarios de la plantilla que tienen alguna franja el día de la semana de `hoy`."""
+    ids_horario = {
+        h for (h,) in db.session.query(Trabajador.idHorario).filter(
+            Trabajador.idEmpresa == empresa_id,
+            Trabajador.idHorario.isnot(None)
+        ).distinct()
+    }
+    semanas = semanas_horarios(ids_horario)
+    return sorted(h for h in ids_horario if semanas[h][hoy.weekday()].franjas)
+
+
+def query_ausentes(empresa_id, hoy, ids_horario):
+    """Trabajadores de la empresa con turno hoy (sus horarios en `ids_horario`) sin ausencia aprobada ni ENTRADA."""
+    # Rango semiabierto del día (sargable sobre el índice de fichaje)
+    inicio_hoy = datetime.combine(hoy, time.min)
+    inicio_manana = inicio_hoy + timedelta(days=1)
+
+    entrada_hoy = exists().where(and_(
+        Fichaje.id_trabajador == Trabajador.id_trabajador,
+        Fichaje.tipo == 'ENTRADA',
+        Fichaje.fecha_hora >= inicio_hoy,
+        Fichaje.fecha_hora < inicio_manana
+    ))
+    ausencia_hoy = exists().where(and_(
+        Incidencia.id_trabajador == Trabajador.id_trabajador,
+        Incidencia.estado == "APROBADA",
+        Incidencia.tipo.in_(TIPOS_AUSENCIA),
+        Incidencia.fecha_inicio <= hoy,
+        Incidencia.fecha_fin >= hoy
+    ))
+
+    return db.session.query(
+        Trabajador.id_trabajador, Trabajador.nombre, Trabajador.apellidos,
+        Trabajador.email, Trabajador.fcm_token
+    ).filter(
+        Trabajador.idEmpresa == empresa_id,
+        Trabajador.idHorario.in_(ids_horario),
+        ~entrada_hoy,
+        ~ausencia_hoy
+    ).order_by(Trabajador.id_trabajador)
+
+
+def notificar_ausencias_hoy(empresa_id, hoy=None, avanzar=None):
+    """
+    Encola los avisos a los ausentes de hoy de la empresa (con commit).
+    `avanzar(hecho, total)` recibe el progreso. Devuelve {"detectados", "push", "email"} (avisos encolados).
+    """
+    hoy = hoy or _local_now_naive().date()
+    cuenta = {"detectados": 0, "push": 0, "email": 0}
+
+    ids_horario = horarios_con_turno(empresa_id, hoy)
+    ausentes = query_ausentes(empresa_id, hoy, ids_horario).all() if ids_horario else []
+    if avanzar:
+        avanzar(0, len(ausentes))
+
+    correos, pushes = [], []
+    for i, t in enumerate(ausentes, 1):
+        cuenta["detectados"] += 1
+        current_app.logger.info("Ausencia detectada: %s %s", t.nombre, t.apellidos)
+
+        # Push si hay token y refuerzo por email si existe
+        if t.fcm_token:
+            pushes.append((t.fcm_token, "ALERTA DE AUSENCIA", f"Hola {t.nombre}, tienes turno hoy y no has fichado."))
+        if t.email:
+            correos.append((t.email, correo_ausencia(t.nombre)))
+
+        if avanzar:
+            avanzar(i, len(ausentes))
+
+    # Todos los avisos en un INSERT; la bandeja de salida los manda por lotes tras el commit
+    encolar_varios(correos, pushes)
+    db.session.commit()
+    cuenta["push"], cuenta["email"] = len(pushes), len(correos)
+    return cuenta
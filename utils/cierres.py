@@ -0,0 +1,124 @@
+"""
+Cierre de mes por empresa: congela el resumen mensual de cada trabajador (tabla resumen_cerrado).
+
+- Solo se cierra un mes ya terminado; el resumen se calcula en bloque (resumen_mensual_empresa).
+- Un mes cerrado se sirve tal cual desde el resumen congelado (/resumen, /empresa/resumen-mensual y
+  las sumas prefijas del saldo), aunque después cambien ausencias u horarios.
+- Los fichajes de un mes cerrado no se crean, editan ni borran: hay que reabrirlo antes
+  (reabrir_mes descarta los resúmenes congelados y el mes vuelve a calcularse en vivo).
+"""
+
+from datetime import date
+
+from extensions import db
+from models import Trabajador, CierreMes, ResumenCerrado
+from utils.resumen_empresa import resumen_mensual_empresa
+from utils.saldos import verificar_serie
+
+
+def _mes(fecha):
+    return date(fecha.year, fecha.month, 1)
+
+
+def mes_cerrado(empresa_id, fecha) -> bool:
+    """¿Está cerrado el mes de `fecha` (date o datetime) en la empresa?"""
+    return CierreMes.query.get((empresa_id, _mes(fecha))) is not None
+
+
+def meses_cerrados(empresa_id, desde, hasta) -> set:
+    """Meses (día 1) cerrados de la empresa que tocan [desde, hasta] (fechas)."""
+    return {
+        mes for (mes,) in db.session.query(CierreMes.mes).filter(
+            CierreMes.empresa_id == empresa_id,
+            CierreMes.mes >= _mes(desde),
+            CierreMes.mes <= hasta
+        )
+    }
+
+
+def _rehacer_series(empresa_id):
+    """Ajusta las sumas prefijas del saldo de la plantilla al nuevo estado de cierre (sin commit)."""
+    for trabajador in Trabajador.query.filter_by(idEmpresa=empresa_id).all():
+        verificar_serie(trabajador, reparar=True)
+
+
+def cerrar_mes(empresa_id, anio, mes, admin_id=None, hoy=None) -> CierreMes:
+    """
+    Cierra el mes: guarda el resumen de cada trabajador de la empresa y lo confirma.
+    ValueError si el mes no ha terminado o ya estaba cerrado.
+    """
+    inicio = date(anio, mes, 1)
+    hoy = hoy or date.today()
+    if inicio >= _mes(hoy):
+        raise ValueError("Solo se pueden cerrar meses ya terminados.")
+    if mes_cerrado(empresa_id, inicio):
+        raise ValueError(f"El mes {mes:02d}/{anio} ya está cerrado.")
+
+    cierre = CierreMes(empresa_id=empresa_id, mes=inicio, cerrado_por=admin_id)
+    db.session.add(cierre)
+    for r in resumen_mensual_empresa(empresa_id, anio, mes):
+        cierre.resumenes.append(ResumenCerrado(
+            id_trabajador=r["id_trabajador"],
+            mes=inicio,
+            teoricas_seg=r["teoricas_seg"],
+            trabajadas_seg=r["trabajadas_seg"],
+            saldo_seg=r["saldo_seg"],
+            dias_incompletos=",".join(r["dias_incompletos"])
+        ))
+    db.session.flush()
+    _rehacer_series(empresa_id)
+    db.session.commit()
+    return cierre
+
+
+def reabrir_mes(empresa_id, anio, mes):
+    """
+    Reabre el mes: descarta los resúmenes congelados (vuelve a calcularse en vivo) y lo confirma.
+    ValueError si no estaba cerrado.
+    """
+    cierre = CierreMes.query.get((empresa_id, date(anio, mes, 1)))
+    if cierre is None:
+        raise ValueError(f"El mes {mes:02d}/{anio} no está cerrado.")
+
+    db.session.delete(cierre)
+    db.session.flush()
+    _rehacer_series(empresa_id)
+    db.session.commit()
+
+
+def _resumen(r: ResumenCerrado):
+    dias_inc = r.dias_incompletos.split(",") if r.dias_incompletos else []
+    return {
+        "mes": f"{r.mes.month:02d}/{r.mes.year}",
+        "teoricas": round(r.teoricas_seg / 3600, 2),
+        "trabajadas": round(r.trabajadas_seg / 3600, 2),
+        "saldo": round(r.saldo_seg / 3600, 2),
+        "teoricas_seg": r.teoricas_seg,
+        "trabajadas_seg": r.trabajadas_seg,
+        "saldo_seg": r.saldo_seg,
+        "dias_incompletos": dias_inc,
+        "num_dias_incompletos": len(dias_inc),
+        "calculo_confiable": len(dias_inc) == 0,
+        "cerrado": True
+    }
+
+
+def resumen_cerrado(trabajador_id, anio, mes):
+    """Resumen congelado del trabajador en ese mes (mismos campos que /resumen), o None si no lo hay."""
+    r = ResumenCerrado.query.get((trabajador_id, date(anio, mes, 1)))
+    return _resumen(r) if r is not None else None
+
+
+def resumen_cerrado_empresa(empresa_id, anio, mes):
+    """Resúmenes congelados de la plantilla (como resumen_mensual_empresa), ordenados por apellidos y nombre."""
+    filas = db.session.query(ResumenCerrado, Trabajador.nombre, Trabajador.apellidos).join(
+        Trabajador, Trabajador.id_trabajador == ResumenCerrado.id_trabajador
+    ).filter(
+        ResumenCerrado.empresa_id == empresa_id,
+        ResumenCerrado.mes == date(anio, mes, 1)
+    ).order_by(Trabajador.apellidos, Trabajador.nombre).all()
+
+    return [
+        {"id_trabajador": r.id_trabajador, "nombre": nombre, "apellidos": apellidos, **_resumen(r)}
+        for r, nombre, apellidos in filas
+    ]
@@ -0,0 +1,217 @@
+"""
+Contraseñas fuera del hilo de la petición: hash y verificación en un pool acotado por proceso.
+
+- hashear / verificar mandan el cálculo (scrypt o pbkdf2, que sueltan el GIL mientras trabajan) a
+  CLAVES_HILOS hilos propios. La petición espera su resultado, pero en la ola de logins de la
+  mañana como mucho CLAVES_HILOS hashes compiten por la CPU con los fichajes.
+- Contrapresión: caben CLAVES_HILOS + CLAVES_COLA trabajos (en curso y en cola). Con el pool
+  lleno se espera como mucho CLAVES_ESPERA segundos y después salta ClavesSaturadas, que es un 503
+  con Retry-After: mejor que el móvil reintente que dejar a todo el proceso esperando.
+- metricas() da en curso, en cola, capacidad y rechazados; registrar_claves añade la cabecera
+  X-Claves-Cola a las respuestas que han usado el pool y el log avisa cuando la cola pasa de la mitad.
+- Un hash hecho con otro método que CLAVES_METODO se rehace tras un login correcto, en el pool y
+  sin esperarlo: UPDATE condicionado a que el hash no haya cambiado entretanto. Así se puede subir
+  el coste sin tocar la latencia de nadie.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from flask import current_app, g, has_app_context, has_request_context
+from sqlalchemy import update
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from extensions import db
+
+# Valores por defecto si no hay app (seed_data, scripts).
+METODO = "scrypt:32768:8:1"
+HILOS = os.cpu_count() or 2
+COLA = 64
+ESPERA_SEGUNDOS = 2.0
+
+# Segundos que se pide esperar al cliente cuando el pool está lleno.
+REINTENTO_SEGUNDOS = 2
+
+
+class ClavesSaturadas(ServiceUnavailable):
+    """El pool de contraseñas está lleno; la API lo responde como 503 con Retry-After."""
+
+    def __init__(self):
+        super().__init__()
+        self.data = {
+            "message": "Servidor ocupado, vuelve a intentarlo en unos segundos",
+            "headers": {"Retry-After": str(REINTENTO_SEGUNDOS)},
+        }
+
+
+class _Pool:
+    def __init__(self, hilos, cola):
+        self.pid = os.getpid()
+        self.hilos = hilos
+        self.capacidad = hilos + cola
+        self.ejecutor = ThreadPoolExecutor(max_workers=hilos, thread_name_prefix="claves")
+        self.huecos = threading.BoundedSemaphore(self.capacidad)
+        self.cerrojo = threading.Lock()
+        self.pendientes = 0   # en curso + en cola
+        self.en_curso = 0
+        self.rechazados = 0
+
+    def _correr(self, funcion, args):
+        with self.cerrojo:
+            self.en_curso += 1
+        try:
+            return funcion(*args)
+        finally:
+            with self.cerrojo:
+                self.en_curso -= 1
+                self.pendientes -= 1
+            self.huecos.release()
+
+    def enviar(self, funcion, *args, espera=None):
+        """Future del trabajo, o None si no cabe tras esperar `espera` segundos (0: sin esperar)."""
+        hueco = self.huecos.acquire(timeout=espera) if espera else self.huecos.acquire(blocking=False)
+        if not hueco:
+            with self.cerrojo:
+                self.rechazados += 1
+            return None
+
+        with self.cerrojo:
+            self.pendientes += 1
+        try:
+            return self.ejecutor.submit(self._correr, funcion, args)
+        except RuntimeError:
+            with self.cerrojo:
+                self.pendientes -= 1
+            self.huecos.release()
+            raise
+
+
+_pool = None
+_creando = threading.Lock()
+
+
+def _config(clave, defecto):
+    return current_app.config.get(clave, defecto) if has_app_context() else defecto
+
+
+def _pool_proceso() -> _Pool:
+    """Pool de este proceso; tras un fork se crea otro (los hilos no pasan al hijo)."""
+    global _pool
+    pool = _pool
+    if pool is not None and pool.pid == os.getpid():
+        return pool
+    with _creando:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = _Pool(_config("CLAVES_HILOS", HILOS), _config("CLAVES_COLA", COLA))
+        return _pool
+
+
+def metricas() -> dict:
+    """Estado del pool de este proceso: en_curso, en_cola, capacidad y rechazados."""
+    pool = _pool_proceso()
+    with pool.cerrojo:
+        return {
+            "en_curso": pool.en_curso,
+            "en_cola": pool.pendientes - pool.en_curso,
+            "capacidad": pool.capacidad,
+            "rechazados": pool.rechazados,
+        }
+
+
+def _esperar(funcion, *args):
+    """Ejecuta `funcion` en el pool y espera su resultado; ClavesSaturadas si no hay hueco a tiempo."""
+    pool = _pool_proceso()
+    futuro = pool.enviar(funcion, *args, espera=_config("CLAVES_ESPERA", ESPERA_SEGUNDOS))
+    estado = metricas()
+    if has_request_context():
+        g.claves_cola = estado["en_cola"]
+
+    if futuro is None:
+        if has_app_context():
+            current_app.logger.warning("Pool de contraseñas lleno, petición rechazada: %s", estado)
+        raise ClavesSaturadas()
+    cola = pool.capacidad - pool.hilos
+    if cola and estado["en_cola"] * 2 > cola and has_app_context():
+        current_app.logger.warning("Pool de contraseñas con cola alta: %s", estado)
+    return futuro.result()
+
+
+# ---------------------------------------------------------------------
+# HASH Y VERIFICACIÓN
+# ---------------------------------------------------------------------
+
+def metodo_actual() -> str:
+    return _config("CLAVES_METODO", METODO)
+
+
+def generar_hash(password, metodo=None) -> str:
+    """
+    Hash en este hilo (tareas e importaciones, que ya van fuera de la petición), con `metodo` o el
+    actual. Desde hilos sin contexto de app hay que pasarlo: si no, sale el METODO por defecto.
+    """
+    return generate_password_hash(password, method=metodo or metodo_actual())
+
+
+def hashear(password) -> str:
+    """Hash con el método actual, calculado en el pool."""
+    return _esperar(generate_password_hash, password, metodo_actual())
+
+
+def verificar(pwhash, password) -> bool:
+    """Comprueba la contraseña en el pool. Un hash inutilizable (sin contraseña) no gasta pool."""
+    if not pwhash or "$" not in pwhash or not password:
+        return False
+    return _esperar(check_password_hash, pwhash, password)
+
+
+@lru_cache(maxsize=8)
+def _prefijo(metodo) -> str:
+    # Werkzeug completa los parámetros que faltan ("scrypt" -> "scrypt:32768:8:1")
+    return generate_password_hash("", method=metodo).split("$", 1)[0]
+
+
+def necesita_rehash(pwhash) -> bool:
+    """True si el hash (válido) se hizo con otro método o parámetros que los actuales."""
+    if not pwhash or "$" not in pwhash:
+        return False
+    return pwhash.split("$", 1)[0] != _prefijo(metodo_actual())
+
+
+def _rehacer(app, modelo, id_trabajador, pwhash, password, metodo):
+    nuevo = generate_password_hash(password, method=metodo)
+    with app.app_context():
+        try:
+            db.session.execute(
+                update(modelo)
+                .where(modelo.id_trabajador == id_trabajador, modelo.passw == pwhash)
+                .values(passw=nuevo)
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            app.logger.exception("No se pudo rehacer el hash del trabajador %s", id_trabajador)
+
+
+def rehacer_hash(modelo, id_trabajador, pwhash, password):
+    """
+    Tras un login correcto con un hash antiguo, lo rehace con el método actual en el pool, sin
+    esperar. Si el pool está lleno no se hace: ya tocará en el siguiente login.
+    """
+    if not has_app_context():
+        return
+    app = current_app._get_current_object()
+    _pool_proceso().enviar(_rehacer, app, modelo, id_trabajador, pwhash, password, metodo_actual(), espera=0)
+
+
+def registrar_claves(app):
+    """Cabecera X-Claves-Cola (cola del pool al usarlo) en las respuestas que han hasheado o verificado."""
+    @app.after_request
+    def _cabecera_claves(response):
+        cola = g.pop("claves_cola", None)
+        if cola is not None:
+            response.headers["X-Claves-Cola"] = str(cola)
+        return response
@@ -0,0 +1,197 @@
+"""
+Medición de consultas SQL por petición: número, tiempo total y sentencias repetidas.
+
+- Se engancha a los eventos de Engine de SQLAlchemy y solo anota en el contexto que tiene una
+  medición abierta (la de la petición o la de limite_consultas); los hilos de tareas y del diario
+  no cuentan.
+- Cada sentencia se reduce a su forma (espacios normalizados y listas de parámetros colapsadas):
+  la misma forma ejecutada muchas veces en una petición es la firma de un N+1.
+- Con CONSULTAS_MEDIR (y siempre en debug o testing) cada respuesta lleva la cabecera X-Consultas
+  y el log avisa de los posibles N+1 y de las vistas que pasan su presupuesto, declarado con
+  @presupuesto_consultas(n) debajo del decorador de la ruta.
+- limite_consultas() es la ayuda para pruebas: falla si lo ejecutado en el bloque pasa el presupuesto.
+"""
+
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import current_app, g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Veces que una misma forma de sentencia puede repetirse en una petición sin avisar de N+1.
+REPETICION_AVISO = 10
+
+# Mediciones abiertas en este contexto (pueden anidarse: la de una prueba envuelve la de la petición)
+_abiertas = ContextVar("consultas_abiertas", default=())
+
+_ESPACIOS = re.compile(r"\s+")
+_PARAMETRO = r"\s*(?:\?|%s|%\(\w+\)s|:\w+)\s*"
+_LISTA_PARAMETROS = re.compile(r"\((?:" + _PARAMETRO + r",)+" + _PARAMETRO + r"\)")
+
+
+def forma_sentencia(sentencia) -> str:
+    """Sentencia sin la variación que no cambia su forma (espacios, IN (?, ?, ...) de distinto largo)."""
+    return _LISTA_PARAMETROS.sub("(?)", _ESPACIOS.sub(" ", sentencia).strip())
+
+
+class Medicion:
+    """Consultas ejecutadas mientras está abierta."""
+
+    def __init__(self):
+        self.consultas = 0
+        self.segundos = 0.0
+        self.formas = Counter()
+        # Menor presupuesto declarado por las vistas atendidas mientras estaba abierta
+        self.presupuesto = None
+
+    def anotar(self, forma, segundos):
+        self.consultas += 1
+        self.segundos += segundos
+        self.formas[forma] += 1
+
+    def limitar(self, presupuesto):
+        if self.presupuesto is None or presupuesto < self.presupuesto:
+            self.presupuesto = presupuesto
+
+    def repetidas(self, minimo=2):
+        """[(forma, veces)] de las sentencias ejecutadas al menos `minimo` veces, de más a menos."""
+        return [(forma, veces) for forma, veces in self.formas.most_common() if veces >= minimo]
+
+    def resumen(self) -> str:
+        repetida = self.formas.most_common(1)[0][1] if self.formas else 0
+        return f"{self.consultas} consultas; {self.segundos * 1000:.1f} ms; max. repetida {repetida}"
+
+    def detalle(self, limite=5) -> str:
+        lineas = [self.resumen()]
+        lineas += [f"  {veces} x {forma[:300]}" for forma, veces in self.formas.most_common(limite)]
+        return "\n".join(lineas)
+
+
+def _abrir() -> Medicion:
+    medicion = Medicion()
+    _abiertas.set(_abiertas.get() + (medicion,))
+    return medicion
+
+
+def _cerrar(medicion):
+    _abiertas.set(tuple(m for m in _abiertas.get() if m is not medicion))
+
+
+# ---------------------------------------------------------------------
+# EVENTOS DEL ENGINE (todos los engines; sin medición abierta no hacen nada)
+# ---------------------------------------------------------------------
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _antes_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    if _abiertas.get() and context is not None:
+        context._consultas_inicio = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _despues_de_ejecutar(conn, cursor, statement, parameters, context, executemany):
+    mediciones = _abiertas.get()
+    inicio = getattr(context, "_consultas_inicio", None)
+    if not mediciones or inicio is None:
+        return
+
+    segundos = time.perf_counter() - inicio
+    forma = forma_sentencia(statement)
+    for medicion in mediciones:
+        medicion.anotar(forma, segundos)
+
+
+# ---------------------------------------------------------------------
+# PRESUPUESTO POR VISTA
+# ---------------------------------------------------------------------
+
+def presupuesto_consultas(maximo):
+    """
+    Declara cuántas consultas puede hacer la vista (función de ruta o método de MethodView).
+    Va debajo del decorador de la ruta; los decoradores con functools.wraps conservan la marca.
+    """
+    def marcar(vista):
+        vista.presupuesto_consultas = maximo
+        return vista
+    return marcar
+
+
+def _presupuesto_vista():
+    vista = current_app.view_functions.get(request.endpoint)
+    clase = getattr(vista, "view_class", None)
+    if clase is not None:
+        vista = getattr(clase, request.method.lower(), None)
+    return getattr(vista, "presupuesto_consultas", None)
+
+
+def _midiendo(app) -> bool:
+    return bool(app.config.get("CONSULTAS_MEDIR") or app.debug or app.testing)
+
+
+def registrar_consultas(app):
+    """Abre una medición por petición y la publica en X-Consultas y en el log."""
+
+    @app.before_request
+    def _abrir_medicion():
+        if _midiendo(app):
+            g.medicion_consultas = _abrir()
+
+    @app.after_request
+    def _informar_medicion(respuesta):
+        presupuesto = _presupuesto_vista()
+        if presupuesto is not None:
+            for medicion in _abiertas.get():
+                medicion.limitar(presupuesto)
+
+        medicion = g.get("medicion_consultas")
+        if medicion is None:
+            return respuesta
+
+        respuesta.headers["X-Consultas"] = medicion.resumen()
+        app.logger.debug("%s %s: %s", request.method, request.path, medicion.resumen())
+
+        for forma, veces in medicion.repetidas(REPETICION_AVISO):
+            app.logger.warning(
+                "Posible N+1 en %s %s: %d veces %s", request.method, request.path, veces, forma[:300]
+            )
+        if presupuesto is not None and medicion.consultas > presupuesto:
+            app.logger.warning(
+                "%s %s pasa su presupuesto de %d consultas: %s",
+                request.method, request.path, presupuesto, medicion.detalle()
+            )
+        return respuesta
+
+    @app.teardown_request
+    def _cerrar_medicion(exc):
+        medicion = g.pop("medicion_consultas", None)
+        if medicion is not None:
+            _cerrar(medicion)
+
+
+# ---------------------------------------------------------------------
+# AYUDA PARA PRUEBAS
+# ---------------------------------------------------------------------
+
+@contextmanager
+def limite_consultas(maximo=None):
+    """
+    Mide lo ejecutado en el bloque y lanza AssertionError si pasa de `maximo` o, sin él, del
+    presupuesto declarado por la vista atendida (por ejemplo, envolviendo una llamada del test client):
+
+        with limite_consultas():
+            cliente.get("/fichajes")
+    """
+    medicion = _abrir()
+    try:
+        yield medicion
+    finally:
+        _cerrar(medicion)
+
+    limite = maximo if maximo is not None else medicion.presupuesto
+    if limite is None:
+        raise AssertionError("Ninguna vista atendida declara presupuesto de consultas y no se ha dado máximo.")
+    if medicion.consultas > limite:
+        raise AssertionError(f"Presupuesto de {limite} consultas superado: {medicion.detalle()}")
@@ -1,6 +1,7 @@
 from functools import wraps
 from flask import session, redirect, url_for, flash
 from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import joinedload
 from extensions import db
 from models import Trabajador
 
@@ -13,7 +14,8 @@ def admin_required(view):
             return redirect(url_for("auth.login")) # Nota: auth.login será el nuevo nombre de la ruta
 
         try:
-            trabajador = Trabajador.query.get(user_id)
+            # El rol se comprueba en todas las peticiones: en la misma consulta
+            trabajador = Trabajador.query.options(joinedload(Trabajador.rol)).get(user_id)
         except OperationalError:
             db.session.remove()
             session.clear()
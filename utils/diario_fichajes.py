@@ -0,0 +1,365 @@
+"""
+Diario local de fichajes (write-behind, opcional).
+
+Con DIARIO_FICHAJES_DIR configurado, _crear_fichaje no inserta en la BD: añade el fichaje ya
+validado a un fichero JSONL (append + fsync) y responde en el acto. Un hilo en segundo plano
+los vuelca por lotes a la tabla fichaje, en orden, y actualiza estado_trabajador.
+
+- Cada proceso escribe su propio fichero (diario-<pid>.jsonl) y lo mantiene con flock exclusivo.
+- Al arrancar, los ficheros sin dueño (procesos caídos) se adoptan y se vuelven a volcar.
+- El fichero solo crece; cada volcado añade una marca y se vacía cuando no queda nada pendiente.
+- Volcar dos veces es seguro: un fichaje ya presente (mismo trabajador y fecha_hora) no se duplica.
+- Hasta el volcado, el último fichaje pendiente de cada trabajador se superpone al estado de BD.
+  Se anota también en el almacén del antirrebote para que lo vean los demás procesos: con
+  ANTIRREBOTE_REDIS_URL pueden fichar varios workers sobre el mismo directorio. Sin él el almacén
+  es del proceso, así que el diario exige un solo proceso (cerrojo diario.lock en el directorio).
+"""
+
+import fcntl
+import glob
+import json
+import os
+import threading
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import insert
+from sqlalchemy.orm.attributes import set_committed_value
+
+from extensions import db
+from models import Fichaje, Trabajador
+from utils import antirrebote
+from utils.estado_trabajador import estado_para_fichar, registrar_fichaje, incidencia_olvido
+from utils.jornada_diaria import recalcular_jornadas
+
+# Fichajes por transacción de volcado.
+TAMANO_LOTE = 500
+
+# Espera tras un volcado fallido (BD caída o en mantenimiento).
+ESPERA_ERROR_SEGUNDOS = 5
+
+# Vida del último fichaje pendiente en el almacén compartido; uno más antiguo que el estado de BD
+# ya está volcado y se ignora, así que no hace falta borrarlo al volcar.
+PENDIENTE_SEGUNDOS = 24 * 3600
+
+
+def _clave_pendiente(trabajador_id) -> str:
+    return antirrebote.clave_trabajador(trabajador_id) + ":diario"
+
+
+class Diario:
+    def __init__(self, app, directorio, intervalo=1.0):
+        self.app = app
+        self.directorio = directorio
+        self.intervalo = intervalo
+        self.ruta = os.path.join(directorio, f"diario-{os.getpid()}.jsonl")
+
+        self._lock = threading.Lock()
+        self._pendientes = []  # entradas aún no volcadas, en orden de llegada
+        self._ultimo = {}      # id_trabajador -> entrada pendiente más reciente
+        self._seq = 0
+        self._fichero = None
+        self._despertar = threading.Event()
+        self._hilo = None
+
+    # --- fichero ---
+
+    def _escribir(self, registro):
+        self._fichero.write((json.dumps(registro) + "\n").encode("utf-8"))
+        self._fichero.flush()
+        os.fsync(self._fichero.fileno())
+
+    @staticmethod
+    def _leer(fichero):
+        """Entradas no volcadas de un diario (ignora una última línea a medio escribir)."""
+        fichero.seek(0)
+        entradas = {}
+        for linea in fichero.read().decode("utf-8").splitlines():
+            try:
+                registro = json.loads(linea)
+            except ValueError:
+                continue
+            if "volcado_hasta" in registro:
+                for seq in [s for s in entradas if s <= registro["volcado_hasta"]]:
+                    del entradas[seq]
+            else:
+                entradas[registro["seq"]] = registro
+        return [entradas[s] for s in sorted(entradas)]
+
+    def abrir(self):
+        """
+        Abre el diario de este proceso y adopta lo pendiente de los huérfanos (incluido uno previo
+        con el mismo pid). Solo se añade: lo recuperado se reescribe con seq nuevos, una marca retira
+        las copias antiguas y después se borran los huérfanos (una caída a medias solo duplica,
+        y el volcado descarta duplicados).
+        """
+        os.makedirs(self.directorio, exist_ok=True)
+        self._fichero = open(self.ruta, "a+b")
+        fcntl.flock(self._fichero, fcntl.LOCK_EX)
+
+        propias = self._leer(self._fichero)
+        self._seq = max((e["seq"] for e in propias), default=0)
+        seq_anterior = self._seq
+
+        recuperadas = list(propias)
+        adoptados = []
+        for ruta in glob.glob(os.path.join(self.directorio, "diario-*.jsonl")):
+            if ruta == self.ruta:
+                continue
+            otro = open(ruta, "a+b")
+            try:
+                fcntl.flock(otro, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                otro.close()
+                continue  # su proceso sigue vivo
+            recuperadas.extend(self._leer(otro))
+            adoptados.append((ruta, otro))
+
+        recuperadas.sort(key=lambda e: e["fecha_hora"])
+        for entrada in recuperadas:
+            self._anadir(dict(entrada))
+        if seq_anterior:
+            self._escribir({"volcado_hasta": seq_anterior})
+
+        for ruta, otro in adoptados:
+            os.remove(ruta)
+            otro.close()
+
+        if recuperadas:
+            current_app.logger.warning("Diario de fichajes: %d fichajes pendientes recuperados.", len(recuperadas))
+
+    def _anadir(self, entrada):
+        self._seq += 1
+        entrada["seq"] = self._seq
+        self._escribir(entrada)
+        self._pendientes.append(entrada)
+        self._ultimo[entrada["id_trabajador"]] = entrada
+
+    # --- API ---
+
+    def anotar(self, trabajador, tipo, fecha_hora, lat, lon, olvido_desde=None) -> Fichaje:
+        """Guarda un fichaje validado en el diario y devuelve un Fichaje transitorio (sin id)."""
+        entrada = {
+            "id_trabajador": trabajador.id_trabajador,
+            "tipo": tipo,
+            "fecha_hora": fecha_hora.isoformat(),
+            "latitud": lat,
+            "longitud": lon,
+            "olvido_desde": olvido_desde.isoformat() if olvido_desde else None,
+        }
+        with self._lock:
+            self._anadir(entrada)
+        self._despertar.set()
+        antirrebote.almacen().set(
+            _clave_pendiente(trabajador.id_trabajador), f"{tipo} {entrada['fecha_hora']}", PENDIENTE_SEGUNDOS
+        )
+
+        fichaje = Fichaje(
+            id_trabajador=trabajador.id_trabajador,
+            tipo=tipo,
+            fecha_hora=fecha_hora,
+            latitud=lat,
+            longitud=lon
+        )
+        # Sin backref: que el Fichaje transitorio no acabe en la sesión por trabajador.fichajes
+        set_committed_value(fichaje, "trabajador", trabajador)
+        return fichaje
+
+    def ultimo_pendiente(self, trabajador_id):
+        """
+        (tipo, fecha_hora) del último fichaje aún no volcado del trabajador, o None.
+        Mira el diario propio y el almacén compartido (lo anotado por otros procesos).
+        """
+        candidatos = []
+        with self._lock:
+            entrada = self._ultimo.get(int(trabajador_id))
+        if entrada is not None:
+            candidatos.append((entrada["tipo"], datetime.fromisoformat(entrada["fecha_hora"])))
+
+        compartido = antirrebote.almacen().get(_clave_pendiente(trabajador_id))
+        if compartido:
+            tipo, fecha_hora = compartido.split(" ", 1)
+            candidatos.append((tipo, datetime.fromisoformat(fecha_hora)))
+        return max(candidatos, key=lambda c: c[1], default=None)
+
+    def pendiente(self, trabajador_id, fecha_hora):
+        """Fichaje transitorio pendiente del trabajador con esa fecha_hora, o None."""
+        iso = fecha_hora.isoformat()
+        with self._lock:
+            for entrada in reversed(self._pendientes):
+                if entrada["id_trabajador"] == int(trabajador_id) and entrada["fecha_hora"] == iso:
+                    return Fichaje(
+                        id_trabajador=entrada["id_trabajador"],
+                        tipo=entrada["tipo"],
+                        fecha_hora=fecha_hora,
+                        latitud=entrada["latitud"],
+                        longitud=entrada["longitud"]
+                    )
+        return None
+
+    # --- volcado ---
+
+    def volcar(self) -> int:
+        """Vuelca un lote a la BD. Devuelve cuántas entradas se han retirado del diario."""
+        with self._lock:
+            lote = self._pendientes[:TAMANO_LOTE]
+        if not lote:
+            return 0
+
+        try:
+            _insertar(lote)
+        except Exception:
+            db.session.rollback()
+            raise
+
+        with self._lock:
+            del self._pendientes[:len(lote)]
+            for entrada in lote:
+                if self._ultimo.get(entrada["id_trabajador"]) is entrada:
+                    del self._ultimo[entrada["id_trabajador"]]
+            if self._pendientes:
+                self._escribir({"volcado_hasta": lote[-1]["seq"]})
+            else:
+                self._fichero.truncate(0)
+        return len(lote)
+
+    def _bucle(self):
+        while True:
+            self._despertar.wait(self.intervalo)
+            self._despertar.clear()
+            with self.app.app_context():
+                try:
+                    while self.volcar():
+                        pass
+                except Exception:
+                    current_app.logger.exception("Diario de fichajes: volcado fallido, se reintentará.")
+                    self._despertar.wait(ESPERA_ERROR_SEGUNDOS)
+                finally:
+                    db.session.remove()
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self._bucle, name="diario-fichajes", daemon=True)
+        self._hilo.start()
+
+
+def _insertar(lote):
+    """
+    Inserta un lote del diario en una transacción:
+    - Descarta los ya presentes (reproducción tras caída) con una consulta por rango.
+    - Descarta (con aviso) los de trabajadores que ya no existen.
+    - Crea las incidencias OLVIDO y actualiza estado_trabajador con el último de cada trabajador
+      y jornada_diaria de los días afectados.
+    """
+    for entrada in lote:
+        entrada["_fecha"] = datetime.fromisoformat(entrada["fecha_hora"])
+
+    ids = {e["id_trabajador"] for e in lote}
+    vigentes = {t for (t,) in db.session.query(Trabajador.id_trabajador).filter(Trabajador.id_trabajador.in_(ids))}
+    existentes = set(
+        db.session.query(Fichaje.id_trabajador, Fichaje.fecha_hora).filter(
+            Fichaje.id_trabajador.in_(ids),
+            Fichaje.fecha_hora >= min(e["_fecha"] for e in lote),
+            Fichaje.fecha_hora <= max(e["_fecha"] for e in lote)
+        )
+    )
+
+    filas = []
+    ultimos = {}
+    for entrada in lote:
+        clave = (entrada["id_trabajador"], entrada["_fecha"])
+        if entrada["id_trabajador"] not in vigentes:
+            current_app.logger.warning("Diario de fichajes: trabajador %s ya no existe, se descarta %s.", *clave)
+            continue
+        if clave in existentes:
+            continue
+        existentes.add(clave)
+        filas.append({
+            "id_trabajador": entrada["id_trabajador"],
+            "fecha_hora": entrada["_fecha"],
+            "tipo": entrada["tipo"],
+            "latitud": entrada["latitud"],
+            "longitud": entrada["longitud"],
+        })
+        if entrada.get("olvido_desde"):
+            desde = datetime.fromisoformat(entrada["olvido_desde"])
+            horas = (entrada["_fecha"] - desde).total_seconds() / 3600
+            db.session.add(incidencia_olvido(entrada["id_trabajador"], desde, horas))
+        ultimos[entrada["id_trabajador"]] = entrada["_fecha"]
+
+    if filas:
+        db.session.execute(insert(Fichaje), filas)
+        for trabajador_id, fecha in ultimos.items():
+            fichaje = Fichaje.query.filter_by(id_trabajador=trabajador_id, fecha_hora=fecha).first()
+            registrar_fichaje(estado_para_fichar(trabajador_id), fichaje)
+        recalcular_jornadas((f["id_trabajador"], f["fecha_hora"].date()) for f in filas)
+    db.session.commit()
+
+    for entrada in lote:
+        entrada.pop("_fecha", None)
+
+
+# ---------------------------------------------------------------------
+# ACCESO DESDE LA APP
+# ---------------------------------------------------------------------
+
+_arranque_lock = threading.Lock()
+_proceso_unico = None  # (pid, fichero diario.lock con flock) sin almacén compartido
+
+
+def _exigir_proceso_unico(directorio):
+    """
+    Sin almacén compartido, cada proceso solo ve lo pendiente en su propio diario y dos fichajes
+    seguidos atendidos por procesos distintos decidirían sobre un estado viejo. Solo un proceso
+    puede tener el diario: el que consigue el cerrojo de diario.lock (lo suelta al morir).
+    """
+    global _proceso_unico
+    if isinstance(antirrebote.almacen(), antirrebote.AlmacenRedis):
+        return
+    if _proceso_unico is not None and _proceso_unico[0] == os.getpid():
+        return
+
+    os.makedirs(directorio, exist_ok=True)
+    fichero = open(os.path.join(directorio, "diario.lock"), "a+b")
+    try:
+        fcntl.flock(fichero, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        fichero.close()
+        raise RuntimeError(
+            "DIARIO_FICHAJES_DIR lo usa ya otro proceso: con varios workers hace falta ANTIRREBOTE_REDIS_URL."
+        )
+    _proceso_unico = (os.getpid(), fichero)
+
+
+def diario_activo():
+    """
+    Diario de este proceso, o None si el modo está desactivado.
+    Se abre y arranca en el primer uso de cada proceso (tras un fork el pid cambia y se abre otro).
+    """
+    app = current_app._get_current_object()
+    directorio = app.config.get("DIARIO_FICHAJES_DIR")
+    if not directorio:
+        return None
+
+    diario = app.extensions.get("diario_fichajes")
+    if diario is not None and diario.ruta == os.path.join(directorio, f"diario-{os.getpid()}.jsonl"):
+        return diario
+
+    with _arranque_lock:
+        diario = app.extensions.get("diario_fichajes")
+        if diario is None or diario.ruta != os.path.join(directorio, f"diario-{os.getpid()}.jsonl"):
+            _exigir_proceso_unico(directorio)
+            diario = Diario(app, directorio, app.config.get("DIARIO_FICHAJES_INTERVALO", 1.0))
+            diario.abrir()
+            diario.iniciar()
+            app.extensions["diario_fichajes"] = diario
+    return diario
+
+
+def registrar_diario(app):
+    """Arranca el diario en la primera petición (recupera lo pendiente sin esperar al primer fichaje)."""
+    if not app.config.get("DIARIO_FICHAJES_DIR"):
+        return
+
+    @app.before_request
+    def _arrancar_diario():
+        diario_activo()
@@ -12,50 +12,76 @@ def _get_sender_display_name(default_name: str) -> str:
     return default_name
 
 
-def _send_smtp(destinatario: str, subject: str, text: str, html: str, default_sender_name: str) -> bool:
-    """
-    Envía un email multipart (plain + html) usando SMTP+STARTTLS.
-    Devuelve True/False sin lanzar excepción (las funciones públicas ya controlan).
-    """
-    try:
-        smtp_server = current_app.config.get("MAIL_SERVER")
-        smtp_port = current_app.config.get("MAIL_PORT")
-        sender_email = current_app.config.get("MAIL_USERNAME")
-        sender_password = current_app.config.get("MAIL_PASSWORD")
+def _correo(subject: str, text: str, html: str, default_sender_name: str) -> dict:
+    """Correo ya compuesto, listo para guardar en la bandeja de salida (JSON)."""
+    return {
+        "asunto": subject,
+        "texto": text,
+        "html": html,
+        "remitente": _get_sender_display_name(default_sender_name),
+    }
+
 
-        sender_display_name = _get_sender_display_name(default_sender_name)
+def _mensaje(sender_email: str, destinatario: str, correo: dict) -> MIMEMultipart:
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = correo["asunto"]
+    msg["From"] = f"{correo['remitente']} <{sender_email}>"
+    msg["To"] = destinatario
 
-        msg = MIMEMultipart("alternative")
-        msg["Subject"] = subject
-        msg["From"] = f"{sender_display_name} <{sender_email}>"
-        msg["To"] = destinatario
+    msg.attach(MIMEText(correo["texto"], "plain"))
+    msg.attach(MIMEText(correo["html"], "html"))
+    return msg
 
-        msg.attach(MIMEText(text, "plain"))
-        msg.attach(MIMEText(html, "html"))
 
+def enviar_correos(correos) -> list:
+    """
+    Envía varios correos multipart (plain + html) por una sola conexión SMTP+STARTTLS.
+    `correos`: [(destinatario, correo)] con correo como lo devuelven las funciones correo_*.
+    Devuelve, en el mismo orden, None si salió o el texto del error; no lanza excepción.
+    """
+    if not correos:
+        return []
+
+    smtp_server = current_app.config.get("MAIL_SERVER")
+    smtp_port = current_app.config.get("MAIL_PORT")
+    sender_email = current_app.config.get("MAIL_USERNAME")
+    sender_password = current_app.config.get("MAIL_PASSWORD")
+
+    errores = [None] * len(correos)
+    actual = 0
+    try:
         context = ssl.create_default_context()
 
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
+        with smtplib.SMTP(smtp_server, smtp_port, timeout=30) as server:
             server.ehlo()
             server.starttls(context=context)
             server.ehlo()
             server.login(sender_email, sender_password)
-            server.sendmail(sender_email, destinatario, msg.as_string())
 
-        return True
+            for actual, (destinatario, correo) in enumerate(correos):
+                try:
+                    server.sendmail(sender_email, destinatario, _mensaje(sender_email, destinatario, correo).as_string())
+                except smtplib.SMTPRecipientsRefused as e:
+                    # Destinatario rechazado: solo falla ese correo, la conexión sigue valiendo
+                    errores[actual] = f"Destinatario rechazado: {e}"
+            actual = len(correos)
 
     except Exception as e:
         print(f"[ERROR] Fallo enviando correo: {e}")
-        return False
+        # Sin conexión (o cortada): fallan el correo en curso y los que quedaban
+        for i in range(actual, len(correos)):
+            errores[i] = str(e) or e.__class__.__name__
+
+    return errores
 
 
 # -----------------------------
 # 1) Recuperación de contraseña
 # -----------------------------
-def enviar_correo_password(destinatario: str, nombre_usuario: str, link_reset: str) -> bool:
+def correo_password(nombre_usuario: str, link_reset: str) -> dict:
     """
-    Envío SMTP de correo de recuperación.
-    IMPORTANTE: En la versión con token (15 min), el 3er parámetro es un LINK, no una password.
+    Correo de recuperación (se envía por la bandeja de salida, utils.envios).
+    IMPORTANTE: En la versión con token (15 min), el 2º parámetro es un LINK, no una password.
     Si aún usas password temporal, cambia el contenido aquí o crea otra función.
     """
     subject = "Recuperación de contraseña - App Presencia"
@@ -94,21 +120,20 @@ Si no has solicitado esto, ignora este correo.
 </html>
 """.strip()
 
-    return _send_smtp(destinatario, subject, text, html, default_sender_name="Soporte RRHH")
+    return _correo(subject, text, html, default_sender_name="Soporte RRHH")
 
 
 # --------------------------------------
 # 2) Resolución de incidencia (admin)
 # --------------------------------------
-def enviar_correo_resolucion(
-    destinatario: str,
+def correo_resolucion(
     nombre: str,
     tipo_incidencia: str,
     estado: str,
     comentario_admin: str,
     f_inicio: str,
     f_fin: str
-) -> bool:
+) -> dict:
     traducciones_tipo = {
         "VACACIONES": "Vacaciones",
         "BAJA": "Baja Médica",
@@ -177,13 +202,13 @@ Comentario de Administración:
 </html>
 """.strip()
 
-    return _send_smtp(destinatario, subject, text, html, default_sender_name="RRHH")
+    return _correo(subject, text, html, default_sender_name="RRHH")
 
 
 # --------------------------------------
 # 3) Alerta por ausencia de fichaje
 # --------------------------------------
-def enviar_correo_ausencia(destinatario: str, nombre: str) -> bool:
+def correo_ausencia(nombre: str) -> dict:
     subject = "ALERTA: Ausencia de fichaje detectada"
 
     text = f"""
@@ -220,4 +245,4 @@ Por favor, accede a la aplicación para fichar o contacta con RRHH si es un erro
 </html>
 """.strip()
 
-    return _send_smtp(destinatario, subject, text, html, default_sender_name="RRHH Alertas")
+    return _correo(subject, text, html, default_sender_name="RRHH Alertas")
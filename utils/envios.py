@@ -0,0 +1,208 @@
+"""
+Bandeja de salida (tabla envio): correos y push que se mandan fuera de la petición.
+
+- encolar_correo / encolar_push añaden la fila a la sesión, sin commit: se guarda en la misma
+  transacción que el cambio que la provoca. Si esta se deshace no se envía nada, y si se confirma
+  la respuesta ya no espera a Gmail ni a FCM. encolar_varios hace lo mismo para muchos avisos con
+  un solo INSERT (barridos).
+- despachar_envios (desde el bucle de utils.tareas, que se despierta al confirmar envíos nuevos)
+  manda por lotes de LOTE_ENVIOS: una sola conexión SMTP para los correos y una llamada a FCM
+  para los push.
+- Reclamar un lote es un UPDATE condicionado que aplaza su siguiente_intento PLAZO_RECLAMO_SEGUNDOS.
+  Si el worker muere a medias, el lote vuelve a estar listo él solo: algún envío puede repetirse,
+  pero no se pierde ninguno.
+- Un fallo se reintenta con espera creciente hasta MAX_INTENTOS y después queda FALLIDO con el
+  último error. Los enviados se borran pasados CONSERVAR_DIAS (purgar_envios).
+- El contenido (que puede llevar un enlace de acceso) solo se guarda mientras falta mandarlo: al
+  quedar ENVIADO o FALLIDO se vacía y solo quedan destino, estado y error.
+"""
+
+import json
+import uuid
+from datetime import datetime, timedelta
+
+from flask import has_app_context
+from sqlalchemy import delete, event, insert, select, update
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import Envio
+
+EMAIL, PUSH = "EMAIL", "PUSH"
+PENDIENTE, ENVIADO, FALLIDO = "PENDIENTE", "ENVIADO", "FALLIDO"
+
+# Envíos por lote (FCM admite hasta 500 por llamada).
+LOTE_ENVIOS = 100
+
+# Tiempo que un lote reclamado queda reservado para su worker.
+PLAZO_RECLAMO_SEGUNDOS = 300
+
+# Intentos antes de dar un envío por FALLIDO; la espera entre ellos se dobla cada vez.
+MAX_INTENTOS = 6
+REINTENTO_BASE_SEGUNDOS = 30
+
+# Días que se conservan los envíos hechos.
+CONSERVAR_DIAS = 30
+
+# Contenido de un envío ya terminado (la columna no admite NULL).
+CONTENIDO_BORRADO = "{}"
+
+
+# ---------------------------------------------------------------------
+# ENCOLAR (dentro de la transacción del cambio)
+# ---------------------------------------------------------------------
+
+def _encolar(canal, destino, contenido):
+    envio = Envio(canal=canal, destino=destino, contenido=json.dumps(contenido), estado=PENDIENTE)
+    db.session.add(envio)
+    db.session.info["envios"] = True
+    return envio
+
+
+def encolar_correo(destinatario, correo):
+    """Guarda en la sesión un correo (de utils.email_sender.correo_*) para `destinatario`. None si no hay email."""
+    if not destinatario:
+        return None
+    return _encolar(EMAIL, destinatario, correo)
+
+
+def encolar_push(token, titulo, cuerpo):
+    """Guarda en la sesión un push para el token FCM. None si no hay token."""
+    if not token:
+        return None
+    return _encolar(PUSH, token, {"titulo": titulo, "cuerpo": cuerpo})
+
+
+def encolar_varios(correos=(), pushes=()) -> int:
+    """
+    Encola de una vez [(destinatario, correo)] y [(token, titulo, cuerpo)] con un INSERT de varias
+    filas (sin objetos en la sesión ni commit). Se saltan los que no tienen destino. Devuelve cuántos.
+    """
+    ahora = datetime.now()
+    filas = [(EMAIL, destinatario, correo) for destinatario, correo in correos if destinatario]
+    filas += [(PUSH, token, {"titulo": titulo, "cuerpo": cuerpo}) for token, titulo, cuerpo in pushes if token]
+    if not filas:
+        return 0
+
+    db.session.execute(insert(Envio), [
+        {
+            "canal": canal, "destino": destino, "contenido": json.dumps(contenido), "estado": PENDIENTE,
+            "intentos": 0, "siguiente_intento": ahora, "creado_en": ahora,
+        }
+        for canal, destino, contenido in filas
+    ])
+    db.session.info["envios"] = True
+    return len(filas)
+
+
+@event.listens_for(Session, "after_commit")
+def _avisar(session):
+    if session.info.pop("envios", None) and has_app_context():
+        from utils.tareas import despertar
+        despertar()
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar(session):
+    session.info.pop("envios", None)
+
+
+# ---------------------------------------------------------------------
+# DESPACHO (worker)
+# ---------------------------------------------------------------------
+
+def query_envios_listos(ahora):
+    """Envíos pendientes cuyo turno ya ha llegado, en orden de llegada."""
+    return Envio.query.filter(
+        Envio.estado == PENDIENTE,
+        Envio.siguiente_intento <= ahora
+    ).order_by(Envio.siguiente_intento, Envio.id_envio)
+
+
+def _reclamar_lote(ahora):
+    """Envíos listos que este worker consigue reservar (con commit)."""
+    ids = [e.id_envio for e in query_envios_listos(ahora).with_entities(Envio.id_envio).limit(LOTE_ENVIOS)]
+    if not ids:
+        return []
+
+    lote = uuid.uuid4().hex
+    db.session.execute(
+        update(Envio)
+        .where(Envio.id_envio.in_(ids), Envio.estado == PENDIENTE, Envio.siguiente_intento <= ahora)
+        .values(lote=lote, siguiente_intento=ahora + timedelta(seconds=PLAZO_RECLAMO_SEGUNDOS))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return db.session.scalars(select(Envio).where(Envio.id_envio.in_(ids), Envio.lote == lote)).all()
+
+
+def _mandar(envios):
+    """{id_envio: None o error} de mandar los envíos del lote por su canal."""
+    from utils.email_sender import enviar_correos
+
+    correos = [e for e in envios if e.canal == EMAIL]
+    pushes = [e for e in envios if e.canal == PUSH]
+    errores = {}
+
+    if correos:
+        resultado = enviar_correos([(e.destino, json.loads(e.contenido)) for e in correos])
+        errores.update(zip((e.id_envio for e in correos), resultado))
+
+    if pushes:
+        # firebase_sender conecta con Firebase al importarse: solo cuando hay push que mandar
+        from utils.firebase_sender import enviar_notificaciones_push
+
+        avisos = []
+        for e in pushes:
+            contenido = json.loads(e.contenido)
+            avisos.append((e.destino, contenido["titulo"], contenido["cuerpo"]))
+        errores.update(zip((e.id_envio for e in pushes), enviar_notificaciones_push(avisos)))
+
+    for e in envios:
+        if e.canal not in (EMAIL, PUSH):
+            errores[e.id_envio] = f"Canal desconocido: {e.canal}"
+    return errores
+
+
+def despachar_envios(ahora=None) -> int:
+    """Manda los envíos listos, lote a lote, hasta que no quede ninguno. Devuelve cuántos han salido."""
+    enviados = 0
+    while True:
+        envios = _reclamar_lote(ahora or datetime.now())
+        if not envios:
+            return enviados
+
+        errores = _mandar(envios)
+        hecho = datetime.now()
+        for e in envios:
+            error = errores.get(e.id_envio)
+            e.lote = None
+            if error is None:
+                e.estado, e.enviado_en, e.error = ENVIADO, hecho, None
+                e.contenido = CONTENIDO_BORRADO
+                enviados += 1
+                continue
+
+            e.intentos += 1
+            e.error = error[:255]
+            if e.intentos >= MAX_INTENTOS:
+                e.estado = FALLIDO
+                e.contenido = CONTENIDO_BORRADO
+            else:
+                e.siguiente_intento = hecho + timedelta(seconds=REINTENTO_BASE_SEGUNDOS * 2 ** (e.intentos - 1))
+        db.session.commit()
+
+        if len(envios) < LOTE_ENVIOS:
+            return enviados
+
+
+def purgar_envios(dias=CONSERVAR_DIAS) -> int:
+    """Borra los envíos hechos hace más de `dias`. Devuelve cuántos (con commit)."""
+    # siguiente_intento de un enviado es, con margen de PLAZO_RECLAMO_SEGUNDOS, cuándo salió: va por el índice
+    resultado = db.session.execute(
+        delete(Envio)
+        .where(Envio.estado == ENVIADO, Envio.siguiente_intento < datetime.now() - timedelta(days=dias))
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return resultado.rowcount
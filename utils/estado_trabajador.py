@@ -0,0 +1,114 @@
+"""
+Estado "dentro/fuera" de cada trabajador.
+
+La tabla estado_trabajador guarda el último fichaje (tipo, fecha y id) para que fichar,
+los recordatorios y el cron lean una fila por PK en vez de ordenar todo el histórico.
+Cada cambio se anota también para el tablero de presencia en vivo (utils.presencia).
+"""
+
+from extensions import db
+from models import EstadoTrabajador, Fichaje, Incidencia, Trabajador
+from utils import antirrebote, presencia
+
+
+def _normalizar_tipo(tipo) -> str:
+    return (tipo or "").strip().upper()
+
+
+def _ultimo_fichaje_historico(trabajador_id):
+    """Último fichaje recorriendo el histórico (solo si la fila de estado aún no existe o se recalcula)."""
+    return (
+        Fichaje.query.filter_by(id_trabajador=trabajador_id)
+        .order_by(Fichaje.fecha_hora.desc(), Fichaje.id_fichaje.desc())
+        .first()
+    )
+
+
+def _volcar_fichaje(estado: EstadoTrabajador, fichaje):
+    """Copia tipo/fecha/id del fichaje al estado (o lo deja vacío si no hay fichaje)."""
+    if fichaje is None:
+        estado.ultimo_tipo = None
+        estado.ultimo_fecha_hora = None
+        estado.id_ultimo_fichaje = None
+        return
+
+    estado.ultimo_tipo = _normalizar_tipo(fichaje.tipo)
+    estado.ultimo_fecha_hora = fichaje.fecha_hora
+    estado.id_ultimo_fichaje = fichaje.id_fichaje
+
+
+def _anotar_presencia(estado: EstadoTrabajador):
+    # Quien ficha ya tiene el trabajador en la sesión: normalmente sin consulta
+    trabajador = db.session.get(Trabajador, estado.id_trabajador)
+    presencia.anotar(
+        estado.id_trabajador, trabajador.idEmpresa if trabajador else None,
+        estado.ultimo_tipo, estado.ultimo_fecha_hora
+    )
+
+
+def estado_actual(trabajador_id) -> EstadoTrabajador:
+    """
+    Estado del trabajador para lectura (recordatorios, cron).
+    Si la fila aún no existe se reconstruye en memoria desde el histórico, sin escribir.
+    """
+    estado = EstadoTrabajador.query.get(trabajador_id)
+    if estado is None:
+        estado = EstadoTrabajador(id_trabajador=trabajador_id)
+        _volcar_fichaje(estado, _ultimo_fichaje_historico(trabajador_id))
+    return estado
+
+
+def estado_para_fichar(trabajador_id) -> EstadoTrabajador:
+    """
+    Estado bloqueado (SELECT ... FOR UPDATE) para el flujo de fichaje.
+    - Serializa dos fichajes simultáneos del mismo trabajador.
+    - Si la fila no existe, se crea en la sesión (el commit lo hace quien ficha).
+    """
+    estado = (
+        EstadoTrabajador.query
+        .filter_by(id_trabajador=trabajador_id)
+        .with_for_update()
+        .first()
+    )
+    if estado is None:
+        estado = EstadoTrabajador(id_trabajador=trabajador_id)
+        _volcar_fichaje(estado, _ultimo_fichaje_historico(trabajador_id))
+        db.session.add(estado)
+    return estado
+
+
+def registrar_fichaje(estado: EstadoTrabajador, fichaje: Fichaje):
+    """
+    Aplica un fichaje recién creado al estado (sin commit).
+    - Requiere flush previo para conocer id_fichaje.
+    - Un fichaje manual con fecha anterior al último no cambia el estado.
+    """
+    if estado.ultimo_fecha_hora is None or fichaje.fecha_hora >= estado.ultimo_fecha_hora:
+        _volcar_fichaje(estado, fichaje)
+        _anotar_presencia(estado)
+
+
+def recalcular_estado(trabajador_id):
+    """Recalcula el estado desde el histórico tras editar o borrar fichajes (sin commit)."""
+    estado = EstadoTrabajador.query.get(trabajador_id)
+    if estado is None:
+        estado = EstadoTrabajador(id_trabajador=trabajador_id)
+        db.session.add(estado)
+    _volcar_fichaje(estado, _ultimo_fichaje_historico(trabajador_id))
+    _anotar_presencia(estado)
+    # El último fichaje puede haber cambiado: que el antirrebote vuelva a preguntar a la BD
+    antirrebote.olvidar(antirrebote.clave_trabajador(trabajador_id))
+    return estado
+
+
+def incidencia_olvido(trabajador_id, ultima_fecha, horas) -> Incidencia:
+    """Incidencia OLVIDO de cierre automático para una ENTRADA que quedó abierta más de 16h (sin añadir)."""
+    return Incidencia(
+        id_trabajador=trabajador_id,
+        tipo="OLVIDO",
+        fecha_inicio=ultima_fecha.date(),
+        fecha_fin=ultima_fecha.date(),
+        comentario_trabajador=f"Autogenerada: Turno abierto de {int(horas)}h.",
+        estado="PENDIENTE",
+        comentario_admin="Cierre automático."
+    )
@@ -14,12 +14,8 @@ if not firebase_admin._apps:
         print(f"[FIREBASE] ERROR CRÍTICO: No se encontró {cred_path}.")
 
 
-def enviar_notificacion_push(token, titulo, cuerpo):
-    # Envío de push a un token FCM
-    if not token:
-        raise ValueError("Usuario sin token FCM")
-
-    message = messaging.Message(
+def _mensaje(token, titulo, cuerpo):
+    return messaging.Message(
         notification=messaging.Notification(
             title=titulo,
             body=cuerpo,
@@ -33,6 +29,29 @@ def enviar_notificacion_push(token, titulo, cuerpo):
         token=token,
     )
 
-    response = messaging.send(message)
+
+def enviar_notificacion_push(token, titulo, cuerpo):
+    # Envío de push a un token FCM
+    if not token:
+        raise ValueError("Usuario sin token FCM")
+
+    response = messaging.send(_mensaje(token, titulo, cuerpo))
     print(f"[FIREBASE] ÉXITO REAL. ID: {response}")
     return True
+
+
+def enviar_notificaciones_push(avisos):
+    """
+    Envía varios push [(token, titulo, cuerpo)] en una sola llamada a FCM (como mucho 500).
+    Devuelve, en el mismo orden, None si salió o el texto del error.
+    """
+    if not avisos:
+        return []
+
+    try:
+        response = messaging.send_each([_mensaje(token, titulo, cuerpo) for token, titulo, cuerpo in avisos])
+    except Exception as e:
+        print(f"[FIREBASE] Fallo enviando lote: {e}")
+        return [str(e) or e.__class__.__name__] * len(avisos)
+
+    return [None if r.success else str(r.exception) for r in response.responses]
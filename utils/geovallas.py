@@ -0,0 +1,145 @@
+"""
+Geovallas por empresa: sede principal (Empresa.latitud/longitud/radio) + SedeEmpresa.
+
+Cada empresa se compila en un índice de rejilla (celdas de CELDA_GRADOS) para que un fichaje
+solo compare contra las sedes de su celda, con prefiltro por bounding box antes del Haversine.
+Los índices se cachean por empresa en el proceso y se invalidan al editar sedes o la empresa.
+"""
+
+import math
+import threading
+import time
+from collections import namedtuple
+
+from models import SedeEmpresa
+
+# Tolerancia extra sobre el radio configurado (m), igual que el control original.
+MARGEN_METROS = 50
+RADIO_POR_DEFECTO = 100
+
+# Tamaño de celda (~1,1 km en latitud).
+CELDA_GRADOS = 0.01
+
+# Metros por grado de latitud (aprox.).
+METROS_POR_GRADO = 111320.0
+
+# Caducidad del índice cacheado: acota el desfase entre procesos si se edita en otro worker.
+CACHE_TTL_SEGUNDOS = 300
+
+Sede = namedtuple("Sede", "id_sede nombre latitud longitud radio_permitido codigo_nfc lat_min lat_max lon_min lon_max")
+
+
+def calcular_distancia(lat1, lon1, lat2, lon2):
+    """
+    Calcula distancia en metros entre dos coordenadas (Haversine).
+    """
+    R = 6371000  # radio medio tierra (m)
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    delta_phi = math.radians(lat2 - lat1)
+    delta_lambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(delta_phi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2) ** 2
+    )
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+    return R * c
+
+
+def _celda(lat, lon):
+    return (math.floor(lat / CELDA_GRADOS), math.floor(lon / CELDA_GRADOS))
+
+
+def _crear_sede(id_sede, nombre, lat, lon, radio, codigo_nfc):
+    """Sede con su bounding box (en grados) ya calculada para el radio permitido."""
+    radio_permitido = (radio or RADIO_POR_DEFECTO) + MARGEN_METROS
+    d_lat = radio_permitido / METROS_POR_GRADO
+    d_lon = radio_permitido / (METROS_POR_GRADO * max(math.cos(math.radians(lat)), 1e-6))
+    return Sede(
+        id_sede, nombre, lat, lon, radio_permitido, codigo_nfc,
+        lat - d_lat, lat + d_lat, lon - d_lon, lon + d_lon
+    )
+
+
+class IndiceSedes:
+    """Rejilla celda -> sedes cuyo bounding box toca la celda."""
+
+    def __init__(self, sedes):
+        self.sedes = list(sedes)
+        self._celdas = {}
+        for sede in self.sedes:
+            c_lat_min, c_lon_min = _celda(sede.lat_min, sede.lon_min)
+            c_lat_max, c_lon_max = _celda(sede.lat_max, sede.lon_max)
+            for c_lat in range(c_lat_min, c_lat_max + 1):
+                for c_lon in range(c_lon_min, c_lon_max + 1):
+                    self._celdas.setdefault((c_lat, c_lon), []).append(sede)
+
+    def __bool__(self):
+        return bool(self.sedes)
+
+    def candidatas(self, lat, lon):
+        """Sedes de la celda del punto que además contienen el punto en su bounding box."""
+        return [
+            s for s in self._celdas.get(_celda(lat, lon), ())
+            if s.lat_min <= lat <= s.lat_max and s.lon_min <= lon <= s.lon_max
+        ]
+
+    def sedes_en_rango(self, lat, lon):
+        """Lista de (sede, distancia) dentro de su radio permitido, de la más cercana a la más lejana."""
+        en_rango = []
+        for s in self.candidatas(lat, lon):
+            distancia = calcular_distancia(lat, lon, s.latitud, s.longitud)
+            if distancia <= s.radio_permitido:
+                en_rango.append((s, distancia))
+        en_rango.sort(key=lambda x: x[1])
+        return en_rango
+
+    def distancia_minima(self, lat, lon):
+        """Distancia a la sede más cercana (recorre todas: solo para el mensaje de rechazo)."""
+        return min(calcular_distancia(lat, lon, s.latitud, s.longitud) for s in self.sedes)
+
+
+# ---------------------------------------------------------------------
+# CACHÉ POR EMPRESA
+# ---------------------------------------------------------------------
+
+_cache = {}
+_generacion = {}
+_cache_lock = threading.Lock()
+
+
+def _compilar(empresa):
+    sedes = []
+    if empresa.latitud is not None and empresa.longitud is not None:
+        sedes.append(_crear_sede(
+            None, "Sede principal", empresa.latitud, empresa.longitud, empresa.radio, None
+        ))
+
+    for s in SedeEmpresa.query.filter_by(empresa_id=empresa.id_empresa).all():
+        sedes.append(_crear_sede(s.id_sede, s.nombre, s.latitud, s.longitud, s.radio, s.codigo_nfc))
+
+    return IndiceSedes(sedes)
+
+
+def indice_empresa(empresa) -> IndiceSedes:
+    """Índice de geovallas de la empresa (cacheado en el proceso durante CACHE_TTL_SEGUNDOS)."""
+    ahora = time.monotonic()
+    with _cache_lock:
+        entrada = _cache.get(empresa.id_empresa)
+        generacion = _generacion.get(empresa.id_empresa, 0)
+    if entrada and entrada[0] > ahora:
+        return entrada[1]
+
+    indice = _compilar(empresa)
+    with _cache_lock:
+        # Si se invalidó mientras compilábamos, no se guarda (se recompila en la siguiente petición)
+        if _generacion.get(empresa.id_empresa, 0) == generacion:
+            _cache[empresa.id_empresa] = (ahora + CACHE_TTL_SEGUNDOS, indice)
+    return indice
+
+
+def invalidar_sedes(empresa_id):
+    """Descarta el índice cacheado de la empresa (llamar tras editar sedes o la ubicación)."""
+    with _cache_lock:
+        _cache.pop(empresa_id, None)
+        _generacion[empresa_id] = _generacion.get(empresa_id, 0) + 1
@@ -0,0 +1,185 @@
+"""
+Horarios compilados: cada horario se reduce a una semana de 7 posiciones (lunes..domingo) con
+lo que necesitan resúmenes y avisos: segundos teóricos, primera entrada y última salida del día.
+
+Las semanas se cachean por horario en el proceso y se invalidan al editar franjas o días del
+horario; así una petición caliente no consulta Dia ni Franja.
+
+Las horas teóricas de un rango se calculan sin recorrerlo: se cuentan los lunes, martes... del
+rango y se restan los tramos de ausencia ya fusionados (segundos_teoricos).
+"""
+
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, date, timedelta
+
+from extensions import db
+from models import Dia, Franja
+
+# Caducidad de la semana cacheada: acota el desfase entre procesos si se edita en otro worker.
+CACHE_TTL_SEGUNDOS = 300
+
+DIAS_SEMANA = {
+    "lunes": 0, "martes": 1, "miercoles": 2, "jueves": 3,
+    "viernes": 4, "sabado": 5, "domingo": 6
+}
+
+# franjas: nº de franjas del día (0 = libra)
+# segundos: jornada teórica (una franja que cruza medianoche suma 24h)
+# entrada: hora de entrada más temprana (time) o None
+# salida: última salida como desfase desde las 00:00 del día (timedelta; > 24h si cruza medianoche) o None
+DiaHorario = namedtuple("DiaHorario", "franjas segundos entrada salida")
+
+DIA_LIBRE = DiaHorario(0, 0, None, None)
+SEMANA_VACIA = (DIA_LIBRE,) * 7
+
+
+def duracion_franja(entrada, salida) -> int:
+    """Segundos entre dos horas (time); si cruza medianoche, suma 24h."""
+    if not entrada or not salida:
+        return 0
+    diff = (datetime.combine(date.min, salida) - datetime.combine(date.min, entrada)).total_seconds()
+    if diff < 0:
+        diff += 86400
+    return int(diff)
+
+
+def _compilar(ids_horario):
+    """{id_horario: semana} con una consulta de franjas para todos los horarios pedidos."""
+    por_dia = {h: [[] for _ in range(7)] for h in ids_horario}
+    franjas = db.session.query(
+        Franja.id_horario, Dia.nombre, Franja.hora_entrada, Franja.hora_salida
+    ).join(Dia, Dia.id == Franja.id_dia).filter(Franja.id_horario.in_(ids_horario)).all()
+
+    for id_horario, nombre_dia, entrada, salida in franjas:
+        wd = DIAS_SEMANA.get((nombre_dia or "").strip().lower())
+        if wd is not None:
+            por_dia[id_horario][wd].append((entrada, salida))
+
+    semanas = {}
+    for id_horario, dias in por_dia.items():
+        semana = []
+        for franjas_dia in dias:
+            if not franjas_dia:
+                semana.append(DIA_LIBRE)
+                continue
+            entradas = [e for e, _ in franjas_dia if e]
+            salidas = [
+                datetime.combine(date.min, e) - datetime.min + timedelta(seconds=duracion_franja(e, s))
+                for e, s in franjas_dia if e and s
+            ]
+            semana.append(DiaHorario(
+                len(franjas_dia),
+                sum(duracion_franja(e, s) for e, s in franjas_dia),
+                min(entradas) if entradas else None,
+                max(salidas) if salidas else None
+            ))
+        semanas[id_horario] = tuple(semana)
+    return semanas
+
+
+# ---------------------------------------------------------------------
+# CACHÉ POR HORARIO
+# ---------------------------------------------------------------------
+
+_cache = {}
+_generacion = 0
+_cache_lock = threading.Lock()
+
+
+def semanas_horarios(ids_horario) -> dict:
+    """{id_horario: semana (tupla de 7 DiaHorario)}; compila los que falten con una sola consulta."""
+    ahora = time.monotonic()
+    semanas = {}
+    faltan = []
+    with _cache_lock:
+        generacion = _generacion
+        for id_horario in set(ids_horario):
+            entrada = _cache.get(id_horario)
+            if entrada and entrada[0] > ahora:
+                semanas[id_horario] = entrada[1]
+            else:
+                faltan.append(id_horario)
+
+    if faltan:
+        compiladas = _compilar(faltan)
+        semanas.update(compiladas)
+        with _cache_lock:
+            # Si se invalidó mientras compilábamos, no se guarda (se recompila en la siguiente petición)
+            if _generacion == generacion:
+                for id_horario, semana in compiladas.items():
+                    _cache[id_horario] = (ahora + CACHE_TTL_SEGUNDOS, semana)
+    return semanas
+
+
+def semana_horario(id_horario):
+    """Semana compilada del horario (SEMANA_VACIA si no hay horario)."""
+    if not id_horario:
+        return SEMANA_VACIA
+    return semanas_horarios([id_horario])[id_horario]
+
+
+def compilar_semana(id_horario):
+    """Semana del horario compilada desde la sesión, sin caché: ve franjas aún sin confirmar (tras flush)."""
+    if not id_horario:
+        return SEMANA_VACIA
+    return _compilar([id_horario])[id_horario]
+
+
+def dia_horario(id_horario, fecha) -> DiaHorario:
+    """Jornada teórica del horario en esa fecha (DIA_LIBRE si no tiene franjas ese día)."""
+    return semana_horario(id_horario)[fecha.weekday()]
+
+
+def invalidar_horario(id_horario):
+    """Descarta la semana cacheada del horario (llamar tras editar sus franjas o días)."""
+    global _generacion
+    with _cache_lock:
+        _cache.pop(id_horario, None)
+        _generacion += 1
+
+
+# ---------------------------------------------------------------------
+# HORAS TEÓRICAS DE UN RANGO
+# ---------------------------------------------------------------------
+
+def contar_dias_semana(desde, hasta):
+    """Nº de lunes, martes... (lista de 7) en [desde, hasta), sin recorrer el rango día a día."""
+    dias = (hasta - desde).days
+    if dias <= 0:
+        return [0] * 7
+    semanas, resto = divmod(dias, 7)
+    cuenta = [semanas] * 7
+    for i in range(resto):
+        cuenta[(desde.weekday() + i) % 7] += 1
+    return cuenta
+
+
+def fusionar_intervalos(intervalos, desde, hasta):
+    """
+    Intervalos de fechas [inicio, fin] (ambos incluidos) recortados a [desde, hasta), ordenados y
+    fusionados si se solapan o se tocan. Devuelve tramos semiabiertos [inicio, fin).
+    """
+    tramos = sorted((max(inicio, desde), min(fin + timedelta(days=1), hasta)) for inicio, fin in intervalos)
+    fusionados = []
+    for inicio, fin in tramos:
+        if inicio >= fin:
+            continue
+        if fusionados and inicio <= fusionados[-1][1]:
+            fusionados[-1][1] = max(fusionados[-1][1], fin)
+        else:
+            fusionados.append([inicio, fin])
+    return [(inicio, fin) for inicio, fin in fusionados]
+
+
+def segundos_teoricos(semana, desde, hasta, ausencias=()):
+    """
+    Segundos teóricos de una semana compilada en [desde, hasta) (fechas), descontando los días
+    cubiertos por ausencias [(fecha_inicio, fecha_fin)] (ambas incluidas). O(7 + nº de ausencias).
+    """
+    segundos = [d.segundos for d in semana]
+    total = sum(n * s for n, s in zip(contar_dias_semana(desde, hasta), segundos))
+    for inicio, fin in fusionar_intervalos(ausencias, desde, hasta):
+        total -= sum(n * s for n, s in zip(contar_dias_semana(inicio, fin), segundos))
+    return total
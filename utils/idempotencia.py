@@ -0,0 +1,76 @@
+"""
+Claves de idempotencia (cabecera Idempotency-Key) para los endpoints de fichaje.
+
+Guarda usuario+clave -> id del Fichaje creado (o trabajador+fecha si aún está en el diario de
+fichajes) durante TTL_SEGUNDOS. Un reintento con la misma clave devuelve ese fichaje sin volver
+a pasar por la lógica de fichaje. Mientras la primera petición sigue en curso la clave queda
+reservada (EN_CURSO).
+
+Usa el mismo tipo de almacén que el antirrebote (memoria del proceso o Redis).
+"""
+
+import threading
+from datetime import datetime
+
+from utils.antirrebote import crear_almacen
+
+TTL_SEGUNDOS = 24 * 3600
+RESERVA_SEGUNDOS = 30
+MAX_ENTRADAS = 20000
+MAX_LONGITUD_CLAVE = 128
+
+EN_CURSO = "EN_CURSO"
+
+_almacen = None
+_almacen_lock = threading.Lock()
+
+
+def configurar_almacen(almacen):
+    global _almacen
+    with _almacen_lock:
+        _almacen = almacen
+
+
+def almacen():
+    global _almacen
+    if _almacen is None:
+        with _almacen_lock:
+            if _almacen is None:
+                _almacen = crear_almacen("idempotencia:", MAX_ENTRADAS)
+    return _almacen
+
+
+def clave_usuario(user_id, clave) -> str:
+    return f"{user_id}:{clave}"
+
+
+def consultar(clave):
+    """
+    None si la clave es nueva, EN_CURSO si otra petición la está procesando, el id del fichaje,
+    o (id_trabajador, fecha_hora) si el fichaje se anotó en el diario y aún no tenía id.
+    """
+    valor = almacen().get(clave)
+    if valor is None or valor == EN_CURSO:
+        return valor
+    if valor.startswith("p:"):
+        _, trabajador_id, fecha_hora = valor.split(":", 2)
+        return int(trabajador_id), datetime.fromisoformat(fecha_hora)
+    return int(valor)
+
+
+def reservar(clave) -> bool:
+    """Reserva la clave para procesarla. False si ya existía (otra petición se adelantó)."""
+    return almacen().add(clave, EN_CURSO, RESERVA_SEGUNDOS)
+
+
+def guardar(clave, fichaje):
+    if fichaje.id_fichaje is not None:
+        valor = str(fichaje.id_fichaje)
+    else:
+        valor = f"p:{fichaje.id_trabajador}:{fichaje.fecha_hora.isoformat()}"
+    almacen().set(clave, valor, TTL_SEGUNDOS)
+
+
+def liberar(clave):
+    """Libera una reserva fallida: el cliente puede reintentar con la misma clave."""
+    almacen().delete(clave)
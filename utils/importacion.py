@@ -0,0 +1,323 @@
+"""
+Alta masiva de empleados desde CSV o XLSX (Empleados > Importar).
+
+- Cabecera en la primera fila (da igual mayúsculas y acentos): nif, nombre, apellidos y email;
+  opcionales telefono, password, rol, horario y nfc. Sin rol, Empleado. Sin password la cuenta
+  queda sin contraseña válida (SIN_CONTRASENA, no se hashea nada) hasta que el empleado la
+  establezca con "¿Has olvidado tu contraseña?".
+- validar() revisa todas las filas antes de dar de alta ninguna. NIF y NFC repetidos en el fichero
+  o ya registrados se buscan por conjuntos (una consulta por columna, no una por fila); rol y
+  horario, por nombre.
+- La importación va como tarea (utils.tareas) con el fichero como entrada, que se borra al
+  terminar. Las contraseñas se hashean en paralelo y las altas entran con INSERT de varias filas
+  por trozos de TROZO_INSERCION, en una sola transacción: o entra el fichero entero o nada.
+- El XLSX se lee con zipfile, igual que utils.nomina lo escribe: sin dependencias nuevas.
+"""
+
+import csv
+import io
+import os
+import re
+import unicodedata
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from xml.etree import ElementTree
+
+from sqlalchemy import insert, or_
+
+from extensions import db
+from utils.claves import generar_hash, metodo_actual
+from models import Trabajador, Rol, Horario
+from utils.nfc import normalizar_uid, uid_invertido, uid_es_valido
+
+# Filas por INSERT.
+TROZO_INSERCION = 500
+
+# Hilos para hashear contraseñas. El hash de werkzeug (scrypt/pbkdf2 de hashlib) corre en C sin el
+# GIL, así que los hilos reparten de verdad el trabajo entre núcleos.
+HILOS_HASH = os.cpu_count() or 2
+
+# Errores que se muestran en pantalla; el informe completo va en el CSV.
+MAX_ERRORES_PANTALLA = 200
+
+ROL_POR_DEFECTO = "Empleado"
+
+# passw de una cuenta sin contraseña: no es un hash de werkzeug, así que ninguna contraseña casa con él.
+SIN_CONTRASENA = "!"
+
+# Nombre de columna normalizado -> campo
+COLUMNAS = {
+    "nif": "nif", "dni": "nif", "nie": "nif",
+    "nombre": "nombre",
+    "apellidos": "apellidos", "apellido": "apellidos",
+    "email": "email", "correo": "email", "e-mail": "email",
+    "telefono": "telef", "telef": "telef", "movil": "telef",
+    "password": "password", "contrasena": "password", "clave": "password",
+    "rol": "rol",
+    "horario": "horario",
+    "nfc": "nfc", "codigo_nfc": "nfc", "tarjeta": "nfc",
+}
+OBLIGATORIAS = ("nif", "nombre", "apellidos", "email")
+OPCIONALES = ("telefono", "password", "rol", "horario", "nfc")
+LARGOS = {"nif": 20, "nombre": 80, "apellidos": 120, "email": 120, "telef": 30, "password": 255, "nfc": 50}
+
+_EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+
+def _normalizar(texto) -> str:
+    texto = unicodedata.normalize("NFKD", str(texto or "")).encode("ascii", "ignore").decode()
+    return texto.strip().lower().replace(" ", "_")
+
+
+# ---------------------------------------------------------------------
+# LECTURA
+# ---------------------------------------------------------------------
+
+def _leer_csv(datos):
+    try:
+        texto = datos.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        texto = datos.decode("latin-1")  # CSV guardado desde Excel en Windows
+
+    try:
+        dialecto = csv.Sniffer().sniff(texto[:4096], delimiters=";,\t")
+    except csv.Error:
+        dialecto = csv.excel
+    return list(csv.reader(io.StringIO(texto), dialecto))
+
+
+_NS = {"m": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+
+def _columna(ref) -> int:
+    """Índice (desde 0) de la columna de una referencia de celda ("C7" -> 2)."""
+    indice = 0
+    for letra in ref:
+        if not letra.isalpha():
+            break
+        indice = indice * 26 + ord(letra.upper()) - 64
+    return indice - 1
+
+
+def _leer_xlsx(datos):
+    """Filas de la primera hoja (valores como texto)."""
+    with zipfile.ZipFile(io.BytesIO(datos)) as libro:
+        nombres = libro.namelist()
+        compartidas = []
+        if "xl/sharedStrings.xml" in nombres:
+            for si in ElementTree.fromstring(libro.read("xl/sharedStrings.xml")).findall("m:si", _NS):
+                compartidas.append("".join(t.text or "" for t in si.iter(f"{{{_NS['m']}}}t")))
+        hojas = sorted(n for n in nombres if re.fullmatch(r"xl/worksheets/sheet\d+\.xml", n))
+        if not hojas:
+            raise ValueError("El XLSX no tiene hojas.")
+        hoja = ElementTree.fromstring(libro.read(min(hojas, key=lambda n: int(re.search(r"\d+", n).group()))))
+
+    filas = []
+    for fila in hoja.iter(f"{{{_NS['m']}}}row"):
+        valores = {}
+        for celda in fila.findall("m:c", _NS):
+            tipo = celda.get("t")
+            if tipo == "inlineStr":
+                valor = "".join(t.text or "" for t in celda.iter(f"{{{_NS['m']}}}t"))
+            else:
+                v = celda.find("m:v", _NS)
+                valor = v.text if v is not None and v.text is not None else ""
+                if tipo == "s" and valor:
+                    valor = compartidas[int(valor)]
+                elif tipo in (None, "n") and valor.endswith(".0"):
+                    valor = valor[:-2]  # teléfonos y NIF numéricos guardados como número
+            valores[_columna(celda.get("r", "A"))] = valor
+        if valores:
+            fila_lista = [""] * (max(valores) + 1)
+            for i, valor in valores.items():
+                fila_lista[i] = valor
+            filas.append(fila_lista)
+    return filas
+
+
+def leer_filas(nombre_fichero, datos) -> list:
+    """
+    [(nº de fila en el fichero, {campo: texto})] de un CSV o XLSX con cabecera.
+    ValueError si el fichero no se puede leer o le faltan columnas obligatorias.
+    """
+    extension = os.path.splitext(nombre_fichero or "")[1].lower()
+    try:
+        if extension == ".xlsx":
+            crudas = _leer_xlsx(datos)
+        elif extension == ".csv":
+            crudas = _leer_csv(datos)
+        else:
+            raise ValueError("Sube un fichero .csv o .xlsx.")
+    except (zipfile.BadZipFile, ElementTree.ParseError, KeyError, IndexError) as e:
+        raise ValueError(f"No se ha podido leer el fichero: {e}")
+
+    if not crudas:
+        raise ValueError("El fichero está vacío.")
+
+    campos = [COLUMNAS.get(_normalizar(c)) for c in crudas[0]]
+    faltan = [c for c in OBLIGATORIAS if c not in campos]
+    if faltan:
+        raise ValueError(f"Faltan columnas obligatorias: {', '.join(faltan)}.")
+
+    filas = []
+    for numero, cruda in enumerate(crudas[1:], start=2):
+        fila = {campo: (valor or "").strip() for campo, valor in zip(campos, cruda) if campo}
+        if any(fila.values()):
+            filas.append((numero, fila))
+    return filas
+
+
+# ---------------------------------------------------------------------
+# VALIDACIÓN
+# ---------------------------------------------------------------------
+
+def _nfc(texto):
+    """(codigo_nfc como lo guarda el alta manual, forma canónica) o (None, None)."""
+    codigo = texto.strip().upper().replace(":", "").replace("-", "").replace(" ", "")
+    if not codigo:
+        return None, None
+    return codigo, normalizar_uid(codigo)
+
+
+def validar(filas, empresa_id):
+    """
+    Comprueba todas las filas. Devuelve (altas, errores):
+    altas = [dict con las columnas de trabajador y "password" en claro o None] si no hay ningún error;
+    errores = [(nº de fila, mensaje)].
+    """
+    errores = []
+    roles = {_normalizar(nombre): id_rol for id_rol, nombre in db.session.query(Rol.id_rol, Rol.nombre_rol)}
+    horarios = {
+        _normalizar(nombre): id_horario
+        for id_horario, nombre in db.session.query(Horario.id_horario, Horario.nombre_horario).filter(
+            Horario.empresa_id == empresa_id
+        )
+    }
+
+    # Primera pasada: formato de cada fila y repetidos dentro del fichero
+    candidatas = []
+    fila_nif, fila_nfc = {}, {}
+    for numero, fila in filas:
+        mensajes = [f"Falta {campo}." for campo in OBLIGATORIAS if not fila.get(campo)]
+        mensajes += [
+            f"{campo} pasa de {largo} caracteres." for campo, largo in LARGOS.items()
+            if len(fila.get(campo) or "") > largo
+        ]
+
+        nif = (fila.get("nif") or "").upper()
+        if nif:
+            if nif in fila_nif:
+                mensajes.append(f"NIF {nif} repetido en el fichero (fila {fila_nif[nif]}).")
+            else:
+                fila_nif[nif] = numero
+
+        email = fila.get("email") or ""
+        if email and not _EMAIL_RE.match(email):
+            mensajes.append(f"Email no válido: {email}.")
+
+        codigo_nfc, canonico = _nfc(fila.get("nfc") or "")
+        if codigo_nfc:
+            if not uid_es_valido(canonico):
+                mensajes.append(f"Código NFC no válido: {fila['nfc']}.")
+            elif canonico in fila_nfc:
+                mensajes.append(f"Código NFC repetido en el fichero (fila {fila_nfc[canonico]}).")
+            else:
+                fila_nfc[canonico] = numero
+
+        rol = _normalizar(fila.get("rol") or ROL_POR_DEFECTO)
+        if rol not in roles:
+            mensajes.append(f"Rol desconocido: {fila.get('rol') or ROL_POR_DEFECTO}.")
+
+        horario = _normalizar(fila.get("horario"))
+        if horario and horario not in horarios:
+            mensajes.append(f"Horario desconocido en la empresa: {fila['horario']}.")
+
+        errores += [(numero, m) for m in mensajes]
+        if not mensajes:
+            candidatas.append((numero, fila, nif, codigo_nfc, canonico, roles.get(rol), horarios.get(horario)))
+
+    # Segunda pasada: contra lo ya registrado, una consulta por columna
+    registrados_nif = {
+        nif for (nif,) in db.session.query(Trabajador.nif).filter(Trabajador.nif.in_(list(fila_nif)))
+    } if fila_nif else set()
+
+    registrados_nfc = set()
+    if fila_nfc:
+        for canonico, invertido in db.session.query(
+            Trabajador.nfc_canonico, Trabajador.nfc_invertido
+        ).filter(or_(
+            Trabajador.nfc_canonico.in_(list(fila_nfc)),
+            Trabajador.nfc_invertido.in_(list(fila_nfc))
+        )):
+            # Una tarjeta nueva que coincide con otra en cualquier sentido sería ambigua en el kiosko
+            registrados_nfc.update(x for x in (canonico, invertido) if x)
+
+    altas = []
+    for numero, fila, nif, codigo_nfc, canonico, id_rol, id_horario in candidatas:
+        if nif in registrados_nif:
+            errores.append((numero, f"El NIF {nif} ya está registrado."))
+            continue
+        if canonico and canonico in registrados_nfc:
+            errores.append((numero, "Ese código NFC ya está asignado a otro empleado."))
+            continue
+        altas.append({
+            "nif": nif,
+            "nombre": fila["nombre"],
+            "apellidos": fila["apellidos"],
+            "email": fila["email"],
+            "telef": fila.get("telef") or None,
+            "idEmpresa": empresa_id,
+            "idHorario": id_horario,
+            "idRol": id_rol,
+            # El INSERT por lotes no pasa por el @validates del modelo: las formas NFC van a mano
+            "codigo_nfc": codigo_nfc,
+            "nfc_canonico": canonico or None,
+            "nfc_invertido": uid_invertido(canonico) or None,
+            "password": fila.get("password") or None,
+        })
+
+    errores.sort()
+    return (altas if not errores else []), errores
+
+
+def informe_errores(errores) -> bytes:
+    """CSV (fila;error) con todos los errores, para descargar."""
+    salida = io.StringIO()
+    escritor = csv.writer(salida, delimiter=";")
+    escritor.writerow(["fila", "error"])
+    escritor.writerows(errores)
+    return salida.getvalue().encode("utf-8-sig")
+
+
+# ---------------------------------------------------------------------
+# ALTA
+# ---------------------------------------------------------------------
+
+def importar(altas, avanzar=None) -> int:
+    """Hashea las contraseñas en paralelo e inserta las altas por trozos (sin commit). Devuelve cuántas."""
+    total = len(altas)
+    for alta in altas:
+        alta["passw"] = SIN_CONTRASENA
+    con_clave = [alta for alta in altas if alta["password"]]
+
+    # El método se lee aquí: los hilos del pool no tienen contexto de app (ni CLAVES_METODO)
+    hashear = partial(generar_hash, metodo=metodo_actual())
+    pool = ThreadPoolExecutor(max_workers=HILOS_HASH)
+    try:
+        claves = pool.map(hashear, [alta["password"] for alta in con_clave])
+        for i, (alta, hash_) in enumerate(zip(con_clave, claves), 1):
+            alta["passw"] = hash_
+            if avanzar:
+                avanzar(i, len(con_clave) + total, "Cifrando contraseñas...")
+    finally:
+        # Si la tarea se cancela a medias no se espera a los hashes que faltan
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    for alta in altas:
+        del alta["password"]
+    for inicio in range(0, total, TROZO_INSERCION):
+        db.session.execute(insert(Trabajador), altas[inicio:inicio + TROZO_INSERCION])
+        if avanzar:
+            avanzar(len(con_clave) + min(inicio + TROZO_INSERCION, total), len(con_clave) + total, "Dando de alta...")
+    return total
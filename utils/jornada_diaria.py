@@ -0,0 +1,182 @@
+"""
+Agregado jornada_diaria: segundos trabajados por trabajador y día.
+
+Cada alta, edición o borrado de fichajes recalcula solo los días afectados (recalcular_jornadas),
+de modo que los resúmenes suman como mucho una fila por día del rango en vez de volver a
+emparejar todos los fichajes. El emparejamiento es el de siempre (emparejar_dia), por día natural.
+Es la única fuente de horas trabajadas de los resúmenes (/resumen, rango y acumulado del panel
+RRHH, plantilla y nómina), así que las cifras de una misma pantalla cuadran entre sí.
+
+Con los mismos días se rehacen los turnos (utils.turnos), que emparejan sin cortar por día.
+
+El comando `flask reconstruir-jornadas` rellena la tabla y comprueba desviaciones.
+"""
+
+from datetime import datetime, time, timedelta
+
+from extensions import db
+from models import Fichaje, JornadaDiaria
+from utils.saldos import sumar_trabajado
+from utils.turnos import rehacer_turnos
+
+CAMPOS = ("segundos_trabajados", "incompleta", "primera_entrada", "ultima_salida")
+
+
+def emparejar_dia(fichajes_day):
+    """
+    Empareja fichajes ENTRADA/SALIDA en un día para calcular segundos trabajados.
+    Devuelve (worked_seconds, incomplete_flag).
+    """
+    fichajes_day = sorted(fichajes_day, key=lambda f: f.fecha_hora)
+    worked = 0
+    incomplete = False
+    last_in = None
+    last_type = None
+
+    for f in fichajes_day:
+        t = (f.tipo or "").strip().upper()
+        if t not in ("ENTRADA", "SALIDA"):
+            incomplete = True
+            continue
+
+        if last_type == t:
+            incomplete = True
+
+        if t == "ENTRADA":
+            last_in = f.fecha_hora
+        else:
+            if last_in is None:
+                incomplete = True
+            else:
+                delta = int((f.fecha_hora - last_in).total_seconds())
+                if delta <= 0:
+                    incomplete = True
+                else:
+                    worked += delta
+                last_in = None
+        last_type = t
+
+    if last_in is not None:
+        incomplete = True
+
+    return worked, incomplete
+
+
+def calcular_jornada(fichajes_day):
+    """Valores del agregado para los fichajes de un día (lista vacía -> None: no hay jornada)."""
+    if not fichajes_day:
+        return None
+
+    worked, incomplete = emparejar_dia(fichajes_day)
+    tipos = [((f.tipo or "").strip().upper(), f.fecha_hora) for f in fichajes_day]
+    entradas = [fh for t, fh in tipos if t == "ENTRADA"]
+    salidas = [fh for t, fh in tipos if t == "SALIDA"]
+    return {
+        "segundos_trabajados": worked,
+        "incompleta": incomplete,
+        "primera_entrada": min(entradas) if entradas else None,
+        "ultima_salida": max(salidas) if salidas else None,
+    }
+
+
+def _fichajes_dia(trabajador_id, fecha):
+    inicio = datetime.combine(fecha, time.min)
+    return Fichaje.query.filter(
+        Fichaje.id_trabajador == trabajador_id,
+        Fichaje.fecha_hora >= inicio,
+        Fichaje.fecha_hora < inicio + timedelta(days=1)
+    ).order_by(Fichaje.fecha_hora.asc(), Fichaje.id_fichaje.asc()).all()
+
+
+def _guardar(trabajador_id, fecha, valores):
+    jornada = JornadaDiaria.query.get((trabajador_id, fecha))
+    antes = jornada.segundos_trabajados if jornada is not None else 0
+    despues = valores["segundos_trabajados"] if valores is not None else 0
+    # Las sumas prefijas mensuales del saldo se mueven con la diferencia
+    sumar_trabajado(trabajador_id, fecha, despues - antes)
+
+    if valores is None:
+        if jornada is not None:
+            db.session.delete(jornada)
+        return
+    if jornada is None:
+        jornada = JornadaDiaria(id_trabajador=trabajador_id, fecha=fecha)
+        db.session.add(jornada)
+    for campo, valor in valores.items():
+        setattr(jornada, campo, valor)
+
+
+def recalcular_jornada(trabajador_id, fecha):
+    """Recalcula (o borra si ya no hay fichajes) la jornada de un trabajador en un día y sus turnos (sin commit)."""
+    recalcular_jornadas([(trabajador_id, fecha)])
+
+
+def recalcular_jornadas(dias):
+    """Recalcula un conjunto de (id_trabajador, fecha) (sin commit). Requiere los fichajes ya en la sesión (flush)."""
+    por_trabajador = {}
+    for trabajador_id, fecha in sorted(set(dias)):
+        fichajes = _fichajes_dia(trabajador_id, fecha)
+        _guardar(trabajador_id, fecha, calcular_jornada(fichajes))
+        por_trabajador.setdefault(trabajador_id, []).append((fecha, fichajes))
+
+    # Turnos: un solo tramo por trabajador, del primer al último día tocado. Si los días son
+    # seguidos (lo normal: uno) ya tenemos todos sus fichajes y no se vuelven a leer.
+    for trabajador_id, tocados in por_trabajador.items():
+        desde, hasta = tocados[0][0], tocados[-1][0]
+        seguidos = (hasta - desde).days == len(tocados) - 1
+        rehacer_turnos(
+            trabajador_id, desde, hasta,
+            fichajes_dias=[f for _, fichajes in tocados for f in fichajes] if seguidos else None,
+        )
+
+
+def resumen_jornadas(trabajador_id, desde, hasta):
+    """
+    Suma del agregado en [desde, hasta) (fechas).
+    Devuelve (segundos trabajados, lista ordenada de fechas con jornada incompleta).
+    """
+    filas = db.session.query(
+        JornadaDiaria.fecha, JornadaDiaria.segundos_trabajados, JornadaDiaria.incompleta
+    ).filter(
+        JornadaDiaria.id_trabajador == trabajador_id,
+        JornadaDiaria.fecha >= desde,
+        JornadaDiaria.fecha < hasta
+    ).order_by(JornadaDiaria.fecha.asc()).all()
+
+    return sum(f.segundos_trabajados for f in filas), [f.fecha for f in filas if f.incompleta]
+
+
+def verificar_jornadas(trabajador_id, desde, hasta, reparar=False):
+    """
+    Compara el agregado de [desde, hasta) con lo que sale de los fichajes.
+    Devuelve la lista de desviaciones (fecha, guardado, esperado); con reparar=True las corrige (sin commit).
+    """
+    inicio = datetime.combine(desde, time.min)
+    fin = datetime.combine(hasta, time.min)
+
+    por_dia = {}
+    for f in Fichaje.query.filter(
+        Fichaje.id_trabajador == trabajador_id,
+        Fichaje.fecha_hora >= inicio,
+        Fichaje.fecha_hora < fin
+    ).order_by(Fichaje.fecha_hora.asc(), Fichaje.id_fichaje.asc()):
+        por_dia.setdefault(f.fecha_hora.date(), []).append(f)
+
+    guardadas = {
+        j.fecha: j for j in JornadaDiaria.query.filter(
+            JornadaDiaria.id_trabajador == trabajador_id,
+            JornadaDiaria.fecha >= desde,
+            JornadaDiaria.fecha < hasta
+        )
+    }
+
+    desviaciones = []
+    for fecha in sorted(set(por_dia) | set(guardadas)):
+        esperado = calcular_jornada(por_dia.get(fecha, []))
+        jornada = guardadas.get(fecha)
+        guardado = None if jornada is None else {campo: getattr(jornada, campo) for campo in CAMPOS}
+        if guardado != esperado:
+            desviaciones.append((fecha, guardado, esperado))
+            if reparar:
+                _guardar(trabajador_id, fecha, esperado)
+    return desviaciones
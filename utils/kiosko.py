@@ -0,0 +1,60 @@
+"""
+Terminales kiosko: tokens de dispositivo por empresa.
+
+El token en claro solo se entrega al crearlo; en BD se guarda su SHA-256.
+La resolución token -> terminal se cachea unos segundos para que cada toque de tarjeta
+solo pague la búsqueda del trabajador.
+"""
+
+import hashlib
+import secrets
+import threading
+import time
+from collections import namedtuple
+
+from models import TerminalKiosko
+
+CACHE_TTL_SEGUNDOS = 60
+
+# Copia inmutable de lo que necesita el fichaje (no depende de la sesión SQLAlchemy)
+Terminal = namedtuple("Terminal", "id_terminal empresa_id nombre latitud longitud")
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def generar_token() -> str:
+    return secrets.token_urlsafe(32)
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def terminal_por_token(token: str):
+    """Terminal activo asociado al token, o None."""
+    if not token:
+        return None
+
+    token_hash = hash_token(token)
+    ahora = time.monotonic()
+    with _cache_lock:
+        entrada = _cache.get(token_hash)
+    if entrada and entrada[0] > ahora:
+        return entrada[1]
+
+    t = TerminalKiosko.query.filter_by(token_hash=token_hash, activo=True).first()
+    if not t:
+        # Los tokens inválidos no se cachean (evita llenar la caché con basura)
+        return None
+
+    terminal = Terminal(t.id_terminal, t.empresa_id, t.nombre, t.latitud, t.longitud)
+    with _cache_lock:
+        _cache[token_hash] = (ahora + CACHE_TTL_SEGUNDOS, terminal)
+    return terminal
+
+
+def invalidar_terminal(token_hash: str):
+    """Olvida un terminal cacheado (al desactivarlo)."""
+    with _cache_lock:
+        _cache.pop(token_hash, None)
@@ -0,0 +1,144 @@
+"""
+Listado de jornadas de RRHH (/fichajes) por páginas, de lo más reciente a lo más antiguo.
+
+- Las jornadas son los turnos guardados (utils.turnos): aquí no se re-empareja nada.
+- Paginación por cursor (keyset) sobre (fecha_ref, id_turno): cada página es una consulta con
+  LIMIT que sigue donde acabó la anterior, sin OFFSET, así que cuesta lo mismo la primera página
+  que una de hace dos años.
+- Los filtros por estado ("sin cierre de más de 16 h" en toda la empresa, etc.) van por el índice
+  (empresa_id, estado, fecha_ref) y comparan con la hora, sin esperar al barrido.
+"""
+
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import contains_eager, selectinload
+
+from models import Trabajador, Turno
+from utils.turnos import EN_CURSO, SIN_SALIDA, SIN_ENTRADA, CERRADA, LARGA, ABIERTOS, corte_sin_cierre
+
+# Jornadas por página.
+PAGINA_JORNADAS = 100
+
+_FORMATO_FECHA = "%Y%m%d%H%M%S%f"
+
+TZ = ZoneInfo("Europe/Madrid")
+
+# Filtro del listado -> etiqueta
+FILTROS_ESTADO = {
+    "en_curso": "En curso",
+    "sin_cierre": "Sin cierre (más de 16 h)",
+    "sin_salida": "Sin salida",
+    "sin_entrada": "Sin entrada",
+    "larga": "Más de 12 h",
+    "cerrada": "Cerradas",
+}
+
+
+def _local_now_naive():
+    """Hora local de España sin tzinfo, como se guardan los fichajes."""
+    return datetime.now(TZ).replace(tzinfo=None)
+
+
+def query_jornadas_empresa(empresa_id, empleado_id=None, desde=None, hasta=None, estado=None, ahora=None):
+    """
+    Turnos de la empresa con filtros opcionales. Las fechas filtran fecha_ref como rango semiabierto
+    [desde 00:00, hasta+1 00:00), igual que query_fichajes_empresa.
+    """
+    query = Turno.query.join(Trabajador, Trabajador.id_trabajador == Turno.id_trabajador).filter(
+        Turno.empresa_id == empresa_id
+    )
+
+    if empleado_id:
+        query = query.filter(Turno.id_trabajador == empleado_id)
+
+    if desde:
+        query = query.filter(Turno.fecha_ref >= datetime.combine(desde, time.min))
+
+    if hasta:
+        query = query.filter(Turno.fecha_ref < datetime.combine(hasta + timedelta(days=1), time.min))
+
+    corte = corte_sin_cierre(ahora)
+    if estado == "en_curso":
+        query = query.filter(Turno.estado == EN_CURSO, Turno.fecha_ref >= corte)
+    elif estado == "sin_cierre":
+        # Incluye los EN_CURSO ya vencidos que el barrido aún no ha pasado
+        query = query.filter(Turno.estado.in_(ABIERTOS), Turno.fecha_ref < corte)
+    elif estado == "sin_salida":
+        query = query.filter(Turno.estado == SIN_SALIDA)
+    elif estado == "sin_entrada":
+        query = query.filter(Turno.estado == SIN_ENTRADA)
+    elif estado == "larga":
+        query = query.filter(Turno.estado == LARGA)
+    elif estado == "cerrada":
+        query = query.filter(Turno.estado == CERRADA)
+
+    return query
+
+
+def leer_cursor(texto):
+    """(fecha_ref, id_turno) del cursor, o None si falta o no es válido."""
+    if not texto:
+        return None
+    try:
+        fecha, id_turno = texto.split("_")
+        return datetime.strptime(fecha, _FORMATO_FECHA), int(id_turno)
+    except ValueError:
+        return None
+
+
+def _cursor(turno):
+    return f"{turno.fecha_ref.strftime(_FORMATO_FECHA)}_{turno.id_turno}"
+
+
+def _jornada(turno, ahora):
+    """Jornada con las claves que espera fichajes_list.html."""
+    entrada, salida = turno.fichaje_entrada, turno.fichaje_salida
+    jornada = {
+        'trabajador': turno.trabajador,
+        'entrada': entrada,
+        'salida': salida,
+        'estado': turno.estado,
+        'fecha_ref': turno.fecha_ref,
+    }
+
+    if turno.estado in (CERRADA, LARGA):
+        horas = (turno.salida - turno.entrada).total_seconds() / 3600
+        jornada['duracion'] = f"{int(horas)}h {int((horas*60)%60)}m"
+        jornada['status'] = 'warning' if turno.estado == LARGA else 'closed'
+    elif turno.estado in ABIERTOS:
+        horas = (ahora - turno.entrada).total_seconds() / 3600
+        jornada['duracion'] = f"En curso ({int(horas)}h)"
+        abierta = turno.estado == EN_CURSO and turno.entrada >= corte_sin_cierre(ahora)
+        jornada['status'] = 'active' if abierta else 'error'
+    elif turno.estado == SIN_SALIDA:
+        jornada['duracion'] = "Error: Sin salida"
+        jornada['status'] = 'error'
+    else:
+        jornada['duracion'] = "Error: Sin entrada"
+        jornada['status'] = 'error'
+    return jornada
+
+
+def pagina_jornadas(query, cursor=None, tam=PAGINA_JORNADAS, ahora=None):
+    """
+    Una página de `query` (query_jornadas_empresa), de la jornada más reciente a la más antigua.
+    Devuelve (jornadas, cursor de la siguiente página o None si era la última).
+    """
+    if cursor:
+        fecha_ref, id_turno = cursor
+        query = query.filter(or_(
+            Turno.fecha_ref < fecha_ref,
+            and_(Turno.fecha_ref == fecha_ref, Turno.id_turno < id_turno)
+        ))
+
+    turnos = query.options(
+        contains_eager(Turno.trabajador),
+        selectinload(Turno.fichaje_entrada),
+        selectinload(Turno.fichaje_salida)
+    ).order_by(Turno.fecha_ref.desc(), Turno.id_turno.desc()).limit(tam + 1).all()
+
+    siguiente = _cursor(turnos[tam - 1]) if len(turnos) > tam else None
+    ahora = ahora or _local_now_naive()
+    return [_jornada(t, ahora) for t in turnos[:tam]], siguiente
@@ -0,0 +1,78 @@
+"""
+UIDs NFC: normalización a HEX canónico y comparación tolerante (separadores, endianness).
+"""
+
+import re
+
+# Regex defensiva para validar UIDs en HEX puro.
+_UID_RE = re.compile(r"^[0-9A-F]+$")
+
+
+def normalizar_uid(uid: str) -> str:
+    """
+    Convierte cualquier UID recibido a un formato canónico:
+    - Uppercase
+    - Sin 0x
+    - Sin separadores (: - espacios)
+    - Solo HEX (0-9A-F)
+    """
+    if not uid:
+        return ""
+    cleaned = re.sub(r"[^0-9A-F]", "", uid.strip().upper())
+    if len(cleaned) % 2 == 1:
+        cleaned = "0" + cleaned
+    return cleaned
+
+
+def uid_es_valido(uid_hex: str) -> bool:
+    """
+    UID válido = HEX puro y no vacío.
+    """
+    return bool(uid_hex) and bool(_UID_RE.fullmatch(uid_hex))
+
+
+def uid_invertido(uid_hex: str) -> str:
+    """
+    Invierte el UID por bytes (endianness), por si el lector devuelve orden inverso.
+    Ej: A1B2C3D4 -> D4C3B2A1
+    """
+    uid_hex = normalizar_uid(uid_hex)
+    if len(uid_hex) < 2:
+        return uid_hex
+
+    if len(uid_hex) % 2 == 1:
+        uid_hex = "0" + uid_hex
+
+    pares = [uid_hex[i:i + 2] for i in range(0, len(uid_hex), 2)]
+    pares.reverse()
+    return "".join(pares)
+
+
+def uids_equivalentes(uid_recibido_raw: str, uid_guardado_raw: str) -> bool:
+    """
+    Decide si el UID recibido equivale al guardado, tolerando:
+    - separadores / 0x / mayúsculas
+    - inversión por bytes (endianness)
+    - ceros a la izquierda (dependiendo del lector)
+    """
+    recibido = normalizar_uid(uid_recibido_raw)
+    guardado = normalizar_uid(uid_guardado_raw)
+
+    if not uid_es_valido(recibido) or not uid_es_valido(guardado):
+        return False
+
+    if recibido == guardado:
+        return True
+
+    r0 = recibido.lstrip("0")
+    g0 = guardado.lstrip("0")
+    if r0 and g0 and r0 == g0:
+        return True
+
+    if uid_invertido(recibido) == guardado:
+        return True
+
+    if recibido == uid_invertido(guardado):
+        return True
+
+    return False
@@ -0,0 +1,175 @@
+"""
+Exportación para nómina: resumen mensual de toda la plantilla en CSV o XLSX, en streaming.
+
+- Mismas cifras que /empresa/resumen-mensual: cada lote se calcula con resumenes_lote
+  (utils.resumen_empresa), que suma jornada_diaria como /resumen.
+- La plantilla se recorre con un cursor de servidor (conexión propia) por lotes de LOTE_TRABAJADORES;
+  cada lote hace tres consultas (ausencias, resúmenes cerrados y jornadas) y se emite enseguida.
+  La memoria depende del tamaño del lote, no del de la empresa.
+- El XLSX se escribe a mano (XML de la hoja con cadenas en línea) dentro de un zip en streaming.
+"""
+
+import csv
+import io
+import zipfile
+from xml.sax.saxutils import escape
+
+from extensions import db
+from models import Trabajador
+from utils.resumen_empresa import LOTE_TRABAJADORES, rango_mes, resumenes_lote
+
+CABECERA = (
+    "NIF", "Apellidos", "Nombre", "Mes", "Horas teóricas", "Horas trabajadas", "Saldo",
+    "Días incompletos", "Fechas incompletas", "Mes cerrado"
+)
+
+
+def _lotes_trabajadores(empresa_id):
+    """Lotes de (id, nif, nombre, apellidos, idHorario) de la empresa, por apellidos y nombre."""
+    consulta = db.select(
+        Trabajador.id_trabajador, Trabajador.nif, Trabajador.nombre, Trabajador.apellidos, Trabajador.idHorario
+    ).where(Trabajador.idEmpresa == empresa_id).order_by(
+        Trabajador.apellidos, Trabajador.nombre, Trabajador.id_trabajador
+    )
+    # Conexión aparte: el cursor de servidor queda abierto mientras la sesión consulta cada lote
+    with db.engine.connect() as conexion:
+        resultado = conexion.execution_options(stream_results=True, yield_per=LOTE_TRABAJADORES).execute(consulta)
+        for lote in resultado.partitions():
+            yield lote
+
+
+def resumenes_empresa(empresa_id, anio, mes):
+    """Generador con el resumen del mes de cada trabajador de la empresa, por apellidos y nombre."""
+    inicio, fin = rango_mes(anio, mes)
+    for lote in _lotes_trabajadores(empresa_id):
+        yield from resumenes_lote(lote, inicio, fin)
+
+
+def _fila(r, numero):
+    """Valores de una fila de la exportación; `numero` da formato a las horas."""
+    return (
+        r["nif"], r["apellidos"], r["nombre"], r["mes"],
+        numero(r["teoricas"]), numero(r["trabajadas"]), numero(r["saldo"]),
+        len(r["dias_incompletos"]), " ".join(r["dias_incompletos"]), "Sí" if r["cerrado"] else "No"
+    )
+
+
+# ---------------------------------------------------------------------
+# CSV
+# ---------------------------------------------------------------------
+
+def csv_stream(resumenes, filas_por_trozo=200):
+    """
+    CSV para Excel en español (BOM UTF-8, separador ';' y coma decimal), en trozos de texto.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=";")
+    buffer.write("\ufeff")
+    writer.writerow(CABECERA)
+
+    for i, r in enumerate(resumenes, 1):
+        writer.writerow(_fila(r, lambda h: f"{h:.2f}".replace(".", ",")))
+        if i % filas_por_trozo == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+# ---------------------------------------------------------------------
+# XLSX
+# ---------------------------------------------------------------------
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{nombre}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+
+
+class _Salida(io.RawIOBase):
+    """Fichero de solo escritura y no posicionable: acumula lo escrito hasta que se recoge."""
+
+    def __init__(self):
+        self._trozos = []
+
+    def writable(self):
+        return True
+
+    def write(self, datos):
+        self._trozos.append(bytes(datos))
+        return len(datos)
+
+    def recoger(self) -> bytes:
+        datos = b"".join(self._trozos)
+        self._trozos = []
+        return datos
+
+
+def _celda(valor):
+    if isinstance(valor, (int, float)):
+        return f"<c><v>{valor}</v></c>"
+    return f'<c t="inlineStr"><is><t>{escape(str(valor))}</t></is></c>'
+
+
+def _fila_xml(valores):
+    return "<row>" + "".join(_celda(v) for v in valores) + "</row>"
+
+
+def xlsx_stream(resumenes, nombre_hoja="Resumen", filas_por_trozo=200):
+    """
+    Libro XLSX de una hoja, en trozos de bytes. El zip va sin posicionar (descriptores de datos)
+    y la hoja se comprime según se generan las filas.
+    """
+    salida = _Salida()
+    with zipfile.ZipFile(salida, "w", compression=zipfile.ZIP_DEFLATED) as libro:
+        libro.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        libro.writestr("_rels/.rels", _RELS)
+        libro.writestr("xl/workbook.xml", _WORKBOOK.format(nombre=escape(nombre_hoja, {'"': "&quot;"})))
+        libro.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        yield salida.recoger()
+
+        with libro.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as hoja:
+            hoja.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            hoja.write(_fila_xml(CABECERA).encode("utf-8"))
+            for i, r in enumerate(resumenes, 1):
+                hoja.write(_fila_xml(_fila(r, lambda h: h)).encode("utf-8"))
+                if i % filas_por_trozo == 0:
+                    yield salida.recoger()
+            hoja.write(b"</sheetData></worksheet>")
+    yield salida.recoger()
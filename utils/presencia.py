@@ -0,0 +1,175 @@
+"""
+Tablero "quién está dentro" por empresa: en memoria y servido por SSE (/presencia/stream).
+
+- Cada empresa tiene su mapa trabajador -> dentro/fuera desde su último fichaje. En frío se carga
+  con una sola consulta (plantilla + estado_trabajador, que ya guarda el último fichaje de cada uno).
+- registrar_fichaje y recalcular_estado (utils.estado_trabajador) anotan el cambio en la sesión y
+  se aplica al confirmarla (after_commit): un fichaje que se deshace no llega al tablero.
+- Las conexiones SSE esperan en memoria a que cambie la versión de su empresa, así que cientos de
+  tableros abiertos no consultan la BD. El mapa es de cada proceso: con varios procesos, lo fichado
+  en otro se ve al recargarlo (cada REFRESCO_SEGUNDOS mientras alguien lo mira).
+- Un fichaje solo toca el tablero de la empresa del trabajador. Cada conexión SSE dura como mucho
+  DURACION_SEGUNDOS y el navegador reconecta: ningún tablero olvidado ocupa un hilo para siempre.
+"""
+
+import json
+import threading
+import time
+from collections import deque
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from extensions import db
+from models import Trabajador, EstadoTrabajador
+
+# Antigüedad máxima del mapa de una empresa antes de recargarlo de la BD.
+REFRESCO_SEGUNDOS = 60
+
+# Cada cuánto manda el SSE un comentario para que proxies y navegador no corten la conexión.
+LATIDO_SEGUNDOS = 15
+
+# Vida máxima de una conexión SSE: al cerrarla, EventSource reconecta solo (a los RECONEXION_MS)
+# y el hilo/worker que la servía queda libre aunque el navegador se haya quedado abierto.
+DURACION_SEGUNDOS = 10 * 60
+RECONEXION_MS = 2000
+
+_cambio = threading.Condition()
+_tableros = {}                     # empresa_id -> _Tablero
+_registro = deque(maxlen=1000)     # (secuencia, id_trabajador, tipo, fecha_hora) ya aplicados
+_secuencia = 0
+
+
+class _Tablero:
+    def __init__(self, trabajadores, version):
+        self.trabajadores = trabajadores  # id_trabajador -> fila (dict)
+        self.version = version
+        self.cargado = time.monotonic()
+        self.cargando = False
+
+
+def _poner(fila, tipo, fecha_hora):
+    fila["dentro"] = tipo == "ENTRADA"
+    fila["desde"] = fecha_hora.isoformat(timespec="minutes") if fecha_hora else None
+
+
+def _cargar(empresa_id):
+    """Mapa de la plantilla desde la BD (una consulta)."""
+    trabajadores = {}
+    for id_trabajador, nombre, apellidos, tipo, fecha_hora in db.session.query(
+        Trabajador.id_trabajador, Trabajador.nombre, Trabajador.apellidos,
+        EstadoTrabajador.ultimo_tipo, EstadoTrabajador.ultimo_fecha_hora
+    ).outerjoin(
+        EstadoTrabajador, EstadoTrabajador.id_trabajador == Trabajador.id_trabajador
+    ).filter(Trabajador.idEmpresa == empresa_id):
+        fila = {"id": id_trabajador, "nombre": f"{nombre} {apellidos or ''}".strip()}
+        _poner(fila, tipo, fecha_hora)
+        trabajadores[id_trabajador] = fila
+    return trabajadores
+
+
+def _siguiente():
+    global _secuencia
+    _secuencia += 1
+    return _secuencia
+
+
+def tablero(empresa_id):
+    """(versión, filas ordenadas por nombre) de la empresa; lo carga o recarga si hace falta."""
+    with _cambio:
+        actual = _tableros.get(empresa_id)
+        vigente = actual is not None and time.monotonic() - actual.cargado < REFRESCO_SEGUNDOS
+        if vigente or (actual is not None and actual.cargando):
+            return actual.version, sorted(actual.trabajadores.values(), key=lambda f: f["nombre"])
+        if actual is not None:
+            actual.cargando = True
+        desde_secuencia = _secuencia
+
+    try:
+        trabajadores = _cargar(empresa_id)
+    finally:
+        if actual is not None:
+            actual.cargando = False
+
+    with _cambio:
+        # Los cambios aplicados durante la carga se repiten encima (son idempotentes)
+        for secuencia, id_trabajador, tipo, fecha_hora in _registro:
+            if secuencia > desde_secuencia and id_trabajador in trabajadores:
+                _poner(trabajadores[id_trabajador], tipo, fecha_hora)
+
+        actual = _tableros.get(empresa_id)
+        if actual is not None and actual.trabajadores == trabajadores:
+            actual.cargado = time.monotonic()
+        else:
+            actual = _tableros[empresa_id] = _Tablero(trabajadores, _siguiente())
+            _cambio.notify_all()
+        return actual.version, sorted(actual.trabajadores.values(), key=lambda f: f["nombre"])
+
+
+def esperar_cambio(empresa_id, version, segundos):
+    """Espera (como mucho `segundos`) a que la versión del tablero de la empresa deje de ser `version`."""
+    with _cambio:
+        _cambio.wait_for(
+            lambda: getattr(_tableros.get(empresa_id), "version", None) != version,
+            timeout=segundos
+        )
+
+
+def flujo(app, empresa_id):
+    """
+    Generador SSE: el tablero completo en cada cambio y un latido mientras no lo hay.
+    Termina a los DURACION_SEGUNDOS; el navegador reconecta y recibe el tablero entero.
+    """
+    version = None
+    limite = time.monotonic() + DURACION_SEGUNDOS
+    yield f"retry: {RECONEXION_MS}\n\n"
+    while time.monotonic() < limite:
+        with app.app_context():
+            nueva, filas = tablero(empresa_id)
+
+        if nueva != version:
+            version = nueva
+            yield f"id: {version}\nevent: presencia\ndata: {json.dumps(filas)}\n\n"
+        else:
+            yield ": latido\n\n"
+        esperar_cambio(empresa_id, version, min(LATIDO_SEGUNDOS, max(limite - time.monotonic(), 0)))
+
+
+# ---------------------------------------------------------------------
+# CAMBIOS DESDE LOS FICHAJES
+# ---------------------------------------------------------------------
+
+def anotar(id_trabajador, empresa_id, tipo, fecha_hora):
+    """Anota en la sesión el nuevo último fichaje del trabajador; se publica al hacer commit."""
+    db.session.info.setdefault("presencia", []).append((id_trabajador, empresa_id, tipo, fecha_hora))
+
+
+def _aplicar(cambios):
+    with _cambio:
+        for id_trabajador, empresa_id, tipo, fecha_hora in cambios:
+            secuencia = _siguiente()
+            _registro.append((secuencia, id_trabajador, tipo, fecha_hora))
+
+            actual = _tableros.get(empresa_id)
+            if actual is None:
+                continue
+            fila = actual.trabajadores.get(id_trabajador)
+            if fila is not None:
+                _poner(fila, tipo, fecha_hora)
+                actual.version = secuencia
+            else:
+                # Trabajador que aún no está en el mapa de su empresa (alta reciente): se recarga en la siguiente lectura
+                actual.cargado = float("-inf")
+        _cambio.notify_all()
+
+
+@event.listens_for(Session, "after_commit")
+def _publicar(session):
+    cambios = session.info.pop("presencia", None)
+    if cambios:
+        _aplicar(cambios)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar(session):
+    session.info.pop("presencia", None)
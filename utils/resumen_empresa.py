@@ -0,0 +1,130 @@
+"""
+Resumen mensual de la plantilla de una empresa en bloque: el mismo cálculo para
+/empresa/resumen-mensual, el cierre de mes (utils.cierres) y la exportación para nómina (utils.nomina).
+
+- Trabajado e incompletos: suma de jornada_diaria (utils/jornada_diaria.py), igual que /resumen
+  de cada trabajador; aquí no se vuelven a emparejar fichajes.
+- Teórico: segundos_teoricos (utils/horarios.py), lunes, martes... del mes por la semana compilada
+  de cada horario, menos los tramos de ausencia aprobada fusionados.
+- Un mes cerrado sale del resumen congelado (resumen_cerrado).
+- Por lotes de trabajadores (resumenes_lote): tres consultas por lote, sea cual sea su tamaño.
+"""
+
+from datetime import date
+
+from extensions import db
+from models import Trabajador, JornadaDiaria, Incidencia, ResumenCerrado
+from utils.horarios import semanas_horarios, segundos_teoricos
+
+TIPOS_AUSENCIA = {"VACACIONES", "BAJA", "ASUNTOS_PROPIOS"}
+
+# Trabajadores por lote (y filas de jornada por viaje al servidor).
+LOTE_TRABAJADORES = 500
+FILAS_POR_VIAJE = 2000
+
+
+def rango_mes(anio, mes):
+    """[inicio, fin) del mes como fechas."""
+    inicio = date(anio, mes, 1)
+    fin = date(anio + 1, 1, 1) if mes == 12 else date(anio, mes + 1, 1)
+    return inicio, fin
+
+
+def _ausencias(ids, inicio, fin):
+    """{id_trabajador: [(fecha_inicio, fecha_fin)]} de ausencias aprobadas que tocan [inicio, fin)."""
+    ausencias = {}
+    for id_trabajador, desde, hasta in db.session.query(
+        Incidencia.id_trabajador, Incidencia.fecha_inicio, Incidencia.fecha_fin
+    ).filter(
+        Incidencia.id_trabajador.in_(ids),
+        Incidencia.estado == "APROBADA",
+        Incidencia.tipo.in_(TIPOS_AUSENCIA),
+        Incidencia.fecha_inicio < fin,
+        Incidencia.fecha_fin >= inicio
+    ):
+        ausencias.setdefault(id_trabajador, []).append((desde, hasta))
+    return ausencias
+
+
+def _jornadas(ids, inicio, fin):
+    """({id: segundos trabajados}, {id: [fechas ISO incompletas]}) de jornada_diaria en [inicio, fin)."""
+    trabajado = {}
+    incompletos = {}
+    for id_trabajador, fecha, segundos, incompleta in db.session.query(
+        JornadaDiaria.id_trabajador, JornadaDiaria.fecha, JornadaDiaria.segundos_trabajados, JornadaDiaria.incompleta
+    ).filter(
+        JornadaDiaria.id_trabajador.in_(ids),
+        JornadaDiaria.fecha >= inicio,
+        JornadaDiaria.fecha < fin
+    ).order_by(JornadaDiaria.id_trabajador, JornadaDiaria.fecha).execution_options(yield_per=FILAS_POR_VIAJE):
+        trabajado[id_trabajador] = trabajado.get(id_trabajador, 0) + segundos
+        if incompleta:
+            incompletos.setdefault(id_trabajador, []).append(fecha.isoformat())
+    return trabajado, incompletos
+
+
+def resumenes_lote(lote, inicio, fin):
+    """
+    Resumen del mes [inicio, fin) de cada trabajador del lote (filas con id_trabajador, nif, nombre,
+    apellidos e idHorario), en el orden del lote: mismos campos que /resumen más los del trabajador.
+    """
+    ids = [t.id_trabajador for t in lote]
+    ausencias = _ausencias(ids, inicio, fin)
+    cerrados = {
+        r.id_trabajador: r for r in ResumenCerrado.query.filter(
+            ResumenCerrado.id_trabajador.in_(ids), ResumenCerrado.mes == inicio
+        )
+    }
+    trabajado, incompletos = _jornadas(ids, inicio, fin)
+
+    semanas = semanas_horarios({t.idHorario for t in lote if t.idHorario})
+    for t in lote:
+        r = cerrados.get(t.id_trabajador)
+        if r is not None:
+            teorico_seg, trabajado_seg = r.teoricas_seg, r.trabajadas_seg
+            dias_inc = r.dias_incompletos.split(",") if r.dias_incompletos else []
+        elif not t.idHorario:
+            # Igual que /resumen: sin horario no se calcula nada
+            teorico_seg = trabajado_seg = 0
+            dias_inc = []
+        else:
+            teorico_seg = segundos_teoricos(semanas[t.idHorario], inicio, fin, ausencias.get(t.id_trabajador, ()))
+            trabajado_seg = trabajado.get(t.id_trabajador, 0)
+            dias_inc = incompletos.get(t.id_trabajador, [])
+
+        saldo_seg = trabajado_seg - teorico_seg
+        yield {
+            "id_trabajador": t.id_trabajador,
+            "nif": t.nif,
+            "nombre": t.nombre,
+            "apellidos": t.apellidos,
+            "mes": f"{inicio.month:02d}/{inicio.year}",
+            "teoricas": round(teorico_seg / 3600, 2),
+            "trabajadas": round(trabajado_seg / 3600, 2),
+            "saldo": round(saldo_seg / 3600, 2),
+            "teoricas_seg": teorico_seg,
+            "trabajadas_seg": trabajado_seg,
+            "saldo_seg": saldo_seg,
+            "dias_incompletos": dias_inc,
+            "num_dias_incompletos": len(dias_inc),
+            "calculo_confiable": len(dias_inc) == 0,
+            "cerrado": r is not None
+        }
+
+
+def resumen_mensual_empresa(empresa_id, anio, mes):
+    """
+    Lista de resúmenes (mismos campos que ResumenMensual + id/nif/nombre/apellidos) de todos los
+    trabajadores de la empresa, ordenada por apellidos y nombre.
+    """
+    inicio, fin = rango_mes(anio, mes)
+    trabajadores = db.session.query(
+        Trabajador.id_trabajador, Trabajador.nif, Trabajador.nombre, Trabajador.apellidos, Trabajador.idHorario
+    ).filter(Trabajador.idEmpresa == empresa_id).order_by(
+        Trabajador.apellidos, Trabajador.nombre, Trabajador.id_trabajador
+    ).all()
+
+    resultado = []
+    for i in range(0, len(trabajadores), LOTE_TRABAJADORES):
+        resultado.extend(resumenes_lote(trabajadores[i:i + LOTE_TRABAJADORES], inicio, fin))
+    return resultado
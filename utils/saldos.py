@@ -0,0 +1,371 @@
+"""
+Saldo de horas acumulado: sumas prefijas mensuales por trabajador (tabla saldo_mensual).
+
+Cada trabajador tiene una serie de meses consecutivos (del de su primer fichaje al de su último)
+con lo trabajado y lo teórico de cada mes y sus acumulados desde el inicio de la serie. Un rango
+cualquiera se responde con los acumulados de dos filas para los meses completos, más el cálculo
+directo (jornada_diaria + segundos_teoricos) de los trozos de mes de los extremos y de lo que
+quede fuera de la serie. Salen los mismos números que sumando /resumen mes a mes.
+
+Mantenimiento (sin commit, dentro de la transacción que cambia los datos); la consulta solo lee:
+- jornada_diaria suma la diferencia de segundos trabajados de cada día recalculado (sumar_trabajado),
+  y el primer fichaje de un mes posterior a la serie la crea o la alarga hasta él (asegurar_serie).
+- Las ausencias aprobadas y los cambios de horario recalculan lo teórico (recalcular_teoricos);
+  editar las franjas de un horario lo recalcula para toda su plantilla por lotes
+  (recalcular_teoricos_horario), en la misma transacción que la edición.
+- `flask reconstruir-saldos` la alarga hasta el mes en curso y corrige desviaciones.
+
+Los meses cerrados (utils/cierres.py) toman lo trabajado y lo teórico del resumen congelado, no
+de jornada_diaria ni del horario actual: así cuadran con lo que sirve /resumen de ese mes.
+"""
+
+from datetime import date, timedelta
+
+from sqlalchemy import func, insert, update
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import Trabajador, Incidencia, JornadaDiaria, SaldoMensual, ResumenCerrado
+from utils.horarios import compilar_semana, semana_horario, segundos_teoricos
+from utils.resumen_empresa import LOTE_TRABAJADORES
+
+TIPOS_AUSENCIA = {"VACACIONES", "BAJA", "ASUNTOS_PROPIOS"}
+
+
+def _mes(fecha):
+    return date(fecha.year, fecha.month, 1)
+
+
+def _mes_siguiente(mes):
+    return date(mes.year + 1, 1, 1) if mes.month == 12 else date(mes.year, mes.month + 1, 1)
+
+
+def _mes_anterior(mes):
+    return date(mes.year - 1, 12, 1) if mes.month == 1 else date(mes.year, mes.month - 1, 1)
+
+
+def _ausencias(trabajador_id, desde, hasta):
+    """[(fecha_inicio, fecha_fin)] de las ausencias aprobadas que tocan [desde, hasta)."""
+    return db.session.query(Incidencia.fecha_inicio, Incidencia.fecha_fin).filter(
+        Incidencia.id_trabajador == trabajador_id,
+        Incidencia.estado == "APROBADA",
+        Incidencia.tipo.in_(TIPOS_AUSENCIA),
+        Incidencia.fecha_inicio < hasta,
+        Incidencia.fecha_fin >= desde
+    ).all()
+
+
+def _teorico(trabajador, desde, hasta, ausencias):
+    if not trabajador.idHorario:
+        return 0
+    return segundos_teoricos(semana_horario(trabajador.idHorario), desde, hasta, ausencias)
+
+
+def _cerrados(trabajador_id, desde_mes, fin):
+    """{mes: (trabajado, teórico)} de los meses cerrados del trabajador en [desde_mes, fin)."""
+    return {
+        mes: (trabajado, teorico)
+        for mes, trabajado, teorico in db.session.query(
+            ResumenCerrado.mes, ResumenCerrado.trabajadas_seg, ResumenCerrado.teoricas_seg
+        ).filter(
+            ResumenCerrado.id_trabajador == trabajador_id,
+            ResumenCerrado.mes >= desde_mes,
+            ResumenCerrado.mes < fin
+        )
+    }
+
+
+def calcular_directo(trabajador, desde, hasta):
+    """(trabajado, teórico) en segundos de [desde, hasta) sin usar la serie."""
+    if desde >= hasta:
+        return 0, 0
+    trabajado = db.session.query(func.coalesce(func.sum(JornadaDiaria.segundos_trabajados), 0)).filter(
+        JornadaDiaria.id_trabajador == trabajador.id_trabajador,
+        JornadaDiaria.fecha >= desde,
+        JornadaDiaria.fecha < hasta
+    ).scalar()
+    return int(trabajado), _teorico(trabajador, desde, hasta, _ausencias(trabajador.id_trabajador, desde, hasta))
+
+
+# ---------------------------------------------------------------------
+# SERIE MENSUAL
+# ---------------------------------------------------------------------
+
+def _limites_serie(trabajador_id):
+    """(primer mes, último mes) de la serie del trabajador, o (None, None) si no tiene."""
+    return db.session.query(func.min(SaldoMensual.mes), func.max(SaldoMensual.mes)).filter(
+        SaldoMensual.id_trabajador == trabajador_id
+    ).one()
+
+
+def _calcular_meses(trabajador, desde_mes, hasta_mes, acum_trabajado=0, acum_teorico=0):
+    """Filas (dict) de los meses [desde_mes, hasta_mes] a continuación de los acumulados dados."""
+    fin = _mes_siguiente(hasta_mes)
+    por_mes = {}
+    for fecha, segundos in db.session.query(JornadaDiaria.fecha, JornadaDiaria.segundos_trabajados).filter(
+        JornadaDiaria.id_trabajador == trabajador.id_trabajador,
+        JornadaDiaria.fecha >= desde_mes,
+        JornadaDiaria.fecha < fin
+    ):
+        por_mes[_mes(fecha)] = por_mes.get(_mes(fecha), 0) + segundos
+    ausencias = _ausencias(trabajador.id_trabajador, desde_mes, fin)
+    cerrados = _cerrados(trabajador.id_trabajador, desde_mes, fin)
+
+    filas = []
+    mes = desde_mes
+    while mes < fin:
+        if mes in cerrados:
+            trabajado, teorico = cerrados[mes]
+        else:
+            trabajado = por_mes.get(mes, 0)
+            teorico = _teorico(trabajador, mes, _mes_siguiente(mes), ausencias)
+        acum_trabajado += trabajado
+        acum_teorico += teorico
+        filas.append({
+            "id_trabajador": trabajador.id_trabajador,
+            "mes": mes,
+            "trabajado_seg": trabajado,
+            "teorico_seg": teorico,
+            "acum_trabajado_seg": acum_trabajado,
+            "acum_teorico_seg": acum_teorico,
+        })
+        mes = _mes_siguiente(mes)
+    return filas
+
+
+def asegurar_serie(trabajador, hasta_mes):
+    """
+    Crea la serie del trabajador (desde el mes de su primer fichaje) o la alarga hasta `hasta_mes`
+    (sin commit). Los meses salen de jornada_diaria tal como está en la sesión.
+    """
+    primero, ultimo = _limites_serie(trabajador.id_trabajador)
+    if ultimo is not None and ultimo >= hasta_mes:
+        return
+
+    if ultimo is None:
+        primera = db.session.query(func.min(JornadaDiaria.fecha)).filter(
+            JornadaDiaria.id_trabajador == trabajador.id_trabajador
+        ).scalar()
+        filas = _calcular_meses(trabajador, min(_mes(primera), hasta_mes) if primera else hasta_mes, hasta_mes)
+    else:
+        previa = SaldoMensual.query.get((trabajador.id_trabajador, ultimo))
+        filas = _calcular_meses(
+            trabajador, _mes_siguiente(ultimo), hasta_mes,
+            previa.acum_trabajado_seg, previa.acum_teorico_seg
+        )
+
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(SaldoMensual), filas)
+    except IntegrityError:
+        # Otra transacción la ha alargado a la vez: vale la suya (el savepoint deja intacta la nuestra)
+        pass
+
+
+def sumar_trabajado(trabajador_id, fecha, delta):
+    """
+    Suma `delta` segundos trabajados al mes de `fecha` y a los acumulados desde ese mes (sin commit).
+    Llamar antes de guardar el día en jornada_diaria: si el mes es posterior a la serie, se alarga
+    con lo que había y después se suma la diferencia.
+    """
+    if not delta:
+        return
+    mes = _mes(fecha)
+    filtro = (SaldoMensual.id_trabajador == trabajador_id, SaldoMensual.mes == mes)
+    resultado = db.session.execute(
+        update(SaldoMensual).where(*filtro).values(trabajado_seg=SaldoMensual.trabajado_seg + delta)
+    )
+    if not resultado.rowcount:
+        # Antes del inicio de la serie no hay nada que mover: esos meses se calculan de jornada_diaria
+        primero, _ = _limites_serie(trabajador_id)
+        if primero is not None and mes < primero:
+            return
+        asegurar_serie(Trabajador.query.get(trabajador_id), mes)
+        db.session.execute(
+            update(SaldoMensual).where(*filtro).values(trabajado_seg=SaldoMensual.trabajado_seg + delta)
+        )
+    db.session.execute(
+        update(SaldoMensual)
+        .where(SaldoMensual.id_trabajador == trabajador_id, SaldoMensual.mes >= mes)
+        .values(acum_trabajado_seg=SaldoMensual.acum_trabajado_seg + delta)
+    )
+
+
+def _teoricos_serie(filas, semana, ausencias, cerrados, desde=None, hasta=None):
+    """
+    [(teorico, acum_teorico)] de las filas [(mes, teorico actual)] de una serie, en orden: recalcula
+    los meses que tocan [desde, hasta] (todos si no se indica); los cerrados, el de su resumen.
+    """
+    nuevos = []
+    acum = 0
+    for mes, teorico in filas:
+        siguiente = _mes_siguiente(mes)
+        if mes in cerrados:
+            teorico = cerrados[mes][1]
+        elif (desde is None or siguiente > desde) and (hasta is None or mes <= hasta):
+            teorico = segundos_teoricos(semana, mes, siguiente, ausencias)
+        acum += teorico
+        nuevos.append((teorico, acum))
+    return nuevos
+
+
+def recalcular_teoricos(trabajador_id, desde=None, hasta=None):
+    """
+    Recalcula lo teórico de los meses de la serie que tocan [desde, hasta] (todos si no se indica)
+    y rehace los acumulados teóricos (sin commit). Los meses cerrados conservan el de su resumen.
+    """
+    trabajador = Trabajador.query.get(trabajador_id)
+    filas = SaldoMensual.query.filter_by(id_trabajador=trabajador_id).order_by(SaldoMensual.mes.asc()).all()
+    if trabajador is None or not filas:
+        return
+
+    fin = _mes_siguiente(filas[-1].mes)
+    nuevos = _teoricos_serie(
+        [(f.mes, f.teorico_seg) for f in filas],
+        semana_horario(trabajador.idHorario),
+        _ausencias(trabajador_id, filas[0].mes, fin),
+        _cerrados(trabajador_id, filas[0].mes, fin),
+        desde, hasta
+    )
+    for fila, (teorico, acum) in zip(filas, nuevos):
+        fila.teorico_seg, fila.acum_teorico_seg = teorico, acum
+
+
+def recalcular_teoricos_horario(id_horario):
+    """
+    Recalcula lo teórico de todos los trabajadores del horario tras editar sus franjas (sin commit).
+    Lee las franjas de la sesión (hacer flush antes) y va por lotes de LOTE_TRABAJADORES: tres
+    consultas por lote (series, ausencias, meses cerrados) y un UPDATE por PK de las filas que cambian.
+    """
+    semana = compilar_semana(id_horario)
+    ids = [i for (i,) in db.session.query(Trabajador.id_trabajador).filter(Trabajador.idHorario == id_horario)]
+
+    for i in range(0, len(ids), LOTE_TRABAJADORES):
+        lote = ids[i:i + LOTE_TRABAJADORES]
+        series = {}
+        for fila in db.session.query(
+            SaldoMensual.id_trabajador, SaldoMensual.mes, SaldoMensual.teorico_seg, SaldoMensual.acum_teorico_seg
+        ).filter(SaldoMensual.id_trabajador.in_(lote)).order_by(SaldoMensual.id_trabajador, SaldoMensual.mes):
+            series.setdefault(fila.id_trabajador, []).append(fila)
+        if not series:
+            continue
+
+        ausencias = {}
+        for trabajador_id, inicio, fin in db.session.query(
+            Incidencia.id_trabajador, Incidencia.fecha_inicio, Incidencia.fecha_fin
+        ).filter(
+            Incidencia.id_trabajador.in_(series),
+            Incidencia.estado == "APROBADA",
+            Incidencia.tipo.in_(TIPOS_AUSENCIA)
+        ):
+            ausencias.setdefault(trabajador_id, []).append((inicio, fin))
+        cerrados = {}
+        for trabajador_id, mes, trabajado, teorico in db.session.query(
+            ResumenCerrado.id_trabajador, ResumenCerrado.mes, ResumenCerrado.trabajadas_seg, ResumenCerrado.teoricas_seg
+        ).filter(ResumenCerrado.id_trabajador.in_(series)):
+            cerrados.setdefault(trabajador_id, {})[mes] = (trabajado, teorico)
+
+        cambios = []
+        for trabajador_id, filas in series.items():
+            nuevos = _teoricos_serie(
+                [(f.mes, f.teorico_seg) for f in filas], semana,
+                ausencias.get(trabajador_id, ()), cerrados.get(trabajador_id, {})
+            )
+            cambios += [
+                {"id_trabajador": trabajador_id, "mes": f.mes, "teorico_seg": teorico, "acum_teorico_seg": acum}
+                for f, (teorico, acum) in zip(filas, nuevos)
+                if (f.teorico_seg, f.acum_teorico_seg) != (teorico, acum)
+            ]
+        if cambios:
+            db.session.execute(update(SaldoMensual), cambios)
+
+
+def ausencia_cambiada(incidencia):
+    """Llamar tras crear, resolver o borrar una incidencia (sin commit): si es una ausencia, ajusta lo teórico."""
+    if incidencia.tipo in TIPOS_AUSENCIA:
+        recalcular_teoricos(incidencia.id_trabajador, incidencia.fecha_inicio, incidencia.fecha_fin)
+
+
+def verificar_serie(trabajador, reparar=False):
+    """
+    Compara la serie guardada con la recalculada desde jornada_diaria e incidencias.
+    Devuelve los meses con desviación; con reparar=True rehace la serie entera (sin commit).
+    """
+    guardadas = SaldoMensual.query.filter_by(id_trabajador=trabajador.id_trabajador).order_by(SaldoMensual.mes.asc()).all()
+    if not guardadas:
+        return []
+
+    esperadas = _calcular_meses(trabajador, guardadas[0].mes, guardadas[-1].mes)
+    campos = ("trabajado_seg", "teorico_seg", "acum_trabajado_seg", "acum_teorico_seg")
+    desviados = [
+        g.mes for g, e in zip(guardadas, esperadas)
+        if any(getattr(g, campo) != e[campo] for campo in campos)
+    ]
+    if desviados and reparar:
+        for g, e in zip(guardadas, esperadas):
+            for campo in campos:
+                setattr(g, campo, e[campo])
+    return desviados
+
+
+# ---------------------------------------------------------------------
+# CONSULTA
+# ---------------------------------------------------------------------
+
+def saldo_rango(trabajador, desde, hasta):
+    """
+    (trabajado, teórico) en segundos de [desde, hasta) (fechas). Solo lee.
+    Meses completos dentro de la serie: diferencia de dos acumulados; el resto (incluidos los meses
+    posteriores a la serie, sin fichajes aún), cálculo directo.
+    """
+    primero, ultimo = _limites_serie(trabajador.id_trabajador)
+    if primero is None:
+        return calcular_directo(trabajador, desde, hasta)
+    m1 = max(desde if desde.day == 1 else _mes_siguiente(_mes(desde)), primero)
+    m2 = min(_mes(hasta), _mes_siguiente(ultimo))
+    if m1 >= m2:
+        return calcular_directo(trabajador, desde, hasta)
+
+    acumulados = {
+        f.mes: (f.acum_trabajado_seg, f.acum_teorico_seg)
+        for f in SaldoMensual.query.filter(
+            SaldoMensual.id_trabajador == trabajador.id_trabajador,
+            SaldoMensual.mes.in_([_mes_anterior(m1), _mes_anterior(m2)])
+        )
+    }
+    # Acumulado de los meses de la serie anteriores a m (0 si m es el primero)
+    a1 = acumulados.get(_mes_anterior(m1), (0, 0))
+    a2 = acumulados.get(_mes_anterior(m2), (0, 0))
+    antes = calcular_directo(trabajador, desde, m1)
+    despues = calcular_directo(trabajador, m2, hasta)
+    return (
+        antes[0] + a2[0] - a1[0] + despues[0],
+        antes[1] + a2[1] - a1[1] + despues[1],
+    )
+
+
+def primer_dia(trabajador_id):
+    """Fecha del primer día con fichajes del trabajador (referencia de "desde el alta"), o None."""
+    return db.session.query(func.min(JornadaDiaria.fecha)).filter(
+        JornadaDiaria.id_trabajador == trabajador_id
+    ).scalar()
+
+
+def resumen_acumulado(trabajador, desde, hasta):
+    """Resumen (horas y segundos, como /resumen) de [desde, hasta], ambas fechas incluidas."""
+    if trabajador.idHorario:
+        trabajado, teorico = saldo_rango(trabajador, desde, hasta + timedelta(days=1))
+    else:
+        # Igual que /resumen: sin horario no se calcula nada
+        trabajado = teorico = 0
+    saldo = trabajado - teorico
+    return {
+        "desde": desde,
+        "hasta": hasta,
+        "teoricas": round(teorico / 3600, 2),
+        "trabajadas": round(trabajado / 3600, 2),
+        "saldo": round(saldo / 3600, 2),
+        "teoricas_seg": teorico,
+        "trabajadas_seg": trabajado,
+        "saldo_seg": saldo,
+    }
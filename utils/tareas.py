@@ -0,0 +1,354 @@
+"""
+Tareas en segundo plano de RRHH (informes y barridos largos), sin broker: la cola es la tabla tarea.
+
+- encolar() guarda la tarea PENDIENTE (con su fichero de entrada, si lo hay). Un worker la reclama con un UPDATE condicionado al estado,
+  así que aunque haya varios workers solo uno la ejecuta.
+- Workers: `flask tareas-worker --procesos N` (pool de procesos) y, con TAREAS_EN_PROCESO, un hilo
+  en el propio proceso web que se despierta al encolar. Ese hilo solo lo arrancan los puntos de
+  entrada del servidor (arrancar_tareas): crear la app en un script, el cron o un comando no lo hace.
+- La tarea informa con avanzar(hecho, total, mensaje). Como mucho una vez por INTERVALO_PROGRESO se
+  escriben progreso y latido por una conexión aparte (no confirma nada de la sesión de la tarea)
+  y se lee la marca de cancelación: si está puesta, la tarea se corta ahí (CANCELADA).
+- Una tarea EN_CURSO sin latido en LATIDO_MAX_SEGUNDOS se da por interrumpida (FALLIDA). No se
+  reintenta: los barridos envían avisos y repetirlos duplicaría correos.
+- El bucle del worker también manda la bandeja de salida (utils.envios) en cada vuelta y, cada
+  BARRIDO_SEGUNDOS, barre los turnos abiertos vencidos y purga los envíos antiguos.
+"""
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import undefer
+
+from extensions import db
+from models import Tarea
+from utils.envios import despachar_envios, purgar_envios
+from utils.turnos import barrer_turnos
+
+PENDIENTE, EN_CURSO, COMPLETADA, FALLIDA, CANCELADA = "PENDIENTE", "EN_CURSO", "COMPLETADA", "FALLIDA", "CANCELADA"
+FINALES = {COMPLETADA, FALLIDA, CANCELADA}
+
+# Mínimo entre dos escrituras de progreso de una tarea.
+INTERVALO_PROGRESO = 1.0
+
+# Sin latido en este tiempo, una tarea EN_CURSO se da por interrumpida.
+LATIDO_MAX_SEGUNDOS = 300
+
+# Espera del worker cuando no hay tareas pendientes.
+ESPERA_SEGUNDOS = 2.0
+
+# Cada cuánto pasa el worker los turnos EN_CURSO vencidos a SIN_CIERRE y purga envíos antiguos.
+BARRIDO_SEGUNDOS = 60
+
+
+class TareaCancelada(Exception):
+    """Se lanza en avanzar() cuando la tarea se ha cancelado desde el panel."""
+
+
+# ---------------------------------------------------------------------
+# TIPOS DE TAREA
+# ---------------------------------------------------------------------
+
+# tipo -> (título para el panel, función(parametros, empresa_id, avanzar) -> (mensaje, fichero o None))
+# fichero = (nombre, mimetype, bytes) para la descarga
+TIPOS = {}
+
+
+def tipo_tarea(nombre, titulo):
+    """Registra una función como tipo de tarea."""
+    def registrar(funcion):
+        TIPOS[nombre] = (titulo, funcion)
+        return funcion
+    return registrar
+
+
+def titulo_tipo(nombre):
+    return TIPOS.get(nombre, (nombre, None))[0]
+
+
+# ---------------------------------------------------------------------
+# COLA
+# ---------------------------------------------------------------------
+
+def encolar(tipo, empresa_id, creada_por=None, entrada=None, **parametros) -> Tarea:
+    """
+    Guarda la tarea como PENDIENTE (con commit) y despierta al hilo del proceso si está activo.
+    `entrada` (bytes) llega a la función de la tarea como parametros["entrada"].
+    """
+    if tipo not in TIPOS:
+        raise ValueError(f"Tipo de tarea desconocido: {tipo}")
+
+    tarea = Tarea(
+        empresa_id=empresa_id,
+        creada_por=creada_por,
+        tipo=tipo,
+        parametros=json.dumps(parametros),
+        estado=PENDIENTE,
+        entrada=entrada
+    )
+    db.session.add(tarea)
+    db.session.commit()
+
+    despertar()
+    return tarea
+
+
+def despertar():
+    """Despierta al hilo de tareas del proceso, si lo tiene, para que no espere a su siguiente vuelta."""
+    hilo = current_app.extensions.get("tareas_hilo")
+    if hilo is not None and hilo[0] == os.getpid():
+        hilo[1].set()
+
+
+def cancelar(tarea) -> bool:
+    """
+    Cancela una tarea (con commit): si aún no ha empezado, en el acto; si está en curso, en su
+    siguiente aviso de progreso. False si ya había terminado.
+    """
+    if tarea.estado in FINALES:
+        return False
+
+    resultado = db.session.execute(
+        update(Tarea)
+        .where(Tarea.id_tarea == tarea.id_tarea, Tarea.estado == PENDIENTE)
+        .values(estado=CANCELADA, mensaje="Cancelada antes de empezar.", terminada_en=datetime.now(), entrada=None)
+    )
+    if not resultado.rowcount:
+        db.session.execute(update(Tarea).where(Tarea.id_tarea == tarea.id_tarea).values(cancelar=True))
+    db.session.commit()
+    db.session.refresh(tarea)
+    return True
+
+
+def _reclamar():
+    """Id de la tarea pendiente más antigua que este worker consigue marcar EN_CURSO, o None."""
+    candidatas = db.session.query(Tarea.id_tarea).filter(
+        Tarea.estado == PENDIENTE
+    ).order_by(Tarea.creada_en, Tarea.id_tarea).limit(10).all()
+
+    for (tarea_id,) in candidatas:
+        ahora = datetime.now()
+        resultado = db.session.execute(
+            update(Tarea)
+            .where(Tarea.id_tarea == tarea_id, Tarea.estado == PENDIENTE)
+            .values(estado=EN_CURSO, iniciada_en=ahora, latido=ahora)
+        )
+        db.session.commit()
+        if resultado.rowcount:
+            return tarea_id
+    return None
+
+
+def recuperar_interrumpidas() -> int:
+    """Marca FALLIDA las tareas EN_CURSO sin latido reciente (su worker murió). Devuelve cuántas (con commit)."""
+    resultado = db.session.execute(
+        update(Tarea)
+        .where(Tarea.estado == EN_CURSO, Tarea.latido < datetime.now() - timedelta(seconds=LATIDO_MAX_SEGUNDOS))
+        .values(
+            estado=FALLIDA, mensaje="Interrumpida: el worker dejó de responder.", terminada_en=datetime.now(), entrada=None
+        )
+    )
+    db.session.commit()
+    return resultado.rowcount
+
+
+# ---------------------------------------------------------------------
+# EJECUCIÓN
+# ---------------------------------------------------------------------
+
+class _Progreso:
+    """avanzar(hecho, total=None, mensaje=None) de una tarea en curso."""
+
+    def __init__(self, tarea_id):
+        self.tarea_id = tarea_id
+        self._ultimo = 0.0
+
+    def __call__(self, hecho, total=None, mensaje=None):
+        ahora = time.monotonic()
+        if ahora - self._ultimo < INTERVALO_PROGRESO:
+            return
+        self._ultimo = ahora
+
+        valores = {"progreso": hecho, "latido": datetime.now()}
+        if total is not None:
+            valores["total"] = total
+        if mensaje is not None:
+            valores["mensaje"] = mensaje[:255]
+
+        # Conexión aparte: el progreso se ve al momento sin confirmar la transacción de la tarea
+        with db.engine.begin() as conexion:
+            conexion.execute(update(Tarea).where(Tarea.id_tarea == self.tarea_id).values(**valores))
+            cancelada = conexion.execute(select(Tarea.cancelar).where(Tarea.id_tarea == self.tarea_id)).scalar()
+        if cancelada:
+            raise TareaCancelada()
+
+
+def _terminar(tarea_id, estado, mensaje, fichero=None):
+    # La entrada (p. ej. un fichero con contraseñas) no se guarda más allá de la tarea
+    valores = {"estado": estado, "mensaje": (mensaje or "")[:255], "terminada_en": datetime.now(), "entrada": None}
+    if estado == COMPLETADA:
+        # El total lo escribió el progreso por otra conexión: se toma de la fila, no de la sesión
+        valores["progreso"] = func.coalesce(Tarea.total, Tarea.progreso)
+    if fichero:
+        valores["resultado_nombre"], valores["resultado_tipo"], valores["resultado"] = fichero
+    db.session.execute(update(Tarea).where(Tarea.id_tarea == tarea_id).values(**valores))
+    db.session.commit()
+
+
+def ejecutar(tarea_id):
+    """Ejecuta una tarea ya reclamada y guarda su final (COMPLETADA, CANCELADA o FALLIDA)."""
+    tarea = Tarea.query.options(undefer(Tarea.entrada)).get(tarea_id)
+    _, funcion = TIPOS.get(tarea.tipo, (None, None))
+    parametros = json.loads(tarea.parametros or "{}")
+    if tarea.entrada is not None:
+        parametros["entrada"] = tarea.entrada
+    empresa_id = tarea.empresa_id
+
+    try:
+        if funcion is None:
+            raise ValueError(f"Tipo de tarea desconocido: {tarea.tipo}")
+        mensaje, fichero = funcion(parametros, empresa_id, _Progreso(tarea_id))
+    except TareaCancelada:
+        db.session.rollback()
+        _terminar(tarea_id, CANCELADA, "Cancelada por el usuario.")
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.exception("Tarea %s (%s) fallida.", tarea_id, tarea.tipo)
+        _terminar(tarea_id, FALLIDA, f"Error: {e}")
+    else:
+        _terminar(tarea_id, COMPLETADA, mensaje, fichero)
+
+
+def ejecutar_pendientes() -> int:
+    """Ejecuta tareas pendientes hasta vaciar la cola. Devuelve cuántas ha ejecutado."""
+    hechas = 0
+    while True:
+        tarea_id = _reclamar()
+        if tarea_id is None:
+            return hechas
+        ejecutar(tarea_id)
+        hechas += 1
+
+
+def bucle(app, espera=ESPERA_SEGUNDOS, despertar=None):
+    """Bucle de un worker: recupera interrumpidas, barre, vacía la cola y la bandeja de salida y espera (o a que le despierten)."""
+    siguiente_barrido = 0.0
+    while True:
+        with app.app_context():
+            try:
+                recuperar_interrumpidas()
+                if time.monotonic() >= siguiente_barrido:
+                    barrer_turnos()
+                    purgar_envios()
+                    siguiente_barrido = time.monotonic() + BARRIDO_SEGUNDOS
+                ejecutar_pendientes()
+                despachar_envios()
+            except Exception:
+                current_app.logger.exception("Tareas: error en el bucle del worker, se reintentará.")
+                db.session.rollback()
+            finally:
+                db.session.remove()
+
+        if despertar is not None:
+            despertar.wait(espera)
+            despertar.clear()
+        else:
+            time.sleep(espera)
+
+
+def proceso_worker(espera=ESPERA_SEGUNDOS):
+    """Punto de entrada de cada proceso del pool (`flask tareas-worker`)."""
+    from app import create_app
+    app = create_app()
+    # Este proceso ya es el bucle: sin hilo aparte
+    app.config["TAREAS_EN_PROCESO"] = False
+    bucle(app, espera)
+
+
+# ---------------------------------------------------------------------
+# HILO EN EL PROCESO WEB (TAREAS_EN_PROCESO)
+# ---------------------------------------------------------------------
+
+def arrancar_tareas(app):
+    """
+    Arranca el bucle de tareas en un hilo de este proceso, si TAREAS_EN_PROCESO (una vez por proceso).
+    Solo desde los puntos de entrada del servidor: `python app.py` y el post_fork de gunicorn.conf.py.
+    """
+    if not app.config.get("TAREAS_EN_PROCESO"):
+        return
+    hilo = app.extensions.get("tareas_hilo")
+    if hilo is not None and hilo[0] == os.getpid():
+        return
+
+    despertar = threading.Event()
+    threading.Thread(
+        target=bucle,
+        args=(app, app.config.get("TAREAS_ESPERA", ESPERA_SEGUNDOS), despertar),
+        name="tareas",
+        daemon=True
+    ).start()
+    app.extensions["tareas_hilo"] = (os.getpid(), despertar)
+
+
+# ---------------------------------------------------------------------
+# TAREAS DE RRHH
+# ---------------------------------------------------------------------
+
+@tipo_tarea("exportar_resumen", "Exportación para nómina")
+def _exportar_resumen(parametros, empresa_id, avanzar):
+    from models import Trabajador
+    from utils.nomina import resumenes_empresa, csv_stream, xlsx_stream
+
+    anio, mes, formato = parametros["anio"], parametros["mes"], parametros.get("formato", "csv")
+    total = Trabajador.query.filter_by(idEmpresa=empresa_id).count()
+    avanzar(0, total, f"Exportando {mes:02d}/{anio}...")
+
+    def con_progreso(resumenes):
+        for i, r in enumerate(resumenes, 1):
+            avanzar(i, total)
+            yield r
+
+    resumenes = con_progreso(resumenes_empresa(empresa_id, anio, mes))
+    if formato == "xlsx":
+        datos = b"".join(xlsx_stream(resumenes, nombre_hoja=f"{mes:02d}-{anio}"))
+        mimetype = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    else:
+        formato = "csv"
+        datos = "".join(csv_stream(resumenes)).encode("utf-8")
+        mimetype = "text/csv; charset=utf-8"
+
+    nombre = f"resumen_{anio}_{mes:02d}.{formato}"
+    return f"{total} trabajadores exportados.", (nombre, mimetype, datos)
+
+
+@tipo_tarea("notificar_ausencias", "Verificación de ausencias")
+def _notificar_ausencias(parametros, empresa_id, avanzar):
+    from utils.ausencias import notificar_ausencias_hoy
+
+    cuenta = notificar_ausencias_hoy(empresa_id, avanzar=avanzar)
+    if not cuenta["detectados"]:
+        return "Todos han fichado correctamente hoy.", None
+    return (
+        f"Revisión completada. Ausentes: {cuenta['detectados']}. "
+        f"Avisos en cola: {cuenta['push']} push y {cuenta['email']} emails."
+    ), None
+
+
+@tipo_tarea("importar_empleados", "Importación de empleados")
+def _importar_empleados(parametros, empresa_id, avanzar):
+    from utils.importacion import leer_filas, validar, importar, informe_errores
+
+    # Se vuelve a validar: entre la subida y la ejecución pueden haberse dado de alta NIF o tarjetas
+    altas, errores = validar(leer_filas(parametros["nombre"], parametros["entrada"]), empresa_id)
+    if errores:
+        informe = ("errores_importacion.csv", "text/csv; charset=utf-8", informe_errores(errores))
+        return f"Nada importado: {len(errores)} errores en el fichero (descarga el informe).", informe
+
+    hechas = importar(altas, avanzar)
+    db.session.commit()
+    return f"{hechas} empleados importados.", None
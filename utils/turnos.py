@@ -0,0 +1,189 @@
+"""
+Turnos: cada jornada ENTRADA -> SALIDA guardada como fila (tabla turno) con su estado.
+
+- Estados: EN_CURSO, SIN_CIERRE (abierto hace más de HORAS_SIN_CIERRE), SIN_SALIDA (la siguiente
+  marca es otra ENTRADA), SIN_ENTRADA (SALIDA sin ENTRADA delante), CERRADA y LARGA (cerrada de
+  más de HORAS_LARGA).
+- Se mantienen con los fichajes: recalcular_jornadas (utils.jornada_diaria) rehace los turnos de
+  los días tocados, en la misma transacción. Solo se re-empareja el tramo afectado: la ENTRADA
+  anterior al tramo depende de lo que la sigue y la SALIDA posterior, de lo que la precede.
+- El barrido (barrer_turnos, desde el bucle de utils.tareas) pasa a SIN_CIERRE los EN_CURSO
+  vencidos. Las consultas por estado no dependen de él: comparan también con la hora.
+- `flask reconstruir-turnos` rellena la tabla desde los fichajes (tras migrar o para repararla).
+"""
+
+from datetime import datetime, time, timedelta
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import and_, or_, update
+
+from extensions import db
+from models import Fichaje, Trabajador, Turno
+
+EN_CURSO, SIN_CIERRE, SIN_SALIDA, SIN_ENTRADA, CERRADA, LARGA = (
+    "EN_CURSO", "SIN_CIERRE", "SIN_SALIDA", "SIN_ENTRADA", "CERRADA", "LARGA"
+)
+ABIERTOS = (EN_CURSO, SIN_CIERRE)
+
+# Un turno cerrado de más horas es LARGA; uno abierto de más horas, SIN_CIERRE.
+HORAS_LARGA = 12
+HORAS_SIN_CIERRE = 16
+
+TZ = ZoneInfo("Europe/Madrid")
+
+
+def _local_now_naive():
+    """Hora local de España sin tzinfo, como se guardan los fichajes."""
+    return datetime.now(TZ).replace(tzinfo=None)
+
+
+def corte_sin_cierre(ahora=None):
+    """Un turno abierto con entrada anterior a esto ya es SIN_CIERRE."""
+    return (ahora or _local_now_naive()) - timedelta(hours=HORAS_SIN_CIERRE)
+
+
+def _turno(empresa_id, entrada, salida, estado):
+    return _poner(Turno(), empresa_id, entrada, salida, estado)
+
+
+def emparejar(fichajes, hay_posterior, ahora):
+    """
+    Turnos (ENTRADA, SALIDA, estado) de una secuencia ordenada de fichajes de un trabajador.
+    `hay_posterior`: si después de la secuencia viene otra ENTRADA (la última abierta queda SIN_SALIDA).
+    """
+    turnos = []
+    pendiente = None
+    for f in fichajes:
+        if f.tipo == 'ENTRADA':
+            if pendiente is not None:
+                turnos.append((pendiente, None, SIN_SALIDA))
+            pendiente = f
+        elif f.tipo == 'SALIDA':
+            if pendiente is None:
+                turnos.append((None, f, SIN_ENTRADA))
+            else:
+                horas = (f.fecha_hora - pendiente.fecha_hora).total_seconds() / 3600
+                turnos.append((pendiente, f, LARGA if horas > HORAS_LARGA else CERRADA))
+                pendiente = None
+
+    if pendiente is not None:
+        if hay_posterior:
+            turnos.append((pendiente, None, SIN_SALIDA))
+        else:
+            turnos.append((pendiente, None, SIN_CIERRE if pendiente.fecha_hora < corte_sin_cierre(ahora) else EN_CURSO))
+    return turnos
+
+
+def _marcas(trabajador_id):
+    return Fichaje.query.filter(
+        Fichaje.id_trabajador == trabajador_id,
+        Fichaje.tipo.in_(('ENTRADA', 'SALIDA'))
+    )
+
+
+def _desde_fichaje(f):
+    return or_(Fichaje.fecha_hora > f.fecha_hora, and_(Fichaje.fecha_hora == f.fecha_hora, Fichaje.id_fichaje >= f.id_fichaje))
+
+
+def _hasta_fichaje(f):
+    return or_(Fichaje.fecha_hora < f.fecha_hora, and_(Fichaje.fecha_hora == f.fecha_hora, Fichaje.id_fichaje <= f.id_fichaje))
+
+
+def _poner(turno, empresa_id, entrada, salida, estado):
+    """Vuelca el par en `turno` (nuevo o existente); el ORM solo emite UPDATE si algo cambia."""
+    ref = entrada or salida
+    turno.id_trabajador = ref.id_trabajador
+    turno.empresa_id = empresa_id
+    turno.id_entrada = entrada.id_fichaje if entrada else None
+    turno.id_salida = salida.id_fichaje if salida else None
+    turno.entrada = entrada.fecha_hora if entrada else None
+    turno.salida = salida.fecha_hora if salida else None
+    turno.fecha_ref = ref.fecha_hora
+    turno.estado = estado
+    return turno
+
+
+def rehacer_turnos(trabajador_id, desde, hasta, ahora=None, fichajes_dias=None):
+    """
+    Rehace los turnos del trabajador que tocan los días [desde, hasta] (sin commit).
+    Requiere los fichajes ya en la sesión (flush); incluir el día anterior de un fichaje movido.
+    `fichajes_dias`: los fichajes de esos días ya cargados (ordenados), para no volver a leerlos.
+
+    Los turnos que siguen emparejando la misma ENTRADA (o la misma SALIDA suelta) se actualizan en
+    su fila, así que conservan su id_turno (desempate del cursor del listado). Al fichar, lo normal
+    es un UPDATE del último turno o un INSERT del que abre la nueva ENTRADA.
+    """
+    inicio = datetime.combine(desde, time.min)
+    fin = datetime.combine(hasta + timedelta(days=1), time.min)
+
+    previo = _marcas(trabajador_id).filter(Fichaje.fecha_hora < inicio).order_by(
+        Fichaje.fecha_hora.desc(), Fichaje.id_fichaje.desc()
+    ).first()
+    siguiente = _marcas(trabajador_id).filter(Fichaje.fecha_hora >= fin).order_by(
+        Fichaje.fecha_hora.asc(), Fichaje.id_fichaje.asc()
+    ).first()
+
+    if fichajes_dias is not None:
+        fichajes = [f for f in fichajes_dias if f.tipo in ('ENTRADA', 'SALIDA')]
+        if previo is not None and previo.tipo == 'ENTRADA':
+            fichajes.insert(0, previo)
+        if siguiente is not None and siguiente.tipo == 'SALIDA':
+            fichajes.append(siguiente)
+    else:
+        tramo = _marcas(trabajador_id)
+        tramo = tramo.filter(_desde_fichaje(previo)) if previo is not None and previo.tipo == 'ENTRADA' \
+            else tramo.filter(Fichaje.fecha_hora >= inicio)
+        tramo = tramo.filter(_hasta_fichaje(siguiente)) if siguiente is not None and siguiente.tipo == 'SALIDA' \
+            else tramo.filter(Fichaje.fecha_hora < fin)
+        fichajes = tramo.order_by(Fichaje.fecha_hora.asc(), Fichaje.id_fichaje.asc()).all()
+
+    # Turnos actuales del tramo: los de sus fichajes y los que apuntaban a fichajes de estos días
+    # (ya borrados o movidos)
+    ids = [f.id_fichaje for f in fichajes]
+    condiciones = [
+        and_(Turno.entrada >= inicio, Turno.entrada < fin),
+        and_(Turno.salida >= inicio, Turno.salida < fin),
+    ]
+    if ids:
+        condiciones += [Turno.id_entrada.in_(ids), Turno.id_salida.in_(ids)]
+    actuales = Turno.query.filter(Turno.id_trabajador == trabajador_id, or_(*condiciones)).all()
+    por_entrada = {t.id_entrada: t for t in actuales if t.id_entrada is not None}
+    por_salida = {t.id_salida: t for t in actuales if t.id_entrada is None}
+
+    hay_posterior = siguiente is not None and siguiente.tipo == 'ENTRADA'
+    empresa_id = None
+    for entrada, salida, estado in emparejar(fichajes, hay_posterior, ahora):
+        turno = por_entrada.pop(entrada.id_fichaje, None) if entrada else por_salida.pop(salida.id_fichaje, None)
+        if turno is None:
+            if empresa_id is None:
+                # Quien ficha ya tiene el trabajador en la sesión: sin consulta
+                empresa_id = db.session.get(Trabajador, trabajador_id).idEmpresa
+            db.session.add(_poner(Turno(), empresa_id, entrada, salida, estado))
+        else:
+            _poner(turno, turno.empresa_id, entrada, salida, estado)
+
+    sobrantes = [t.id_turno for t in (*por_entrada.values(), *por_salida.values())]
+    if sobrantes:
+        Turno.query.filter(Turno.id_turno.in_(sobrantes)).delete(synchronize_session="fetch")
+
+
+def reconstruir_turnos_trabajador(trabajador_id, ahora=None):
+    """Borra y vuelve a crear todos los turnos del trabajador desde sus fichajes (sin commit)."""
+    Turno.query.filter(Turno.id_trabajador == trabajador_id).delete(synchronize_session=False)
+    empresa_id = db.session.query(Trabajador.idEmpresa).filter(Trabajador.id_trabajador == trabajador_id).scalar()
+    fichajes = _marcas(trabajador_id).order_by(Fichaje.fecha_hora.asc(), Fichaje.id_fichaje.asc()).all()
+    turnos = emparejar(fichajes, False, ahora)
+    db.session.add_all(_turno(empresa_id, entrada, salida, estado) for entrada, salida, estado in turnos)
+    return len(turnos)
+
+
+def barrer_turnos(ahora=None) -> int:
+    """Pasa a SIN_CIERRE los turnos EN_CURSO que han vencido. Devuelve cuántos (con commit)."""
+    resultado = db.session.execute(
+        update(Turno)
+        .where(Turno.estado == EN_CURSO, Turno.fecha_ref < corte_sin_cierre(ahora))
+        .values(estado=SIN_CIERRE)
+        .execution_options(synchronize_session=False)
+    )
+    db.session.commit()
+    return resultado.rowcount